@@ -0,0 +1,123 @@
+# analytics.py
+"""
+Ticket counts behind the tools server's ticket_stats tool.
+
+TicketStats counts tickets per combination of status, priority,
+department (escalated_to) and customer tier, and remembers the
+combination each ticket is counted under. It watches the ticket and
+customer tables (store.py): a changed ticket moves one count from its old
+combination to its new one, so a write costs O(1), and a query sums the
+combinations - bounded by the distinct values, not by the ticket count.
+
+Tables are read outside the stats lock, since a read may take the
+table's own lock. Each change of a ticket takes a number before reading
+it and is applied only if no later change of that ticket took one since;
+the later one read newer state and applies it, so concurrent writes can't
+leave a ticket counted under an older state.
+"""
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Set, Tuple
+
+DIMENSIONS = ("status", "priority", "department", "tier")
+NONE = "none"  # department of a ticket never escalated; tier of an unknown customer
+
+Combination = Tuple[str, str, str, str]
+
+class TicketStats:
+    """Live ticket counts by status, priority, department and customer tier"""
+
+    def __init__(self, tickets: Any, customers: Any):
+        self.tickets = tickets
+        self.customers = customers
+        self._lock = threading.Lock()  # tools, and so writes, run on worker threads; never held while reading tables
+        self._rebuilding = threading.Lock()  # one rebuild at a time
+        self._counts: Counter = Counter()             # combination -> tickets
+        self._counted: Dict[str, Combination] = {}    # ticket -> the combination it is counted under
+        self._shared: Dict[Combination, Combination] = {}  # one tuple per combination, not one per ticket
+        self._changes = 0
+        self._pending: Dict[str, int] = {}  # ticket -> number of its latest change not yet applied
+        self._touched: Optional[Set[str]] = None  # tickets changed during a rebuild, recounted after it
+        tickets.watch(self.ticket_changed)
+        customers.watch(self.customer_changed)
+        self.rebuild()
+
+    def _combination(self, ticket: Dict[str, Any], tier: Optional[Any] = None) -> Combination:
+        if tier is None:
+            customer = self.customers.get(ticket.get("customer")) if isinstance(ticket.get("customer"), str) else None
+            tier = customer.get("tier") if customer else None
+        combination = (str(ticket.get("status") or NONE), str(ticket.get("priority") or NONE),
+                       str(ticket.get("escalated_to") or NONE), str(tier or NONE))
+        return self._shared.setdefault(combination, combination)
+
+    def rebuild(self):
+        """Count every ticket from scratch (at start, and when a table may have changed wholesale)"""
+        with self._rebuilding:
+            with self._lock:
+                self._touched = set(self._pending)  # in flight, and may have read before our scan
+            tiers: Dict[str, Any] = {}
+            counted: Dict[str, Combination] = {}
+            for ticket_id, ticket in self.tickets.items():
+                customer_id = ticket.get("customer")
+                if customer_id not in tiers:
+                    customer = self.customers.get(customer_id) if isinstance(customer_id, str) else None
+                    tiers[customer_id] = (customer or {}).get("tier") or NONE
+                counted[ticket_id] = self._combination(ticket, tiers[customer_id])
+            with self._lock:
+                self._counted = counted
+                self._counts = Counter(counted.values())
+                touched, self._touched = self._touched, None
+        # The scan may have read these before their latest change; count them again
+        for ticket_id in touched:
+            self.ticket_changed(ticket_id)
+
+    def ticket_changed(self, ticket_id: Optional[str]):
+        if ticket_id is None:
+            self.rebuild()
+            return
+        with self._lock:
+            self._changes += 1
+            change = self._pending[ticket_id] = self._changes
+            if self._touched is not None:
+                self._touched.add(ticket_id)
+        ticket = self.tickets.get(ticket_id)
+        combination = self._combination(ticket) if ticket is not None else None
+        with self._lock:
+            if self._pending.get(ticket_id) != change:
+                return  # a later change read the ticket after us and applies instead
+            del self._pending[ticket_id]
+            old = self._counted.pop(ticket_id, None)
+            if old is not None:
+                self._counts[old] -= 1
+                if not self._counts[old]:
+                    del self._counts[old]
+            if combination is not None:
+                self._counted[ticket_id] = combination
+                self._counts[combination] += 1
+
+    def customer_changed(self, customer_id: Optional[str]):
+        """A tier change moves the customer's tickets, O(their tickets)"""
+        if customer_id is None:
+            self.rebuild()
+            return
+        customer = self.customers.get(customer_id)
+        for ticket_id in (customer or {}).get("tickets", []):
+            self.ticket_changed(ticket_id)
+
+    def query(self, **filters: str) -> Dict[str, Any]:
+        """Tickets matching every non-empty filter (case-insensitive), with a breakdown by each dimension"""
+        wanted = [(i, filters[name].lower()) for i, name in enumerate(DIMENSIONS) if filters.get(name)]
+        with self._lock:
+            counts = list(self._counts.items())
+        total = 0
+        breakdown = {name: Counter() for name in DIMENSIONS}
+        for combination, count in counts:
+            if all(combination[i].lower() == value for i, value in wanted):
+                total += count
+                for name, value in zip(DIMENSIONS, combination):
+                    breakdown[name][value] += count
+        return {
+            "filters": {name: filters[name] for name in DIMENSIONS if filters.get(name)},
+            "total": total,
+            **{f"by_{name}": dict(breakdown[name].most_common()) for name in DIMENSIONS},
+        }
@@ -0,0 +1,106 @@
+# bench_bulk.py
+"""
+Throughput benchmark for bulk.py.
+
+Generates a linked data set (each customer with one order and one ticket),
+imports it into a fresh SQLite store, exports it again as NDJSON and CSV,
+and reports records per second for each step plus the peak RSS.
+
+    python bench_bulk.py --customers 200000
+"""
+import argparse
+import json
+import platform
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, Tuple
+
+import bulk
+from bench_servers import git_revision
+from store import SqliteStore
+
+def dataset(customers: int) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """(table, id, record): customers first, so their orders/tickets links resolve forward"""
+    for i in range(customers):
+        yield "customers", f"cust{i}", {
+            "name": f"Customer {i}", "email": f"customer{i}@example.com",
+            "tier": "premium" if i % 10 == 0 else "standard",
+            "orders": [f"ORD{i}"], "tickets": [f"T{i}"], "phone": "+1-555-0100",
+        }
+    for i in range(customers):
+        yield "orders", f"ORD{i}", {
+            "customer": f"cust{i}", "items": ["Widget A", "Gadget B"], "status": "delivered",
+            "total": round(10 + i % 500 * 0.37, 2), "order_date": "2025-01-15",
+            "tracking_number": f"1Z{i:016d}", "related_tickets": [f"T{i}"],
+        }
+    for i in range(customers):
+        yield "tickets", f"T{i}", {
+            "status": ("pending", "in_progress", "resolved")[i % 3], "issue": "Product defective",
+            "customer": f"cust{i}", "priority": ("low", "medium", "high", "urgent")[i % 4],
+            "order_id": f"ORD{i}", "created_date": "2025-01-20",
+        }
+
+def write_dataset(out: IO[str], customers: int) -> int:
+    """The dataset() as NDJSON; returns the record count"""
+    for table, key, record in dataset(customers):
+        out.write(json.dumps({"_table": table, "_id": key, **record}) + "\n")
+    return 3 * customers
+
+def timed(step, records: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    step()
+    seconds = time.perf_counter() - start
+    return {"seconds": round(seconds, 3), "records_per_s": round(records / seconds)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--customers", type=int, default=100_000, help="Customers (records = 3x)")
+    parser.add_argument("--batch-size", type=int, default=bulk.BATCH_SIZE)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "data.ndjson"
+        with open(source, "w", encoding="utf-8") as out:
+            records = write_dataset(out, args.customers)
+        store = SqliteStore(str(Path(tmp) / "bench.db"))
+
+        steps = {
+            "import_ndjson": timed(lambda: bulk.import_files(store, [str(source)], batch_size=args.batch_size), records),
+        }
+        with open(Path(tmp) / "export.ndjson", "w", encoding="utf-8") as out:
+            steps["export_ndjson"] = timed(lambda: bulk.export_ndjson(store, out), records)
+
+        csv_dir = Path(tmp) / "csv"
+        csv_dir.mkdir()
+
+        def export_csv():
+            for table in bulk.TABLES:
+                with open(csv_dir / f"{table}.csv", "w", encoding="utf-8", newline="") as out:
+                    bulk.export_csv(store, table, out)
+
+        steps["export_csv"] = timed(export_csv, records)
+        # Re-import of the CSV export replaces every record in place
+        csv_files = [str(csv_dir / f"{table}.csv") for table in bulk.TABLES]
+        steps["import_csv"] = timed(lambda: bulk.import_files(store, csv_files, batch_size=args.batch_size), records)
+
+    report = {
+        "benchmark": "bulk",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {"customers": args.customers, "records": records, "batch_size": args.batch_size},
+        "steps": steps,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
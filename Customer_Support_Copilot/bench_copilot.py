@@ -0,0 +1,176 @@
+# bench_copilot.py
+"""
+End-to-end copilot benchmark with a local scripted model.
+
+Replays scripted conversations through the real agent graph, tool wrappers
+and MCP servers (started locally). The scripted model answers instantly, or
+after --llm-latency-ms, and its time is subtracted so the report shows only
+the copilot's own per-turn overhead.
+
+    python bench_copilot.py --copilot client --repeat 20 --output copilot_bench.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench_servers import git_revision, latency_summary, start_server
+from history import SessionStore
+from models import ScriptedChatModel
+
+# ---------- Scripted conversations ----------
+# Each turn: the user message plus the steps the scripted model will emit for it
+
+COMMON_CONVERSATIONS: Dict[str, List[Dict[str, Any]]] = {
+    "ticket_followup": [
+        {"user": "What's going on with ticket 123?", "model": [
+            {"tool": "get_ticket_status", "args": {"ticket_id": "123"}},
+            {"text": "Ticket 123 is in progress: Widget A from order ORD001 is defective."},
+        ]},
+        {"user": "Who is the customer on that one?", "model": [
+            {"tool": "get_customer_details", "args": {"customer_id": "john_doe"}},
+            {"text": "That's John Doe, a premium customer."},
+        ]},
+        {"user": "Please escalate it to hardware support", "model": [
+            {"tool": "escalate_ticket", "args": {"ticket_id": "123", "department": "hardware", "notes": "Defective unit"}},
+            {"text": "Done - ticket 123 is escalated to hardware support."},
+        ]},
+    ],
+    "order_return": [
+        {"user": "Can you pull up order ORD003?", "model": [
+            {"tool": "get_order_info", "args": {"order_id": "ORD003"}},
+            {"text": "Order ORD003 (Device Y, Cable Z) was delivered on 2025-01-22."},
+        ]},
+        {"user": "Start a return for it, wrong item received", "model": [
+            {"tool": "initiate_return", "args": {"reference_id": "ORD003", "reason": "Wrong item received"}},
+            {"text": "Return RET_ORD003 has been started."},
+        ]},
+        {"user": "Thanks!", "model": [
+            {"text": "You're welcome!"},
+        ]},
+    ],
+}
+
+# Policy and prompt tools differ between the two copilots
+POLICY_TURNS = {
+    "copilot": [
+        {"user": "How long does delivery usually take?", "model": [
+            {"tool": "get_policy", "args": {"policy_type": "shipping_policy"}},
+            {"text": "Standard shipping takes a few business days."},
+        ]},
+    ],
+    "client": [
+        {"user": "How long does delivery usually take?", "model": [
+            {"tool": "get_customer_details", "args": {"customer_id": "jane_smith"}},
+            {"tool": "explain_policy", "args": {"policy_type": "shipping"}},
+            {"text": "Hi Jane, standard shipping takes a few business days."},
+        ]},
+        {"user": "Say hi to the customer", "model": [
+            {"tool": "smart_greeting", "args": {"issue_type": "shipping"}},
+            {"text": "Hi Jane! How can I help with your shipping question?"},
+        ]},
+    ],
+}
+
+def conversations_for(copilot_name: str) -> Dict[str, List[Dict[str, Any]]]:
+    conversations = dict(COMMON_CONVERSATIONS)
+    conversations["policy"] = POLICY_TURNS[copilot_name]
+    return conversations
+
+# ---------- Replay ----------
+
+def reset_copilot_state(copilot):
+    """Fresh memory and history so every repetition starts from the same state"""
+    copilot.memory = type(copilot.memory)()
+    copilot.sessions = SessionStore(window_turns=copilot.HISTORY_TURNS)
+
+async def replay(copilot, agent, model: ScriptedChatModel, name: str,
+                 turns: List[Dict[str, Any]], results: Dict[str, List[Dict[str, float]]]):
+    reset_copilot_state(copilot)
+    model.load([step for turn in turns for step in turn["model"]])
+    for index, turn in enumerate(turns):
+        model_before = model.model_seconds
+        start = time.perf_counter()
+        await copilot.process_query(agent, turn["user"])
+        wall = time.perf_counter() - start
+        llm = model.model_seconds - model_before
+        results.setdefault(f"{name}[{index}]", []).append({
+            "wall": wall, "llm": llm, "overhead": wall - llm,
+            "tool_calls": sum(1 for step in turn["model"] if "tool" in step),
+        })
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Any]:
+    return {
+        "tool_calls": samples[0]["tool_calls"],
+        "overhead": latency_summary([s["overhead"] for s in samples]),
+        "wall": latency_summary([s["wall"] for s in samples]),
+        "llm_mean_ms": round(sum(s["llm"] for s in samples) / len(samples) * 1000, 3),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--copilot", choices=["copilot", "client"], default="copilot",
+                        help="Which copilot module to drive")
+    parser.add_argument("--repeat", type=int, default=10, help="Replays of every conversation")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured replays first")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0,
+                        help="Simulated model latency per call (excluded from overhead)")
+    parser.add_argument("--transport", choices=["http", "gateway", "inprocess"], default="http",
+                        help="Separate servers, one gateway.py session, or in-process servers (COPILOT_MCP_TRANSPORT)")
+    parser.add_argument("--no-start", action="store_true", help="Use servers that are already running")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    os.environ["COPILOT_MCP_TRANSPORT"] = args.transport
+    server_names = {"http": ("tools", "resources", "prompts"), "gateway": ("gateway",), "inprocess": ()}[args.transport]
+    procs = [] if args.no_start else [start_server(name) for name in server_names]
+    try:
+        copilot = importlib.import_module(args.copilot)
+        model = ScriptedChatModel(latency_s=args.llm_latency_ms / 1000)
+        agent = copilot.create_agent(llm=model)
+        conversations = conversations_for(args.copilot)
+
+        for _ in range(args.warmup):
+            for name, turns in conversations.items():
+                await replay(copilot, agent, model, name, turns, {})
+
+        results: Dict[str, List[Dict[str, float]]] = {}
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for name, turns in conversations.items():
+                await replay(copilot, agent, model, name, turns, results)
+        elapsed = time.perf_counter() - start
+        await copilot.connections.aclose()
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    all_samples = [s for samples in results.values() for s in samples]
+    report = {
+        "benchmark": "copilot",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: getattr(args, k) for k in ("copilot", "transport", "repeat", "warmup", "llm_latency_ms")},
+        "turns": len(all_samples),
+        "elapsed_s": round(elapsed, 4),
+        "overhead": latency_summary([s["overhead"] for s in all_samples]),
+        "overhead_per_tool_call_ms": round(
+            sum(s["overhead"] for s in all_samples) * 1000 / max(1, sum(s["tool_calls"] for s in all_samples)), 3),
+        "per_turn": {turn: summarize(samples) for turn, samples in results.items()},
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    asyncio.run(main())
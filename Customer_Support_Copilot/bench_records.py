@@ -0,0 +1,96 @@
+# bench_records.py
+"""
+Memory and lookup benchmark for the in-memory record layouts of store.py.
+
+Loads bench_bulk's linked data set into dict tables (TOOLS_STORE=memory)
+and into CompactTables (TOOLS_STORE=compact), then reports the bytes held
+per record (tracemalloc), the time of random lookups, and whether every
+record serializes to the same JSON in both layouts.
+
+    python bench_records.py --customers 200000
+"""
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from bench_bulk import dataset
+from bench_servers import git_revision
+from store import CompactTable, MemoryTable
+
+LAYOUTS = {"memory": MemoryTable, "compact": CompactTable}
+
+def load(layout: Callable[[], Any], lines: List[str]) -> Dict[str, Any]:
+    """Tables of the records in `lines`, parsed one at a time as bulk.py does"""
+    tables: Dict[str, Any] = {}
+    for line in lines:
+        record = json.loads(line)
+        tbl, key = record.pop("_table"), record.pop("_id")
+        if tbl not in tables:
+            tables[tbl] = layout()
+        tables[tbl][key] = record
+    return tables
+
+def ns_per_op(op: Callable[[str], Any], keys: List[str]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        op(key)
+    return round((time.perf_counter() - start) / len(keys) * 1e9)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--customers", type=int, default=100_000, help="Customers (records = 3x)")
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # JSON text, so each layout parses its own strings like a real load instead of sharing literals
+    lines = [json.dumps({"_table": tbl, "_id": key, **record}) for tbl, key, record in dataset(args.customers)]
+    rng = random.Random(0)
+    ticket_ids = [f"T{rng.randrange(args.customers)}" for _ in range(args.lookups)]
+
+    layouts: Dict[str, Dict[str, Any]] = {}
+    results = {}
+    for name, layout in LAYOUTS.items():
+        tracemalloc.start()
+        tables = layouts[name] = load(layout, lines)
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tickets = tables["tickets"]
+        results[name] = {
+            "mb": round(held / 2**20, 1),
+            "bytes_per_record": round(held / len(lines)),
+            "lookup_ns": {
+                "record": ns_per_op(lambda key: tickets[key], ticket_ids),
+                "field": ns_per_op(lambda key: tickets[key]["status"], ticket_ids),
+                "contains": ns_per_op(lambda key: key in tickets, ticket_ids),
+                "json": ns_per_op(lambda key: json.dumps(tickets[key], indent=2), ticket_ids),
+            },
+        }
+
+    memory, compact = layouts["memory"], layouts["compact"]
+    identical = all(list(compact[tbl]) == list(memory[tbl]) and
+                    all(json.dumps(record) == json.dumps(memory[tbl][key]) for key, record in compact[tbl].items())
+                    for tbl in memory)
+    report = {
+        "benchmark": "records",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {"customers": args.customers, "records": len(lines), "lookups": args.lookups},
+        "layouts": results,
+        "memory_saved": round(1 - results["compact"]["mb"] / results["memory"]["mb"], 3),
+        "identical_json": identical,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
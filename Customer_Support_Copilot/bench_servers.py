@@ -0,0 +1,256 @@
+# bench_servers.py
+"""
+Load-testing benchmark for the tools (8001), resources (8002) and prompts (8003) servers.
+
+Starts each server locally, drives N concurrent MCP clients with a realistic
+call mix and prints throughput plus p50/p95/p99 latency as JSON, so results
+can be diffed between commits.
+
+    python bench_servers.py --concurrency 16 --requests 2000 --output bench.json
+    python bench_servers.py --servers tools --session-per-call   # include handshake cost
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from sharding import wait_for_port
+
+HERE = Path(__file__).parent
+
+# name -> (script, port)
+SERVERS = {
+    "tools": ("tools.py", 8001),
+    "resources": ("resources.py", 8002),
+    "prompts": ("prompts.py", 8003),
+    "gateway": ("gateway.py", 8000),  # all three mounted in one process
+    "sharded": ("shard_router.py", 8001),  # tools API routed over TOOLS_SHARDS local shards
+}
+
+# Roughly the size of a real policy document from policies.db
+POLICY_TEXT = "Return Policy\n-------------\n\n" + "Items can be returned within 30 days of delivery. " * 20
+
+# ---------- Call mixes ----------
+# Each entry: (weight, operation name, coroutine factory taking (session, rng))
+
+Call = Tuple[int, str, Callable[[ClientSession, random.Random], Any]]
+
+TICKET_IDS = ["123", "456", "789"]
+ORDER_IDS = ["ORD001", "ORD002", "ORD003"]
+CUSTOMER_IDS = ["john_doe", "jane_smith", "bob_wilson"]
+CUSTOMER_NAMES = ["John Doe", "Jane Smith", "Bob", "Wilson"]
+POLICIES = ["shipping_policy", "return_policy", "refund_policy", "warranty_policy"]
+
+TOOLS_MIX: List[Call] = [
+    (40, "get_ticket_status", lambda s, r: s.call_tool("get_ticket_status", {"ticket_id": r.choice(TICKET_IDS)})),
+    (25, "get_order_info", lambda s, r: s.call_tool("get_order_info", {"order_id": r.choice(ORDER_IDS)})),
+    (15, "get_customer_details", lambda s, r: s.call_tool("get_customer_details", {"customer_id": r.choice(CUSTOMER_IDS)})),
+    (10, "search_by_customer", lambda s, r: s.call_tool("search_by_customer", {"customer_name": r.choice(CUSTOMER_NAMES)})),
+    (5, "escalate_ticket", lambda s, r: s.call_tool("escalate_ticket", {
+        "ticket_id": r.choice(TICKET_IDS), "department": "tier2", "notes": "load test"})),
+    (5, "initiate_return", lambda s, r: s.call_tool("initiate_return", {
+        "reference_id": r.choice(ORDER_IDS), "reason": "load test"})),
+]
+
+RESOURCES_MIX: List[Call] = [
+    (90, "read_policy", lambda s, r: s.read_resource(f"policy://{r.choice(POLICIES)}")),
+    (10, "list_all", lambda s, r: s.read_resource("policy://list_all")),
+]
+
+PROMPTS_MIX: List[Call] = [
+    (60, "policy_explanation", lambda s, r: s.get_prompt("policy_explanation", {
+        "policy_content": POLICY_TEXT,
+        "customer_situation": f"Customer: {r.choice(CUSTOMER_NAMES)} (premium tier) | Recent order {r.choice(ORDER_IDS)}: Widget A",
+    })),
+    (20, "smart_greeting", lambda s, r: s.get_prompt("smart_greeting", {
+        "customer_name": r.choice(CUSTOMER_NAMES), "customer_tier": "premium"})),
+    (20, "contextual_response", lambda s, r: s.get_prompt("contextual_response", {
+        "query": "Where is my order?", "order_data": r.choice(ORDER_IDS)})),
+]
+
+MIXES = {"tools": TOOLS_MIX, "resources": RESOURCES_MIX, "prompts": PROMPTS_MIX, "sharded": TOOLS_MIX}
+
+# ---------- Stats ----------
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def latency_summary(latencies: List[float]) -> Dict[str, Any]:
+    values = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else None,
+    }
+
+@dataclass
+class Recorder:
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, op: str, seconds: float, ok: bool):
+        self.latencies.setdefault(op, []).append(seconds)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+# ---------- Server processes ----------
+
+def start_server(name: str) -> subprocess.Popen:
+    script, port = SERVERS[name]
+    proc = subprocess.Popen(
+        [sys.executable, str(HERE / script)], cwd=HERE,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return proc
+
+# ---------- Load generation ----------
+
+async def _timed(op: str, coro, recorder: Recorder):
+    start = time.perf_counter()
+    ok = True
+    try:
+        result = await coro
+        ok = not getattr(result, "isError", False)
+    except Exception:
+        ok = False
+    recorder.record(op, time.perf_counter() - start, ok)
+
+async def _worker(url: str, mix: List[Call], remaining: List[int], recorder: Recorder,
+                  rng: random.Random, session_per_call: bool):
+    weights = [w for w, _, _ in mix]
+
+    def next_call():
+        if remaining[0] <= 0:
+            return None
+        remaining[0] -= 1
+        return rng.choices(mix, weights=weights)[0]
+
+    if session_per_call:
+        # What copilot.py does today: connect + initialize for every call
+        while (call := next_call()) is not None:
+            _, op, make = call
+
+            async def one_shot():
+                async with streamablehttp_client(url) as (read, write, _sid):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        return await make(session, rng)
+            await _timed(op, one_shot(), recorder)
+        return
+
+    async with streamablehttp_client(url) as (read, write, _sid):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            while (call := next_call()) is not None:
+                _, op, make = call
+                await _timed(op, make(session, rng), recorder)
+
+async def run_load(name: str, concurrency: int, requests: int, warmup: int,
+                   seed: int, session_per_call: bool) -> Dict[str, Any]:
+    url = f"http://127.0.0.1:{SERVERS[name][1]}/mcp"
+    mix = MIXES[name]
+
+    if warmup:
+        await asyncio.gather(*(
+            _worker(url, mix, [warmup // concurrency or 1], Recorder(), random.Random(seed + i), session_per_call)
+            for i in range(concurrency)
+        ))
+
+    recorder = Recorder()
+    remaining = [requests]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(url, mix, remaining, recorder, random.Random(seed + i), session_per_call)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    total_errors = sum(recorder.errors.values())
+    return {
+        "server": name,
+        "url": url,
+        "requests": len(all_latencies),
+        "errors": total_errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else None,
+        "latency": latency_summary(all_latencies),
+        "operations": {
+            op: {**latency_summary(values), "errors": recorder.errors.get(op, 0)}
+            for op, values in sorted(recorder.latencies.items())
+        },
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--servers", default="tools,resources,prompts",
+                        help="Comma-separated subset of: tools, resources, prompts, sharded")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent MCP clients per server")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests per server")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured warm-up requests per server")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--session-per-call", action="store_true",
+                        help="Open a new session for every call (the copilot's current behaviour)")
+    parser.add_argument("--no-start", action="store_true", help="Use servers that are already running")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.servers.split(",") if n.strip()]
+    unknown = [n for n in names if n not in MIXES]
+    if unknown:
+        parser.error(f"unknown server(s): {', '.join(unknown)}")
+
+    report = {
+        "benchmark": "servers",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: getattr(args, k) for k in ("concurrency", "requests", "warmup", "seed", "session_per_call")},
+        "results": [],
+    }
+
+    for name in names:
+        proc = None if args.no_start else start_server(name)
+        try:
+            report["results"].append(await run_load(
+                name, args.concurrency, args.requests, args.warmup, args.seed, args.session_per_call))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+# bench_startup.py
+"""
+Cold-start benchmark for the copilot.
+
+Launches fresh interpreters that import the copilot module and build its
+agent, and reports wall-clock times plus the heaviest imports from a
+`python -X importtime` run. With --budget-ms the run fails when the median
+time-to-ready exceeds the budget, so it can guard against regressions.
+
+    python bench_startup.py --copilot client --runs 10 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench_servers import HERE, git_revision, latency_summary
+
+# Runs in the child interpreter; prints one JSON line of phase timings
+CHILD = """
+import json, time
+start = time.perf_counter()
+import {module} as copilot
+imported = time.perf_counter()
+copilot.create_agent()
+ready = time.perf_counter()
+print(json.dumps({{"import": imported - start, "agent": ready - imported, "ready": ready - start}}))
+"""
+
+def run_child(module: str, env: Dict[str, str], importtime: bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD.format(module=module)]
+    return subprocess.run(args, cwd=HERE, env=env, capture_output=True, text=True, check=True)
+
+def parse_importtime(stderr: str, module: str, top: int) -> Dict[str, Any]:
+    """Direct imports of `module` and the slowest individual modules, by cumulative/self time"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+
+    # importtime lists each module after its children, which sit one level deeper
+    root_index = next((i for i, r in enumerate(rows) if r[0] == module and r[1] == 0), None)
+    root = rows[root_index] if root_index is not None else None
+    direct = []
+    for r in reversed(rows[:root_index or 0]):
+        if r[1] == 0:
+            break
+        if r[1] == 1:
+            direct.append(r)
+    ms = lambda us: round(us / 1000, 3)
+    return {
+        "total_ms": ms(root[3]) if root else None,
+        "direct_imports": [{"module": n, "cumulative_ms": ms(c)}
+                           for n, _, _, c in sorted(direct, key=lambda r: -r[3])[:top]],
+        "slowest_self": [{"module": n, "self_ms": ms(s)}
+                         for n, _, s, _ in sorted(rows, key=lambda r: -r[2])[:top]],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--copilot", choices=["copilot", "client"], default="copilot",
+                        help="Which copilot module to start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--provider", default="scripted",
+                        help="COPILOT_MODEL_PROVIDER for the child (scripted needs no API key)")
+    parser.add_argument("--top", type=int, default=10, help="Modules to list from the importtime run")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median time-to-ready exceeds this")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    env = {**os.environ, "COPILOT_MODEL_PROVIDER": args.provider}
+    phases: Dict[str, List[float]] = {"import": [], "agent": [], "ready": [], "process": []}
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        proc = run_child(args.copilot, env)
+        phases["process"].append(time.perf_counter() - start)
+        for phase, seconds in json.loads(proc.stdout.strip().splitlines()[-1]).items():
+            phases[phase].append(seconds)
+
+    breakdown = parse_importtime(run_child(args.copilot, env, importtime=True).stderr, args.copilot, args.top)
+
+    report = {
+        "benchmark": "startup",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: getattr(args, k) for k in ("copilot", "runs", "provider", "budget_ms")},
+        "phases": {phase: latency_summary(values) for phase, values in phases.items()},
+        "importtime": breakdown,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+    if args.budget_ms is not None and report["phases"]["ready"]["p50_ms"] > args.budget_ms:
+        sys.exit(f"startup regression: median time-to-ready {report['phases']['ready']['p50_ms']} ms "
+                 f"exceeds budget {args.budget_ms} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# budget.py
+"""
+Per-turn time budget for the copilots.
+
+A turn gets COPILOT_TURN_BUDGET seconds (default 60). The deadline is kept
+in a context variable, so every agent step and MCP call made for the turn
+sees it without it being threaded through LangGraph: MCP calls never wait
+past it (resilience.py), and the agent run itself is cancelled when it
+passes - which cancels the model call or MCP requests still in flight.
+The turn then ends with the answer so far, or a fallback message.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Optional, TypeVar
+
+TURN_BUDGET_S = float(os.getenv("COPILOT_TURN_BUDGET", "60"))
+
+# Longest tool result quoted in a fallback answer
+FALLBACK_RESULT_CHARS = 1500
+
+T = TypeVar("T")
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("turn_deadline", default=None)
+
+class BudgetExceeded(Exception):
+    """The turn's time budget ran out"""
+
+@contextmanager
+def turn(seconds: float = TURN_BUDGET_S) -> Iterator[float]:
+    """Give the code inside (one turn) `seconds`; a budget already set outside is never extended"""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield _deadline.get()
+    finally:
+        _deadline.reset(token)
+
+def deadline() -> Optional[float]:
+    """time.monotonic() at which the current turn's budget runs out, or None outside a turn"""
+    return _deadline.get()
+
+def remaining() -> Optional[float]:
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+async def within(events: AsyncIterator[T], deadline: Optional[float]) -> AsyncIterator[T]:
+    """Yield from `events` until it ends or `deadline` passes; then cancel it and raise BudgetExceeded.
+
+    `events` is consumed by a single task, so it keeps one context throughout
+    and cancelling that task stops everything it was waiting on.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def produce():
+        try:
+            async for item in events:
+                queue.put_nowait((item, None))
+            queue.put_nowait((end, None))
+        except Exception as e:
+            queue.put_nowait((end, e))
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                item, error = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                raise BudgetExceeded() from None
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+def fallback_answer(partial: str, tool_results: List[str]) -> str:
+    """The turn's answer when its budget ran out: the answer so far, else the lookups made, else an apology"""
+    if partial.strip():
+        return partial + "\n\n(I ran out of time before finishing this answer.)"
+    if tool_results:
+        found = "\n\n".join(r if len(r) <= FALLBACK_RESULT_CHARS else r[:FALLBACK_RESULT_CHARS] + " ..."
+                            for r in tool_results)
+        return f"Sorry, I ran out of time before I could finish. Here is what I found so far:\n\n{found}"
+    return "Sorry, I couldn't answer in time. Please try again in a moment."
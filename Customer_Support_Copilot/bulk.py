@@ -0,0 +1,389 @@
+# bulk.py
+"""
+Streaming bulk import/export of the tools server's tickets, orders and customers.
+
+    python bulk.py import crm.ndjson                      # into TOOLS_DB (default tools.db)
+    python bulk.py import tickets.csv orders.csv customers.csv
+    python bulk.py export backup.ndjson
+    python bulk.py export backup/ --format csv            # backup/tickets.csv, orders.csv, customers.csv
+
+NDJSON has one record per line, with its table and id under "_table" and
+"_id" ("_table" may be left out when --table is given). A CSV file holds
+one table (--table, or the file name: tickets.csv) with an "_id" column;
+list fields (items, orders, ...) are JSON arrays in their cells.
+
+Files are read line by line and written in batches of --batch-size rows,
+so memory does not grow with the size of the records; only ids are kept,
+to check the links between tables (a ticket's order_id and customer, an
+order's related_tickets, a customer's orders and tickets). Links may point
+forward to records later in the input, or to records already stored. An
+import is one transaction: with invalid records or dangling links nothing
+is written, unless --lenient.
+
+TOOLS_DATA=a.ndjson,b.csv makes tools.py load these files instead of its
+sample records (load_tables).
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from store import CHANGE_LOG_SIZE, SqliteStore
+
+TABLES = ("tickets", "orders", "customers")
+
+# Fields the tools read unconditionally
+REQUIRED = {
+    "tickets": ("status", "issue", "customer", "priority", "created_date"),
+    "orders": ("customer", "items", "status", "total", "order_date"),
+    "customers": ("name", "email", "tier"),
+}
+LIST_FIELDS = {"items", "related_tickets", "orders", "tickets"}
+NUMBER_FIELDS = {"total"}
+
+# table -> (field, table it points into, whether the field holds a list of ids)
+LINKS = {
+    "tickets": (("customer", "customers", False), ("order_id", "orders", False)),
+    "orders": (("customer", "customers", False), ("related_tickets", "tickets", True)),
+    "customers": (("orders", "orders", True), ("tickets", "tickets", True)),
+}
+
+BATCH_SIZE = 5000
+MAX_PROBLEMS = 20  # problems listed in a report; all of them are counted
+
+# (table, id, record, the record as stored JSON text when the reader already has it)
+Row = Tuple[str, str, Dict[str, Any], Optional[str]]
+
+class BulkImportError(Exception):
+    """An import found invalid records or dangling links and wrote nothing"""
+
+    def __init__(self, report: "ImportReport"):
+        self.report = report
+        super().__init__(f"{report.rejected} invalid record(s), {report.dangling} dangling link(s)")
+
+@dataclass
+class ImportReport:
+    imported: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(TABLES, 0))
+    rejected: int = 0
+    dangling: int = 0
+    problems: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def reject(self, where: str, reason: str):
+        self.rejected += 1
+        self._note(f"{where}: {reason}")
+
+    def dangle(self, referrer: str, target: str, key: str):
+        self.dangling += 1
+        self._note(f"{referrer} -> missing {target} {key!r}")
+
+    def _note(self, problem: str):
+        if len(self.problems) < MAX_PROBLEMS:
+            self.problems.append(problem)
+
+    def as_dict(self) -> Dict[str, Any]:
+        records = sum(self.imported.values())
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "dangling_links": self.dangling,
+            "problems": self.problems,
+            "seconds": round(self.seconds, 3),
+            "records_per_s": round(records / self.seconds) if self.seconds else None,
+        }
+
+# ---------- Reading ----------
+
+def _table_for(path: str, table: Optional[str]) -> Optional[str]:
+    if table:
+        return table
+    stem = Path(path).stem
+    return stem if stem in TABLES else None
+
+def _open(path: str) -> IO[str]:
+    return sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+
+_PLAIN_ID = re.compile(r"[\w .:@/+-]*", re.ASCII)  # ids json.dumps leaves as they are
+
+def _quoted(key: Any) -> Optional[str]:
+    if type(key) is str and _PLAIN_ID.fullmatch(key):
+        return f'"{key}"'
+    try:
+        return json.dumps(key)
+    except TypeError:
+        return None
+
+def read_ndjson(path: str, report: ImportReport, table: Optional[str] = None) -> Iterator[Row]:
+    loads = json.loads
+    table_heads: Dict[Any, Optional[str]] = {}
+    with _open(path) as lines:
+        for number, line in enumerate(lines, 1):
+            try:
+                record = loads(line)
+                has_table = "_table" in record
+                tbl = record.pop("_table", table)
+                key = record.pop("_id")
+            except (ValueError, KeyError, AttributeError, TypeError):
+                if line.strip():
+                    report.reject(f"{path}:{number}", "not a JSON object with an _id")
+                continue
+            # Lines as export_ndjson writes them carry the stored JSON after the _table/_id head
+            if not has_table:
+                table_head = "{"
+            elif tbl in table_heads:
+                table_head = table_heads[tbl]
+            else:
+                quoted = _quoted(tbl)
+                table_head = table_heads[tbl] = quoted and f'{{"_table": {quoted}, '
+            quoted_key = _quoted(key)
+            raw = None
+            if table_head and quoted_key:
+                head = f'{table_head}"_id": {quoted_key}, '
+                if line.startswith(head):
+                    rest = line[len(head):]
+                    if '"_id"' not in rest and '"_table"' not in rest:
+                        raw = "{" + rest.rstrip()
+            yield tbl, key, record, raw
+
+def _cell(column: str, text: str) -> Any:
+    if column in LIST_FIELDS:
+        return json.loads(text)
+    if column in NUMBER_FIELDS:
+        return float(text) if any(c in text for c in ".eE") else int(text)
+    return text
+
+def read_csv(path: str, report: ImportReport, table: Optional[str] = None) -> Iterator[Row]:
+    tbl = _table_for(path, table)
+    with _open(path) as lines:
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if not header or "_id" not in header:
+            report.reject(path, "CSV header has no _id column")
+            return
+        id_index = header.index("_id")
+        columns = [(i, name) for i, name in enumerate(header) if i != id_index]
+        for number, cells in enumerate(reader, 2):
+            if len(cells) != len(header):
+                report.reject(f"{path}:{number}", f"{len(cells)} cells for {len(header)} columns")
+                continue
+            try:
+                record = {name: _cell(name, cells[i]) for i, name in columns if cells[i] != ""}
+            except ValueError as e:
+                report.reject(f"{path}:{number}", f"bad value: {e}")
+                continue
+            yield tbl, cells[id_index], record, None
+
+def read_file(path: str, report: ImportReport, table: Optional[str] = None) -> Iterator[Row]:
+    """Rows of an NDJSON (.ndjson/.jsonl, or stdin as "-") or CSV file"""
+    if path.endswith(".csv"):
+        return read_csv(path, report, table)
+    return read_ndjson(path, report, table)
+
+# ---------- Validation ----------
+
+_REQUIRED_KEYS = {table: frozenset(fields) for table, fields in REQUIRED.items()}
+_ID_FIELDS = {table: tuple(name for name, _, many in links if not many) for table, links in LINKS.items()}
+
+def invalid(table: Any, key: Any, record: Dict[str, Any]) -> Optional[str]:
+    """Why a record can't be stored, or None"""
+    if table not in TABLES:
+        return f"unknown table {table!r}"
+    if type(key) is not str or not key:
+        return "_id must be a non-empty string"
+    if not _REQUIRED_KEYS[table] <= record.keys():
+        return f"missing {', '.join(name for name in REQUIRED[table] if name not in record)}"
+    for name in LIST_FIELDS:
+        value = record.get(name)
+        if value is not None and (type(value) is not list or any(type(v) is not str for v in value)):
+            return f"{name} must be a list of strings"
+    for name in _ID_FIELDS[table]:
+        value = record.get(name)
+        if value is not None and type(value) is not str:
+            return f"{name} must be a string id"
+    for name in NUMBER_FIELDS:
+        value = record.get(name)
+        if value is not None and type(value) not in (int, float):
+            return f"{name} must be a number"
+    return None
+
+class LinkChecker:
+    """Ids seen so far and links to ids not seen (yet); keeps ids only, never records"""
+
+    def __init__(self):
+        self.seen: Dict[str, Set[str]] = {table: set() for table in TABLES}
+        self.pending: Dict[Tuple[str, str], str] = {}  # (table, id) -> first record linking to it
+
+    def add(self, table: str, key: str, record: Dict[str, Any]):
+        seen, pending = self.seen, self.pending
+        seen[table].add(key)
+        if pending:
+            pending.pop((table, key), None)
+        for name, target, many in LINKS[table]:
+            value = record.get(name)
+            if value is None:
+                continue
+            ids = seen[target]
+            for ref in value if many else (value,):
+                if ref not in ids and (target, ref) not in pending:
+                    pending[(target, ref)] = f"{table}/{key}.{name}"
+
+    def unresolved(self, existing: Callable[[str, Iterable[str]], Set[str]]) -> Iterator[Tuple[str, str, str]]:
+        """(referrer, table, id) of links to ids neither in the input nor already `existing`"""
+        for table in TABLES:
+            refs = [ref for target, ref in self.pending if target == table]
+            stored = existing(table, refs) if refs else set()
+            for ref in refs:
+                if ref not in stored:
+                    yield self.pending[(table, ref)], table, ref
+
+def _ingest(paths: Iterable[str], table: Optional[str], report: ImportReport,
+            sink: Callable[[str, str, Dict[str, Any], Optional[str]], None]) -> LinkChecker:
+    links = LinkChecker()
+    for path in paths:
+        for tbl, key, record, raw in read_file(path, report, table):
+            problem = invalid(tbl, key, record)
+            if problem:
+                report.reject(f"{path}: {tbl}/{key}", problem)
+                continue
+            links.add(tbl, key, record)
+            sink(tbl, key, record, raw)
+    return links
+
+# ---------- Import ----------
+
+def import_files(store: SqliteStore, paths: Iterable[str], table: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE, lenient: bool = False) -> ImportReport:
+    """Insert or replace every record of `paths` in one transaction; BulkImportError (nothing written) on problems"""
+    report = ImportReport()
+    start = time.perf_counter()
+    batches: Dict[str, List[Tuple[str, str]]] = {tbl: [] for tbl in TABLES}
+    logged = True  # whether every key so far went to the change log
+
+    def flush(tbl: str):
+        nonlocal logged
+        # Past the change log's size a per-key log is pruned right away; make workers reload instead
+        logged = logged and sum(report.imported.values()) + len(batches[tbl]) <= CHANGE_LOG_SIZE
+        store.put_many(tbl, batches[tbl], log=logged)
+        report.imported[tbl] += len(batches[tbl])
+        batches[tbl] = []
+
+    def sink(tbl: str, key: str, record: Dict[str, Any], raw: Optional[str]):
+        batch = batches[tbl]
+        batch.append((key, raw or json.dumps(record)))
+        if len(batch) >= batch_size:
+            flush(tbl)
+
+    with store.transaction():
+        links = _ingest(paths, table, report, sink)
+        for tbl in TABLES:
+            flush(tbl)
+        for referrer, target, ref in links.unresolved(store.existing_keys):
+            report.dangle(referrer, target, ref)
+        report.seconds = time.perf_counter() - start
+        if (report.rejected or report.dangling) and not lenient:
+            raise BulkImportError(report)
+        if logged:
+            store.prune_changes()
+        else:
+            store.invalidate_all()
+    return report
+
+def load_tables(paths: Iterable[str], table: Optional[str] = None,
+                factory: Callable[[], Any] = dict) -> Tuple[Any, ...]:
+    """(tickets, orders, customers) read from `paths` into factory() tables (dicts), validated like an import"""
+    report = ImportReport()
+    tables = {tbl: factory() for tbl in TABLES}
+
+    def sink(tbl: str, key: str, record: Dict[str, Any], raw: Optional[str]):
+        tables[tbl][key] = record
+        report.imported[tbl] += 1
+
+    links = _ingest(paths, table, report, sink)
+    for referrer, target, ref in links.unresolved(lambda tbl, keys: set()):
+        report.dangle(referrer, target, ref)
+    if report.rejected or report.dangling:
+        raise BulkImportError(report)
+    return tables["tickets"], tables["orders"], tables["customers"]
+
+# ---------- Export ----------
+
+def export_ndjson(store: SqliteStore, out: IO[str], tables: Iterable[str] = TABLES) -> Dict[str, int]:
+    """Write every record as one NDJSON line; the stored JSON is spliced in, not re-encoded"""
+    counts = {}
+    for tbl in tables:
+        counts[tbl] = 0
+        table_json = json.dumps(tbl)
+        for key, data in store.scan(tbl):
+            head = f'{{"_table": {table_json}, "_id": {json.dumps(key)}'
+            out.write(f"{head}}}\n" if data == "{}" else f"{head}, {data[1:]}\n")
+            counts[tbl] += 1
+    return counts
+
+def _csv_value(value: Any) -> str:
+    return json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+def export_csv(store: SqliteStore, tbl: str, out: IO[str]) -> int:
+    """Write one table as CSV; a first pass over the table collects its columns, in first-seen order"""
+    names: Dict[str, None] = {}
+    for _, data in store.scan(tbl):
+        names.update(dict.fromkeys(json.loads(data)))
+    columns = ["_id", *names]
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    count = 0
+    for key, data in store.scan(tbl):
+        record = json.loads(data)
+        writer.writerow([key] + [_csv_value(record[name]) if name in record else "" for name in columns[1:]])
+        count += 1
+    return count
+
+# ---------- CLI ----------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("paths", nargs="+", help="Files to import, or the file (NDJSON) / directory (CSV) to export to")
+    parser.add_argument("--db", default=os.getenv("TOOLS_DB", str(Path(__file__).parent / "tools.db")),
+                        help="SQLite store of the tools server (TOOLS_DB)")
+    parser.add_argument("--table", choices=TABLES, help="Table of every record in the input / the only one to export")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="Export format")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--lenient", action="store_true",
+                        help="Import despite invalid records (skipped) or dangling links")
+    args = parser.parse_args()
+
+    store = SqliteStore(args.db)
+    tables = [args.table] if args.table else list(TABLES)
+    if args.command == "import":
+        try:
+            report = import_files(store, args.paths, args.table, args.batch_size, args.lenient)
+        except BulkImportError as e:
+            print(json.dumps({"error": str(e), **e.report.as_dict()}, indent=2))
+            sys.exit(1)
+        print(json.dumps(report.as_dict(), indent=2))
+        return
+
+    start = time.perf_counter()
+    target = args.paths[0]
+    if args.format == "ndjson":
+        with (sys.stdout if target == "-" else open(target, "w", encoding="utf-8")) as out:
+            counts = export_ndjson(store, out, tables)
+    else:
+        os.makedirs(target, exist_ok=True)
+        counts = {}
+        for tbl in tables:
+            with open(os.path.join(target, f"{tbl}.csv"), "w", encoding="utf-8", newline="") as out:
+                counts[tbl] = export_csv(store, tbl, out)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"exported": counts, "seconds": round(seconds, 3),
+                      "records_per_s": round(sum(counts.values()) / seconds) if seconds else None}, indent=2),
+          file=sys.stderr if target == "-" else sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# catalog.py
+"""
+Client-side cache of the servers' tool/prompt/resource catalogs.
+
+Catalogs are kept on disk between runs, so a new copilot process knows the
+available prompts and policies without any discovery calls. Reads never
+wait on the network: a stale entry is returned as-is and refreshed in the
+background. Entries go stale when a server sends
+notifications/<kind>/list_changed, when a long-lived session reconnects
+(notifications may have been missed), and once per process for entries
+loaded from disk.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_CACHE_PATH = Path(os.getenv("COPILOT_CATALOG_CACHE", Path(__file__).parent / ".mcp_catalog_cache.json"))
+
+KINDS = ("tools", "prompts", "resources")
+
+logger = logging.getLogger("catalog")
+
+# Lists one kind of catalog entry for a server namespace: [{"name"/"uri", "description"}]
+Loader = Callable[[str, str], Awaitable[List[Dict[str, str]]]]
+
+def entry_key(kind: str) -> str:
+    return "uri" if kind == "resources" else "name"
+
+class CatalogCache:
+    """Catalog entries per (server namespace, kind), refreshed only when invalidated"""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, loader: Optional[Loader] = None):
+        self.path = Path(path)
+        self.loader = loader
+        self._entries: Dict[str, Dict[str, List[Dict[str, str]]]] = self._load()
+        # Loaded from an earlier run: usable now, but verify once in the background
+        self._stale: Set[Tuple[str, str]] = {(ns, kind) for ns, kinds in self._entries.items() for kind in kinds}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _load(self) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(self._entries, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("could not write catalog cache %s: %s", self.path, e)
+
+    def entries(self, namespace: str, kind: str) -> List[Dict[str, str]]:
+        """Cached entries, without waiting; schedules a refresh if they are stale or missing"""
+        cached = self._entries.get(namespace, {}).get(kind)
+        if cached is None or (namespace, kind) in self._stale:
+            self._refresh_in_background(namespace, kind)
+        return cached or []
+
+    def names(self, namespace: str, kind: str) -> List[str]:
+        key = entry_key(kind)
+        return [entry[key] for entry in self.entries(namespace, kind)]
+
+    async def contains(self, namespace: str, kind: str, name: str) -> bool:
+        """Whether `name` is in the catalog; a miss refreshes once before answering"""
+        key = entry_key(kind)
+        if any(entry[key] == name for entry in self._entries.get(namespace, {}).get(kind, [])):
+            return True
+        await self.refresh(namespace, kind)
+        return any(entry[key] == name for entry in self._entries.get(namespace, {}).get(kind, []))
+
+    def invalidate(self, namespaces: Iterable[str], kinds: Iterable[str] = KINDS):
+        for namespace in namespaces:
+            for kind in kinds:
+                self._stale.add((namespace, kind))
+
+    async def refresh(self, namespace: str, kind: str) -> List[Dict[str, str]]:
+        """List from the server now; concurrent refreshes of one entry share a call"""
+        if self.loader is None:
+            return self._entries.get(namespace, {}).get(kind, [])
+        task = self._refreshing.get((namespace, kind))
+        if task is None:
+            task = self._start_refresh(namespace, kind)
+        await asyncio.shield(task)
+        return self._entries.get(namespace, {}).get(kind, [])
+
+    def _start_refresh(self, namespace: str, kind: str) -> asyncio.Task:
+        # Empty context: the listing belongs to no particular turn's trace
+        loop = asyncio.get_running_loop()
+        task = contextvars.Context().run(loop.create_task, self._load_entries(namespace, kind))
+        self._refreshing[(namespace, kind)] = task
+        task.add_done_callback(lambda _: self._refreshing.pop((namespace, kind), None))
+        return task
+
+    def _refresh_in_background(self, namespace: str, kind: str):
+        if self.loader is None or (namespace, kind) in self._refreshing:
+            return
+        try:
+            self._start_refresh(namespace, kind)
+        except RuntimeError:
+            pass  # no running loop; the next read retries
+
+    async def _load_entries(self, namespace: str, kind: str):
+        # Cleared first: a notification arriving during the call marks it stale again
+        self._stale.discard((namespace, kind))
+        try:
+            entries = await self.loader(namespace, kind)
+        except Exception as e:
+            self._stale.add((namespace, kind))
+            logger.warning("could not list %s of %s: %s", kind, namespace, e)
+            return
+        if self._entries.get(namespace, {}).get(kind) != entries:
+            self._entries.setdefault(namespace, {})[kind] = entries
+            self._save()
+
+def list_changed_kind(message: Any) -> Optional[str]:
+    """'tools'/'prompts'/'resources' for a list_changed notification, else None"""
+    method = getattr(getattr(message, "root", None), "method", "")
+    parts = method.split("/")
+    if len(parts) == 3 and parts[0] == "notifications" and parts[2] == "list_changed" and parts[1] in KINDS:
+        return parts[1]
+    return None
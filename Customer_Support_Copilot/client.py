@@ -2,18 +2,24 @@
 import os
 import asyncio
 import json
+import logging
 import re
-from typing import List, Any, Dict, Optional
+from functools import lru_cache
+from typing import List, Any, AsyncIterator, Dict, Optional
 from dataclasses import dataclass, field
 
 from pydantic import BaseModel, Field
-from langchain.tools import StructuredTool
-from langchain_groq import ChatGroq
-from langgraph.prebuilt import create_react_agent
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
-
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+import budget
+from connections import McpConnections
+from customer_context import CustomerContext, OrderSummary
+from history import SessionStore, llm_summarizer
+from models import create_chat_model
+import resilience
+import tracing
+from streaming import StreamEvent, TurnTiming, TimingLog, run_agent, stream_agent, print_stream
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -23,6 +29,17 @@ TOOLS_URL = "http://127.0.0.1:8001/mcp"    # tools server
 RESOURCES_URL = "http://127.0.0.1:8002/mcp"  # resources server
 PROMPTS_URL = "http://127.0.0.1:8003/mcp"   # prompts server
 
+# Sessions to the servers, directly or through gateway.py (COPILOT_MCP_TRANSPORT)
+connections = McpConnections({TOOLS_URL: "tools", RESOURCES_URL: "resources", PROMPTS_URL: "prompts"})
+
+logger = logging.getLogger("copilot")
+
+# Stream tokens to the terminal as they are generated (set COPILOT_STREAMING=0 to disable)
+STREAMING = os.getenv("COPILOT_STREAMING", "1") != "0"
+
+# Number of recent turns sent verbatim; older turns are folded into a running summary
+HISTORY_TURNS = int(os.getenv("COPILOT_HISTORY_TURNS", "4"))
+
 @dataclass
 class ConversationMemory:
     """Manages conversation context and remembered entities"""
@@ -33,6 +50,12 @@ class ConversationMemory:
     current_context: Dict[str, Any] = field(default_factory=dict)
     last_customer_data: Optional[str] = None
     last_order_data: Optional[str] = None
+    # Parsed once when the data arrives, then reused by every prompt tool
+    last_customer: Optional[Dict[str, Any]] = None
+    last_customer_id: str = ""
+    last_order: Optional[OrderSummary] = None
+    customer_context: Optional[CustomerContext] = None
+    customer_context_json: str = ""
     
     def add_ticket(self, ticket_id: str):
         if ticket_id not in self.ticket_ids:
@@ -56,6 +79,31 @@ class ConversationMemory:
     def get_recent_order_id(self) -> str:
         return self.order_ids[-1] if self.order_ids else ""
     
+    def remember_customer_data(self, customer_id: str, result: str):
+        """Store a get_customer_details result and rebuild the typed context from it"""
+        self.last_customer_data = result
+        try:
+            self.last_customer = json.loads(result)
+            self.last_customer_id = customer_id
+        except (json.JSONDecodeError, TypeError):
+            return  # "Customer X not found" and similar
+        self._rebuild_customer_context()
+    
+    def remember_order_data(self, order_id: str, result: str):
+        """Store a get_order_info result and rebuild the typed context from it"""
+        self.last_order_data = result
+        try:
+            self.last_order = OrderSummary.from_order_data(order_id, json.loads(result))
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            return
+        self._rebuild_customer_context()
+    
+    def _rebuild_customer_context(self):
+        if self.last_customer:
+            self.customer_context = CustomerContext.from_customer_data(
+                self.last_customer, self.last_customer_id, recent_order=self.last_order)
+            self.customer_context_json = self.customer_context.model_dump_json()
+    
     def get_context_summary(self) -> str:
         context_parts = []
         if self.ticket_ids:
@@ -69,69 +117,94 @@ class ConversationMemory:
 # Global memory instance
 memory = ConversationMemory()
 
+# Per-turn latency (time-to-first-byte and total)
+turn_timings = TimingLog()
+
+# Per-session message history with tool results kept as ref-N handles
+sessions = SessionStore(window_turns=HISTORY_TURNS)
+
 # ---------- MCP Helpers ----------
 
 async def _mcp_call_tool(tool_name: str, params: dict, url: str) -> str:
     """Call an MCP tool and return the response"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                resp = await session.call_tool(tool_name, params)
-                if resp.content:
-                    texts = [c.text for c in resp.content if getattr(c, "text", None)]
-                    return "\n".join(texts)
-                return f"No response from tool {tool_name}"
-    except Exception as e:
-        return f"Error calling tool {tool_name}: {str(e)}"
+    with tracing.span("mcp.call_tool", tool=tool_name, url=url) as span:
+        try:
+            resp = await connections.call_tool(url, tool_name, params)
+            if resp.content:
+                texts = [c.text for c in resp.content if getattr(c, "text", None)]
+                return "\n".join(texts)
+            return f"No response from tool {tool_name}"
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"calling tool {tool_name}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
 
 async def _mcp_read_resource(resource_uri: str, url: str) -> str:
     """Read an MCP resource and return the content"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                res = await session.read_resource(resource_uri)
-                
-                texts: List[str] = []
-                
-                if hasattr(res, 'contents') and res.contents:
-                    for item in res.contents:
-                        if hasattr(item, 'text') and item.text:
-                            texts.append(item.text)
-                        elif isinstance(item, dict) and item.get('text'):
-                            texts.append(item['text'])
-                
-                result = "\n".join(texts).strip()
-                return result if result else f"No content found for resource: {resource_uri}"
-                
-    except Exception as e:
-        return f"Error reading resource {resource_uri}: {str(e)}"
+    with tracing.span("mcp.read_resource", uri=resource_uri, url=url) as span:
+        try:
+            res = await connections.read_resource(url, resource_uri)
+            
+            texts: List[str] = []
+            
+            if hasattr(res, 'contents') and res.contents:
+                for item in res.contents:
+                    if hasattr(item, 'text') and item.text:
+                        texts.append(item.text)
+                    elif isinstance(item, dict) and item.get('text'):
+                        texts.append(item['text'])
+            
+            result = "\n".join(texts).strip()
+            return result if result else f"No content found for resource: {resource_uri}"
+            
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"reading resource {resource_uri}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
 
 async def _mcp_get_prompt(prompt_name: str, args: dict, url: str) -> str:
     """Get an MCP prompt with arguments"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                
-                result = await session.get_prompt(prompt_name, args)
-                
-                pieces: List[str] = []
-                
-                if hasattr(result, 'messages') and result.messages:
-                    for msg in result.messages:
-                        if hasattr(msg, 'content') and msg.content:
-                            for c in msg.content:
-                                if hasattr(c, 'text') and c.text:
-                                    pieces.append(c.text)
-                                elif isinstance(c, dict) and c.get('text'):
-                                    pieces.append(c['text'])
-                
-                return "\n".join(pieces).strip()
-                
-    except Exception as e:
-        return f"Error getting prompt {prompt_name}: {str(e)}"
+    with tracing.span("mcp.get_prompt", prompt=prompt_name, url=url) as span:
+        try:
+            result = await connections.get_prompt(url, prompt_name, args)
+            
+            pieces: List[str] = []
+            
+            if hasattr(result, 'messages') and result.messages:
+                for msg in result.messages:
+                    if hasattr(msg, 'content') and msg.content:
+                        # PromptMessage.content is a single content block, not a list
+                        contents = msg.content if isinstance(msg.content, list) else [msg.content]
+                        for c in contents:
+                            if hasattr(c, 'text') and c.text:
+                                pieces.append(c.text)
+                            elif isinstance(c, dict) and c.get('text'):
+                                pieces.append(c['text'])
+            
+            return "\n".join(pieces).strip()
+            
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"getting prompt {prompt_name}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
+
+# ---------- Server Catalogs ----------
+
+# Until the first catalog listing (then kept on disk, see catalog.py)
+DEFAULT_POLICIES = ["shipping", "return", "refund", "warranty"]
+
+def available_policies() -> List[str]:
+    """Short policy names (shipping, ...) from the cached resources catalog; never waits on the server"""
+    policies = [uri.split("://", 1)[1].removesuffix("_policy")
+                for uri in connections.catalog.names("resources", "resources")
+                if uri.startswith("policy://") and uri != "policy://list_all"]
+    return policies or DEFAULT_POLICIES
 
 # ---------- Enhanced Tool Wrappers ----------
 
@@ -160,10 +233,10 @@ def extract_ids_from_response(response: str) -> None:
 class TicketInput(BaseModel):
     ticket_id: str = Field(..., description="The ticket ID to look up")
 
-def get_ticket_status_tool(ticket_id: str) -> str:
+async def get_ticket_status_tool(ticket_id: str) -> str:
     """Get ticket status and remember the ticket ID"""
     memory.add_ticket(ticket_id)
-    result = asyncio.run(_mcp_call_tool("get_ticket_status", {"ticket_id": ticket_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_ticket_status", {"ticket_id": ticket_id}, TOOLS_URL)
     extract_ids_from_response(result)
     
     # Store for context
@@ -173,28 +246,28 @@ def get_ticket_status_tool(ticket_id: str) -> str:
 class OrderInput(BaseModel):
     order_id: str = Field(..., description="The order ID to look up")
 
-def get_order_info_tool(order_id: str) -> str:
+async def get_order_info_tool(order_id: str) -> str:
     """Get order information and remember the order ID"""
     memory.add_order(order_id)
-    result = asyncio.run(_mcp_call_tool("get_order_info", {"order_id": order_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_order_info", {"order_id": order_id}, TOOLS_URL)
     extract_ids_from_response(result)
     
     # Store for context
-    memory.last_order_data = result
+    memory.remember_order_data(order_id, result)
     memory.current_context['last_order'] = result
     return result
 
 class CustomerInput(BaseModel):
     customer_id: str = Field(..., description="The customer ID to look up")
 
-def get_customer_details_tool(customer_id: str) -> str:
+async def get_customer_details_tool(customer_id: str) -> str:
     """Get customer details and remember the customer ID"""
     memory.add_customer(customer_id)
-    result = asyncio.run(_mcp_call_tool("get_customer_details", {"customer_id": customer_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_customer_details", {"customer_id": customer_id}, TOOLS_URL)
     extract_ids_from_response(result)
     
     # Store for context
-    memory.last_customer_data = result
+    memory.remember_customer_data(customer_id, result)
     memory.current_context['last_customer'] = result
     return result
 
@@ -203,7 +276,7 @@ class SmartPolicyInput(BaseModel):
     context_type: str = Field(default="general", description="Context: general, order_specific, ticket_specific")
     customer_situation: str = Field(default="", description="Customer's current situation for personalized response")
 
-def get_smart_policy_explanation_tool(policy_type: str, context_type: str = "general", customer_situation: str = "") -> str:
+async def get_smart_policy_explanation_tool(policy_type: str, context_type: str = "general", customer_situation: str = "") -> str:
     """Get user-friendly, contextual policy explanation using prompts"""
     
     # Get raw policy content
@@ -222,48 +295,29 @@ def get_smart_policy_explanation_tool(policy_type: str, context_type: str = "gen
     
     # Get raw policy content
     resource_uri = f"policy://{normalized_policy}"
-    raw_policy = asyncio.run(_mcp_read_resource(resource_uri, RESOURCES_URL))
+    raw_policy = await _mcp_read_resource(resource_uri, RESOURCES_URL)
     
     if raw_policy.startswith("Error") or "not found" in raw_policy:
         return f"Sorry, I couldn't find the {policy_type} policy."
     
-    # Build customer situation context
-    if not customer_situation and memory.last_customer_data:
-        try:
-            customer_data = json.loads(memory.last_customer_data)
-            customer_name = customer_data.get("name", "")
-            customer_tier = customer_data.get("tier", "standard")
-            customer_situation = f"Customer: {customer_name} ({customer_tier} tier)"
-            
-            # Add recent order info if available
-            if memory.last_order_data:
-                order_data = json.loads(memory.last_order_data)
-                order_id = memory.get_recent_order_id()
-                items = order_data.get("items", [])
-                customer_situation += f" | Recent order {order_id}: {', '.join(items)}"
-            
-        except:
-            customer_situation = "General inquiry"
-    
-    if not customer_situation:
-        customer_situation = "General inquiry"
-    
-    # Use the policy explanation prompt
+    # Use the policy explanation prompt; the typed context replaces the old situation string
     prompt_args = {
         "policy_content": raw_policy,
-        "customer_situation": customer_situation,
+        "customer_situation": customer_situation or "General inquiry",
         "tone": "friendly"
     }
+    if memory.customer_context:
+        prompt_args["customer_context"] = memory.customer_context_json
     
-    return asyncio.run(_mcp_get_prompt("policy_explanation", prompt_args, PROMPTS_URL))
+    return await _mcp_get_prompt("policy_explanation", prompt_args, PROMPTS_URL)
 
 class ReturnInput(BaseModel):
     reference_id: str = Field(..., description="Ticket or order ID to process return for")
     reason: str = Field(default="Customer request", description="Reason for return")
 
-def initiate_return_tool(reference_id: str, reason: str = "Customer request") -> str:
+async def initiate_return_tool(reference_id: str, reason: str = "Customer request") -> str:
     """Initiate a return process"""
-    result = asyncio.run(_mcp_call_tool("initiate_return", {"reference_id": reference_id, "reason": reason}, TOOLS_URL))
+    result = await _mcp_call_tool("initiate_return", {"reference_id": reference_id, "reason": reason}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
@@ -272,140 +326,155 @@ class EscalationInput(BaseModel):
     department: str = Field(..., description="Department to escalate to")
     notes: str = Field(default="", description="Additional notes for escalation")
 
-def escalate_ticket_tool(ticket_id: str, department: str, notes: str = "") -> str:
+async def escalate_ticket_tool(ticket_id: str, department: str, notes: str = "") -> str:
     """Escalate a ticket to another department"""
     memory.add_ticket(ticket_id)
-    result = asyncio.run(_mcp_call_tool("escalate_ticket", {"ticket_id": ticket_id, "department": department, "notes": notes}, TOOLS_URL))
+    result = await _mcp_call_tool("escalate_ticket", {"ticket_id": ticket_id, "department": department, "notes": notes}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
+class TicketStatsInput(BaseModel):
+    status: str = Field(default="", description="Only tickets with this status: pending, in_progress, resolved")
+    priority: str = Field(default="", description="Only tickets with this priority: low, medium, high, urgent")
+    department: str = Field(default="", description="Only tickets escalated to this department")
+    tier: str = Field(default="", description="Only tickets of customers in this tier: standard, premium")
+
+async def ticket_stats_tool(status: str = "", priority: str = "", department: str = "", tier: str = "") -> str:
+    """Count tickets, optionally filtered"""
+    return await _mcp_call_tool(
+        "ticket_stats", {"status": status, "priority": priority, "department": department, "tier": tier}, TOOLS_URL)
+
 class ContextualResponseInput(BaseModel):
     query: str = Field(..., description="Customer query to respond to")
     tone: str = Field(default="friendly", description="Response tone")
 
-def generate_contextual_response_tool(query: str, tone: str = "friendly") -> str:
+async def generate_contextual_response_tool(query: str, tone: str = "friendly") -> str:
     """Generate contextual response using customer and order data from memory"""
     
-    customer_data = memory.last_customer_data or ""
-    order_data = memory.last_order_data or ""
-    
     prompt_args = {
         "query": query,
-        "customer_data": customer_data,
-        "order_data": order_data, 
         "tone": tone
     }
+    if memory.customer_context:
+        prompt_args["customer_context"] = memory.customer_context_json
+    else:
+        prompt_args["customer_data"] = memory.last_customer_data or ""
+        prompt_args["order_data"] = memory.last_order_data or ""
     
-    return asyncio.run(_mcp_get_prompt("contextual_response", prompt_args, PROMPTS_URL))
+    return await _mcp_get_prompt("contextual_response", prompt_args, PROMPTS_URL)
 
 class SmartGreetingInput(BaseModel):
     issue_type: str = Field(default="", description="Type of issue customer has")
 
-def generate_smart_greeting_tool(issue_type: str = "") -> str:
+async def generate_smart_greeting_tool(issue_type: str = "") -> str:
     """Generate smart greeting based on current context"""
     
-    customer_name = memory.get_recent_customer_name()
-    customer_tier = "standard"
-    recent_activity = ""
-    
-    # Extract tier from customer data if available
-    if memory.last_customer_data:
-        try:
-            customer_data = json.loads(memory.last_customer_data)
-            customer_tier = customer_data.get("tier", "standard")
-            
-            # Build recent activity summary
-            orders = customer_data.get("order_details", [])
-            tickets = customer_data.get("ticket_details", [])
-            
-            if orders:
-                latest_order = orders[-1]
-                recent_activity += f"recent order {latest_order.get('order_id', '')}"
-            
-            if tickets:
-                latest_ticket = tickets[-1]
-                if recent_activity:
-                    recent_activity += f" and ticket {latest_ticket.get('ticket_id', '')}"
-                else:
-                    recent_activity = f"ticket {latest_ticket.get('ticket_id', '')}"
-                    
-        except:
-            pass
-    
     prompt_args = {
-        "customer_name": customer_name,
-        "customer_tier": customer_tier,
-        "recent_activity": recent_activity,
+        "customer_name": memory.get_recent_customer_name(),
         "issue_type": issue_type
     }
+    if memory.customer_context:
+        prompt_args["customer_context"] = memory.customer_context_json
     
-    return asyncio.run(_mcp_get_prompt("smart_greeting", prompt_args, PROMPTS_URL))
+    return await _mcp_get_prompt("smart_greeting", prompt_args, PROMPTS_URL)
+
+class RecallInput(BaseModel):
+    handle: str = Field(..., description="Handle of an earlier tool result, e.g. ref-3")
+
+async def recall_result_tool(handle: str) -> str:
+    """Return a tool result from earlier in the conversation without calling the server again"""
+    return sessions.recall(handle)
 
 # ---------- Create Structured Tools ----------
 
+@lru_cache(maxsize=None)
 def create_tools():
     """Create all the structured tools for the agent"""
     return [
         StructuredTool.from_function(
-            func=get_ticket_status_tool,
+            coroutine=get_ticket_status_tool,
             name="get_ticket_status",
             description="Get status and details of a support ticket by ID",
             args_schema=TicketInput
         ),
         StructuredTool.from_function(
-            func=get_order_info_tool,
+            coroutine=get_order_info_tool,
             name="get_order_info", 
             description="Get order information including items, status, and total",
             args_schema=OrderInput
         ),
         StructuredTool.from_function(
-            func=get_customer_details_tool,
+            coroutine=get_customer_details_tool,
             name="get_customer_details",
             description="Get customer information including name, email, tier, and order history",
             args_schema=CustomerInput
         ),
         StructuredTool.from_function(
-            func=get_smart_policy_explanation_tool,
+            coroutine=get_smart_policy_explanation_tool,
             name="explain_policy",
             description="Get user-friendly policy explanation customized to customer's situation. Use for shipping, return, refund, or warranty policies.",
             args_schema=SmartPolicyInput
         ),
         StructuredTool.from_function(
-            func=initiate_return_tool,
+            coroutine=initiate_return_tool,
             name="initiate_return",
             description="Initiate a return process for a ticket or order",
             args_schema=ReturnInput
         ),
         StructuredTool.from_function(
-            func=escalate_ticket_tool,
+            coroutine=escalate_ticket_tool,
             name="escalate_ticket",
             description="Escalate a ticket to higher priority or different department",
             args_schema=EscalationInput
         ),
         StructuredTool.from_function(
-            func=generate_contextual_response_tool,
+            coroutine=ticket_stats_tool,
+            name="ticket_stats",
+            description="Count tickets by status, priority, department and customer tier, e.g. how many high-priority tickets are pending",
+            args_schema=TicketStatsInput
+        ),
+        StructuredTool.from_function(
+            coroutine=generate_contextual_response_tool,
             name="generate_response",
             description="Generate contextual response using remembered customer/order context",
             args_schema=ContextualResponseInput
         ),
         StructuredTool.from_function(
-            func=generate_smart_greeting_tool,
+            coroutine=generate_smart_greeting_tool,
             name="smart_greeting",
             description="Generate personalized greeting based on customer context",
             args_schema=SmartGreetingInput
+        ),
+        StructuredTool.from_function(
+            coroutine=recall_result_tool,
+            name="recall_result",
+            description="Show the full text of an earlier tool result by its ref-N handle instead of looking it up again",
+            args_schema=RecallInput
         )
     ]
 
-def create_agent():
+# The compiled graph for the configured model; built once per process
+_default_agent = None
+
+def create_agent(llm=None):
     """Create the conversational agent with enhanced prompt integration"""
-    llm = ChatGroq(
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        model="llama-3.3-70b-versatile",
-        temperature=0.2,
-    )
+    global _default_agent
+    if llm is None and _default_agent is not None:
+        return _default_agent
+    # Deferred so importing this module (and printing the banner) stays cheap
+    from langgraph.prebuilt import create_react_agent
+    
+    use_default = llm is None
+    # Model comes from the factory (COPILOT_MODEL_PROVIDER) unless one is passed in
+    if llm is None:
+        llm = create_chat_model(temperature=0.2)
     
     tools = create_tools()
     
+    if os.getenv("COPILOT_LLM_SUMMARY") == "1":
+        # Compact old turns with the model (in the background) instead of the extractive default
+        sessions.summarizer = llm_summarizer(llm)
+    
     def create_system_message():
         base_prompt = f"""You are a helpful customer support assistant with access to various tools and company information.
 
@@ -417,7 +486,7 @@ CORE BEHAVIOR:
 5. Use smart_greeting tool when starting conversations with new customers
 
 POLICY HANDLING (ONLY FOR POLICY QUERIES):
-- When users ask about shipping, return, refund, or warranty policies, use explain_policy tool
+- When users ask about policies ({", ".join(available_policies())}), use explain_policy tool
 - This provides brief, customized explanations instead of raw policy text
 - Focus on what the customer can do, not lengthy rules
 - Relate policies to their specific orders/tickets when possible
@@ -428,6 +497,7 @@ GENERAL RESPONSE STYLE:
 - Provide complete information for ticket status, order details, customer issues
 - Ask clarifying questions when needed to help effectively
 - Only keep responses brief when specifically dealing with policy explanations
+- Earlier tool results appear as ref-N handles - use recall_result instead of looking the same thing up again
 
 Current context: {memory.get_context_summary()}
 """
@@ -436,25 +506,43 @@ Current context: {memory.get_context_summary()}
     agent = create_react_agent(model=llm, tools=tools)
     agent._create_system_message = create_system_message
     
+    if use_default:
+        _default_agent = agent
     return agent
 
-async def process_query(agent, user_input: str) -> str:
+def _build_messages(agent, user_input: str, session_id: str) -> List[Any]:
+    """System prompt, then this session's history window, then the new user message"""
+    return [
+        SystemMessage(content=agent._create_system_message()),
+        *sessions.get(session_id).messages(),
+        HumanMessage(content=user_input)
+    ]
+
+async def process_query(agent, user_input: str, session_id: str = "default") -> str:
     """Process a user query and return the response"""
+    with tracing.span("copilot.process_query", session=session_id), budget.turn(), sessions.active(session_id):
+        return await _process_query(agent, user_input, session_id)
+
+async def _process_query(agent, user_input: str, session_id: str) -> str:
     # Extract any IDs from user input
     extract_ids_from_response(user_input)
     
-    # Create dynamic system message with current context
-    system_message = agent._create_system_message()
+    messages = _build_messages(agent, user_input, session_id)
     
     try:
-        result = await agent.ainvoke({
-            "messages": [
-                SystemMessage(content=system_message),
-                HumanMessage(content=user_input)
-            ]
-        })
+        result, finished = await run_agent(agent, {"messages": messages}, config=tracing.agent_config(),
+                                           deadline=budget.deadline())
+        if not finished:
+            # Out of time: answer with whatever the tools returned so far
+            response = budget.fallback_answer("", [str(m.content) for m in result[len(messages):]
+                                                   if isinstance(m, ToolMessage)])
+            sessions.get(session_id).add_turn([HumanMessage(content=user_input), AIMessage(content=response)])
+            return response
         
-        response = result["messages"][-1].content
+        # Keep this turn (from the user message on) in the session history
+        sessions.get(session_id).add_turn(result[len(messages) - 1:])
+        
+        response = result[-1].content
         extract_ids_from_response(response)
         
         return response
@@ -462,6 +550,31 @@ async def process_query(agent, user_input: str) -> str:
     except Exception as e:
         return f"Sorry, I encountered an error: {str(e)}"
 
+async def stream_query(agent, user_input: str, session_id: str = "default") -> AsyncIterator[StreamEvent]:
+    """Streaming variant of process_query - yields tokens and tool progress as they happen"""
+    # The turn runs in a task of its own, so its span, budget and session are set and reset
+    # there, not across our yields into the consumer's context
+    async for event in budget.within(_stream_turn(agent, user_input, session_id), None):
+        yield event
+
+async def _stream_turn(agent, user_input: str, session_id: str) -> AsyncIterator[StreamEvent]:
+    timing = TurnTiming()
+    extract_ids_from_response(user_input)
+
+    with tracing.span("copilot.stream_query", session=session_id) as span, budget.turn(), \
+            sessions.active(session_id):
+        messages = _build_messages(agent, user_input, session_id)
+
+        async for event in stream_agent(agent, {"messages": messages}, timing, config=tracing.agent_config(),
+                                        deadline=budget.deadline()):
+            if event.kind == "done":
+                extract_ids_from_response(event.text)
+                sessions.get(session_id).add_turn(event.messages[len(messages) - 1:] if event.messages
+                                                  else [HumanMessage(content=user_input), AIMessage(content=event.text)])
+            yield event
+        span.set(ttfb_ms=timing.ttfb and round(timing.ttfb * 1000, 3))
+    turn_timings.record(timing)
+
 def print_welcome():
     """Print welcome message and instructions"""
     print("\n" + "="*60)
@@ -474,18 +587,27 @@ def print_welcome():
     print("• Personalized responses based on your history")
     print("• Processing returns and escalations")
     print("\nType 'memory' to see conversation context.")
+    print("Type 'timing' to see response latency (time-to-first-byte).")
     print("Type 'quit' to exit.")
     print("-" * 60)
 
 def print_memory_status():
     """Print current memory status"""
     print(f"\nContext: {memory.get_context_summary()}")
+    print(f"History: {sessions.describe()}")
+
+def print_timing_status():
+    """Print time-to-first-byte and total latency for recent turns"""
+    print(f"\nTiming: {json.dumps(turn_timings.summary(), indent=2)}")
 
 async def main():
     """Main conversation loop"""
+    logging.basicConfig(level=os.getenv("COPILOT_LOG_LEVEL", "WARNING"),
+                        format="%(levelname)s %(name)s: %(message)s")
     print_welcome()
     
     agent = create_agent()
+    connections.prewarm()
     
     while True:
         try:
@@ -498,19 +620,28 @@ async def main():
             if user_input.lower() == 'memory':
                 print_memory_status()
                 continue
+            
+            if user_input.lower() == 'timing':
+                print_timing_status()
+                continue
                 
             if not user_input:
                 continue
             
-            print("\nAssistant: ", end="")
-            response = await process_query(agent, user_input)
-            print(response)
+            print("\nAssistant: ", end="", flush=True)
+            if STREAMING:
+                await print_stream(stream_query(agent, user_input))
+            else:
+                response = await process_query(agent, user_input)
+                print(response)
             
         except KeyboardInterrupt:
             print("\n\nGoodbye!")
             break
         except Exception as e:
             print(f"\nError: {str(e)}")
+    
+    await connections.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
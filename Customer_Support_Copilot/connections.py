@@ -0,0 +1,331 @@
+# connections.py
+"""
+How the copilots reach the MCP servers.
+
+COPILOT_MCP_TRANSPORT picks the mode:
+    http       one streamable-http session per call, to each server's own port (default)
+    gateway    all calls go to gateway.py over a single long-lived session; names
+               are namespaced by server (tools_get_ticket_status,
+               prompts_smart_greeting, policy://resources/shipping_policy)
+    inprocess  the server modules are imported into the copilot and reached
+               over an in-memory transport - same ClientSession calls, no
+               sockets or HTTP framing (single-node deployments)
+
+Server catalogs (tool, prompt and resource names) are served from
+`McpConnections.catalog` and refreshed only when a server announces a
+change over a long-lived session (gateway, inprocess), or when a looked-up
+name is missing. Per-call http sessions cannot receive those notifications.
+
+Calls made through `call_tool`, `read_resource` and `get_prompt` run under
+a deadline, with retries, hedged reads and a circuit breaker per server
+(see resilience.py).
+"""
+import asyncio
+import contextvars
+import importlib
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional
+
+import tracing
+from catalog import CatalogCache, list_changed_kind
+from resilience import ResilientCaller, ServerOverloaded, overload_retry_after
+
+# The MCP client stack is imported on first use (or by prewarm()) - it is the
+# largest part of the copilot's import time
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from mcp.types import CallToolResult, GetPromptResult, ReadResourceResult
+
+GATEWAY_URL = os.getenv("COPILOT_GATEWAY_URL", "http://127.0.0.1:8000/mcp")
+
+# Upper bound on waiting for a response on a long-lived session; a request sent
+# over a connection that died in the meantime would otherwise never return
+REQUEST_TIMEOUT_S = float(os.getenv("COPILOT_MCP_TIMEOUT", "30"))
+
+# Tools server tools that only read, so a failed or slow call may be sent again
+IDEMPOTENT_TOOLS = frozenset({"get_ticket_status", "get_order_info", "get_customer_details", "search_by_customer",
+                              "ticket_stats"})
+
+def namespaced_name(namespace: str, name: str) -> str:
+    """Tool/prompt name as exposed by a server mounted under `namespace`"""
+    return f"{namespace}_{name}"
+
+def namespaced_uri(namespace: str, uri: str) -> str:
+    """Resource URI as exposed by a server mounted under `namespace`"""
+    scheme, _, path = uri.partition("://")
+    return f"{scheme}://{namespace}/{path}"
+
+def local_name(namespace: str, name: str) -> Optional[str]:
+    """Inverse of namespaced_name; None if `name` belongs to another namespace"""
+    prefix = f"{namespace}_"
+    return name[len(prefix):] if name.startswith(prefix) else None
+
+def local_uri(namespace: str, uri: str) -> Optional[str]:
+    """Inverse of namespaced_uri; None if `uri` belongs to another namespace"""
+    scheme, _, path = uri.partition("://")
+    owner, _, rest = path.partition("/")
+    return f"{scheme}://{rest}" if owner == namespace else None
+
+async def list_catalog(session: "ClientSession", kind: str) -> List[Any]:
+    """Every tool, prompt or resource of a session, across pages"""
+    method = {"tools": session.list_tools, "prompts": session.list_prompts,
+              "resources": session.list_resources}[kind]
+    items, cursor = [], None
+    while True:
+        page = await method(cursor=cursor)
+        items.extend(getattr(page, kind))
+        cursor = page.nextCursor
+        if not cursor:
+            return items
+
+@asynccontextmanager
+async def open_http_session(url: str, headers: Optional[Dict[str, str]] = None,
+                            timeout_s: Optional[float] = None,
+                            message_handler: Optional[Callable] = None) -> AsyncIterator["ClientSession"]:
+    """Connect and initialize a streamable-http MCP session"""
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    read_timeout = timedelta(seconds=timeout_s) if timeout_s else None
+    async with streamablehttp_client(url, headers=headers) as (read, write, _sid):
+        async with ClientSession(read, write, read_timeout_seconds=read_timeout,
+                                 message_handler=message_handler) as session:
+            with tracing.span("mcp.initialize"):
+                await session.initialize()
+            yield session
+
+def _import_server(namespace: str):
+    """The FastMCP server defined by the module named after `namespace`"""
+    # Importing a server configures tracing for that server; keep the copilot's service name
+    service = tracing.service_name()
+    server = importlib.import_module(namespace).mcp
+    tracing.configure(service=service)
+    return server
+
+@asynccontextmanager
+async def open_inprocess_session(namespace: str,
+                                 message_handler: Optional[Callable] = None) -> AsyncIterator["ClientSession"]:
+    """Import the server module named after `namespace` and connect to it in memory"""
+    from fastmcp import Client
+    from fastmcp.client.transports import FastMCPTransport
+
+    server = _import_server(namespace)
+    async with Client(FastMCPTransport(server), message_handler=message_handler) as client:
+        yield client.session
+
+class SharedSession:
+    """One initialized ClientSession kept open by a background task.
+
+    The transport's task group has to be entered and exited by the same
+    task, so a dedicated task owns the connection and callers borrow the
+    session. ClientSession multiplexes concurrent requests by id.
+    """
+
+    def __init__(self, connect: Callable[[], AsyncIterator["ClientSession"]]):
+        self._connect = connect
+        self._session: Optional["ClientSession"] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> "ClientSession":
+        async with self._lock:
+            if self._session is None:
+                ready = asyncio.get_running_loop().create_future()
+                self._closing = asyncio.Event()
+                # Start from an empty context so the connection isn't tied to the caller's span
+                self._task = contextvars.Context().run(asyncio.create_task, self._hold(ready))
+                self._session = await ready
+        return self._session
+
+    async def _hold(self, ready: asyncio.Future):
+        closing = self._closing
+        try:
+            async with self._connect() as session:
+                ready.set_result(session)
+                await closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            if self._closing is closing:
+                self._session = None
+
+    def discard(self):
+        """Drop a broken connection; the next get() reconnects"""
+        self._session = None
+        if self._closing is not None:
+            self._closing.set()
+
+    async def close(self):
+        self.discard()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+class McpConnections:
+    """Opens MCP sessions for the copilot and maps names for the chosen transport"""
+
+    def __init__(self, servers: Dict[str, str], transport: Optional[str] = None,
+                 gateway_url: str = GATEWAY_URL):
+        self.servers = servers  # server URL -> namespace used by the gateway
+        self.transport = transport or os.getenv("COPILOT_MCP_TRANSPORT", "http")
+        self.gateway_url = gateway_url
+        self.catalog = CatalogCache(loader=self._list_catalog)
+        self.resilience = ResilientCaller(on_open=self._reset)
+        self._connected: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, set]" = weakref.WeakKeyDictionary()
+        # Long-lived sessions (one per gateway or in-process server) belong to the event loop that opened them
+        self._shared: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, SharedSession]]" = weakref.WeakKeyDictionary()
+
+    def tool_name(self, url: str, name: str) -> str:
+        return namespaced_name(self.servers[url], name) if self.transport == "gateway" else name
+
+    def prompt_name(self, url: str, name: str) -> str:
+        return namespaced_name(self.servers[url], name) if self.transport == "gateway" else name
+
+    def resource_uri(self, url: str, uri: str) -> str:
+        return namespaced_uri(self.servers[url], uri) if self.transport == "gateway" else uri
+
+    def url_for(self, namespace: str) -> str:
+        return next(url for url, ns in self.servers.items() if ns == namespace)
+
+    def _catalog_handler(self, namespaces: List[str]) -> Callable:
+        """ClientSession message_handler that marks catalogs stale on list_changed"""
+        async def handle(message):
+            kind = list_changed_kind(message)
+            if kind:
+                self.catalog.invalidate(namespaces, [kind])
+        return handle
+
+    def _shared_session(self, url: str) -> SharedSession:
+        loop = asyncio.get_running_loop()
+        shared = self._shared.setdefault(loop, {})
+        key = self.servers[url] if self.transport == "inprocess" else "gateway"
+        if key not in shared:
+            namespaces = [key] if self.transport == "inprocess" else list(self.servers.values())
+            handler = self._catalog_handler(namespaces)
+            connected = self._connected.setdefault(loop, set())
+
+            def connect():
+                if key in connected:
+                    # Notifications sent while we were disconnected were lost
+                    self.catalog.invalidate(namespaces)
+                connected.add(key)
+                if self.transport == "inprocess":
+                    return open_inprocess_session(key, message_handler=handler)
+                return open_http_session(self.gateway_url, timeout_s=REQUEST_TIMEOUT_S, message_handler=handler)
+
+            shared[key] = SharedSession(connect)
+        return shared[key]
+
+    async def _list_catalog(self, namespace: str, kind: str) -> List[Dict[str, str]]:
+        """Catalog entries of one server, under the names that server uses itself"""
+        url = self.url_for(namespace)
+        async with self.session(url) as session:
+            items = await list_catalog(session, kind)
+        entries = []
+        for item in items:
+            if kind == "resources":
+                uri = str(item.uri)
+                uri = local_uri(namespace, uri) if self.transport == "gateway" else uri
+                if uri is not None:
+                    entries.append({"uri": uri, "name": item.name, "description": item.description or ""})
+            else:
+                name = local_name(namespace, item.name) if self.transport == "gateway" else item.name
+                if name is not None:
+                    entries.append({"name": name, "description": item.description or ""})
+        return entries
+
+    @asynccontextmanager
+    async def session(self, url: str) -> AsyncIterator["ClientSession"]:
+        """An initialized session that can serve requests meant for `url`"""
+        if self.transport == "http":
+            async with open_http_session(url, headers=tracing.inject_headers()) as session:
+                yield session
+            return
+
+        import httpx
+        from mcp.shared.exceptions import McpError
+
+        shared = self._shared_session(url)
+        session = await shared.get()
+        try:
+            yield session
+        except McpError as e:
+            # Any other protocol error means the server answered and the connection is fine
+            if e.error.code == httpx.codes.REQUEST_TIMEOUT:
+                shared.discard()
+            raise
+        except Exception:
+            shared.discard()
+            raise
+
+    def _reset(self, url: str):
+        """Drop the long-lived session serving `url` once its circuit opens; it may be dead"""
+        if self.transport == "http":
+            return
+        key = self.servers[url] if self.transport == "inprocess" else "gateway"
+        shared = self._shared.get(asyncio.get_running_loop(), {}).get(key)
+        if shared is not None:
+            shared.discard()
+
+    async def call_tool(self, url: str, name: str, arguments: Dict[str, Any], idempotent: Optional[bool] = None,
+                        deadline: Optional[float] = None) -> "CallToolResult":
+        """Call a tool; only idempotent ones (default: IDEMPOTENT_TOOLS) are retried after failures or hedged"""
+        if idempotent is None:
+            idempotent = name in IDEMPOTENT_TOOLS
+
+        async def request():
+            async with self.session(url) as session:
+                result = await session.call_tool(self.tool_name(url, name), arguments)
+            if result.isError:
+                text = "\n".join(c.text for c in result.content if getattr(c, "text", None))
+                retry_after = overload_retry_after(text)
+                if retry_after is not None:
+                    raise ServerOverloaded(text, retry_after)
+            return result
+        return await self.resilience.call(url, f"tool {name}", request, idempotent, deadline)
+
+    async def read_resource(self, url: str, uri: str, deadline: Optional[float] = None) -> "ReadResourceResult":
+        async def request():
+            async with self.session(url) as session:
+                return await session.read_resource(self.resource_uri(url, uri))
+        return await self.resilience.call(url, f"resource {uri}", request, True, deadline)
+
+    async def get_prompt(self, url: str, name: str, arguments: Optional[Dict[str, str]] = None,
+                         deadline: Optional[float] = None) -> "GetPromptResult":
+        async def request():
+            async with self.session(url) as session:
+                return await session.get_prompt(self.prompt_name(url, name), arguments)
+        return await self.resilience.call(url, f"prompt {name}", request, True, deadline)
+
+    def prewarm(self):
+        """Import the client stack (and in-process servers) on a background thread.
+
+        Call it once the CLI is up: the imports overlap with the user typing
+        instead of delaying the first tool call.
+        """
+        modules = ["mcp.client.session", "mcp.client.streamable_http", "httpx"]
+        if self.transport == "inprocess":
+            modules.append("fastmcp.client")
+
+        def load():
+            try:
+                for name in modules:
+                    importlib.import_module(name)
+                if self.transport == "inprocess":
+                    for namespace in self.servers.values():
+                        _import_server(namespace)
+            except Exception:
+                pass  # the real call will report the problem
+
+        threading.Thread(target=load, name="mcp-prewarm", daemon=True).start()
+
+    async def aclose(self):
+        """Close the long-lived sessions opened on the running loop, if any"""
+        for shared in self._shared.pop(asyncio.get_running_loop(), {}).values():
+            await shared.close()
@@ -2,18 +2,23 @@
 import os
 import asyncio
 import json
+import logging
 import re
-from typing import List, Any, Dict, Optional
+from functools import lru_cache
+from typing import List, Any, AsyncIterator, Dict, Optional
 from dataclasses import dataclass, field
 
 from pydantic import BaseModel, Field
-from langchain.tools import StructuredTool
-from langchain_groq import ChatGroq
-from langgraph.prebuilt import create_react_agent
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
+import budget
+from connections import McpConnections
+from history import SessionStore, llm_summarizer
+from models import create_chat_model
+import resilience
+import tracing
+from streaming import StreamEvent, TurnTiming, TimingLog, run_agent, stream_agent, stream_text, print_stream
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -23,6 +28,17 @@ TOOLS_URL = "http://127.0.0.1:8001/mcp"    # tools server
 RESOURCES_URL = "http://127.0.0.1:8002/mcp"  # resources server
 PROMPTS_URL = "http://127.0.0.1:8003/mcp"   # prompts server
 
+# Sessions to the servers, directly or through gateway.py (COPILOT_MCP_TRANSPORT)
+connections = McpConnections({TOOLS_URL: "tools", RESOURCES_URL: "resources", PROMPTS_URL: "prompts"})
+
+logger = logging.getLogger("copilot")
+
+# Stream tokens to the terminal as they are generated (set COPILOT_STREAMING=0 to disable)
+STREAMING = os.getenv("COPILOT_STREAMING", "1") != "0"
+
+# Number of recent turns sent verbatim; older turns are folded into a running summary
+HISTORY_TURNS = int(os.getenv("COPILOT_HISTORY_TURNS", "4"))
+
 @dataclass
 class ConversationMemory:
     """Manages conversation context and remembered entities"""
@@ -56,103 +72,140 @@ class ConversationMemory:
 # Global memory instance
 memory = ConversationMemory()
 
+# Per-turn latency (time-to-first-byte and total)
+turn_timings = TimingLog()
+
+# Per-session message history with tool results kept as ref-N handles
+sessions = SessionStore(window_turns=HISTORY_TURNS)
+
 # ---------- MCP Helpers ----------
 
 async def _mcp_call_tool(tool_name: str, params: dict, url: str) -> str:
     """Call an MCP tool and return the response"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                resp = await session.call_tool(tool_name, params)
-                if resp.content:
-                    texts = [c.text for c in resp.content if getattr(c, "text", None)]
-                    return "\n".join(texts)
-                return f"No response from tool {tool_name}"
-    except Exception as e:
-        return f"Error calling tool {tool_name}: {str(e)}"
+    with tracing.span("mcp.call_tool", tool=tool_name, url=url) as span:
+        try:
+            resp = await connections.call_tool(url, tool_name, params)
+            if resp.content:
+                texts = [c.text for c in resp.content if getattr(c, "text", None)]
+                return "\n".join(texts)
+            return f"No response from tool {tool_name}"
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"calling tool {tool_name}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
 
 async def _mcp_read_resource(resource_uri: str, url: str) -> str:
     """Read an MCP resource and return the content"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                
-                res = await session.read_resource(resource_uri)
-                
-                # Debug output
-                print(f"DEBUG: Reading resource {resource_uri}")
-                print(f"DEBUG: Response type: {type(res)}")
-                print(f"DEBUG: Has contents: {hasattr(res, 'contents')}")
-                
-                texts: List[str] = []
+    with tracing.span("mcp.read_resource", uri=resource_uri, url=url) as span:
+        try:
+            res = await connections.read_resource(url, resource_uri)
+            
+            # Debug output (formatting is skipped entirely unless DEBUG is enabled)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("Reading resource %s", resource_uri)
+                logger.debug("Response type: %s", type(res))
+                logger.debug("Has contents: %s", hasattr(res, 'contents'))
+            
+            texts: List[str] = []
+            
+            # Handle different response formats
+            if hasattr(res, 'contents') and res.contents:
+                if debug:
+                    logger.debug("Contents count: %s", len(res.contents))
+                for i, item in enumerate(res.contents):
+                    if debug:
+                        logger.debug("Content %s type: %s", i, type(item))
                 
-                # Handle different response formats
-                if hasattr(res, 'contents') and res.contents:
-                    print(f"DEBUG: Contents count: {len(res.contents)}")
-                    for i, item in enumerate(res.contents):
-                        print(f"DEBUG: Content {i} type: {type(item)}")
-                        
-                        # Handle text content
-                        if hasattr(item, 'text') and item.text:
+                    # Handle text content
+                    if hasattr(item, 'text') and item.text:
+                        texts.append(item.text)
+                        if debug:
+                            logger.debug("Added text from item.text: %s chars", len(item.text))
+                    elif isinstance(item, dict) and item.get('text'):
+                        texts.append(item['text'])
+                        if debug:
+                            logger.debug("Added text from dict: %s chars", len(item['text']))
+                    elif hasattr(item, 'type') and item.type == 'text':
+                        if hasattr(item, 'text'):
                             texts.append(item.text)
-                            print(f"DEBUG: Added text from item.text: {len(item.text)} chars")
-                        elif isinstance(item, dict) and item.get('text'):
-                            texts.append(item['text'])
-                            print(f"DEBUG: Added text from dict: {len(item['text'])} chars")
-                        elif hasattr(item, 'type') and item.type == 'text':
-                            if hasattr(item, 'text'):
-                                texts.append(item.text)
-                                print(f"DEBUG: Added text from typed item: {len(item.text)} chars")
-                
-                # Fallback: check if res itself has text
-                elif hasattr(res, 'text') and res.text:
-                    texts.append(res.text)
-                    print(f"DEBUG: Added text from direct response: {len(res.text)} chars")
-                
-                # Another fallback: check if it's a string response
-                elif isinstance(res, str):
-                    texts.append(res)
-                    print(f"DEBUG: Response is direct string: {len(res)} chars")
-                
-                result = "\n".join(texts).strip()
-                print(f"DEBUG: Final result length: {len(result)} chars")
-                
-                if result:
-                    return result
-                else:
-                    # Debug: show all attributes of the response
-                    attrs = [attr for attr in dir(res) if not attr.startswith('_')]
-                    return f"No content found for resource: {resource_uri}. Available attributes: {attrs}"
-                
-    except Exception as e:
-        return f"Error reading resource {resource_uri}: {str(e)}"
+                            if debug:
+                                logger.debug("Added text from typed item: %s chars", len(item.text))
+            
+            # Fallback: check if res itself has text
+            elif hasattr(res, 'text') and res.text:
+                texts.append(res.text)
+                if debug:
+                    logger.debug("Added text from direct response: %s chars", len(res.text))
+            
+            # Another fallback: check if it's a string response
+            elif isinstance(res, str):
+                texts.append(res)
+                if debug:
+                    logger.debug("Response is direct string: %s chars", len(res))
+            
+            result = "\n".join(texts).strip()
+            if debug:
+                logger.debug("Final result length: %s chars", len(result))
+            
+            if result:
+                return result
+            else:
+                # Debug: show all attributes of the response
+                attrs = [attr for attr in dir(res) if not attr.startswith('_')]
+                return f"No content found for resource: {resource_uri}. Available attributes: {attrs}"
+            
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"reading resource {resource_uri}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
 
 async def _mcp_get_prompt(prompt_name: str, args: dict, url: str) -> str:
     """Get an MCP prompt with arguments"""
-    try:
-        async with streamablehttp_client(url) as (read, write, _sid):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                
-                result = await session.get_prompt(prompt_name, args)
-                
-                pieces: List[str] = []
-                
-                if hasattr(result, 'messages') and result.messages:
-                    for msg in result.messages:
-                        if hasattr(msg, 'content') and msg.content:
-                            for c in msg.content:
-                                if hasattr(c, 'text') and c.text:
-                                    pieces.append(c.text)
-                                elif isinstance(c, dict) and c.get('text'):
-                                    pieces.append(c['text'])
-                
-                return "\n".join(pieces).strip()
-                
-    except Exception as e:
-        return f"Error getting prompt {prompt_name}: {str(e)}"
+    with tracing.span("mcp.get_prompt", prompt=prompt_name, url=url) as span:
+        try:
+            result = await connections.get_prompt(url, prompt_name, args)
+            
+            pieces: List[str] = []
+            
+            if hasattr(result, 'messages') and result.messages:
+                for msg in result.messages:
+                    if hasattr(msg, 'content') and msg.content:
+                        # PromptMessage.content is a single content block, not a list
+                        contents = msg.content if isinstance(msg.content, list) else [msg.content]
+                        for c in contents:
+                            if hasattr(c, 'text') and c.text:
+                                pieces.append(c.text)
+                            elif isinstance(c, dict) and c.get('text'):
+                                pieces.append(c['text'])
+            
+            return "\n".join(pieces).strip()
+            
+        except Exception as e:
+            reply = resilience.failure_reply(url, f"getting prompt {prompt_name}", e)
+            if reply is None:
+                raise  # a bug, not an answer or an outage: the agent's tool node reports it
+            span.fail(e)
+            return reply
+
+# ---------- Server Catalogs ----------
+
+# Until the first catalog listing (then kept on disk, see catalog.py)
+DEFAULT_POLICIES = ["shipping_policy", "return_policy", "refund_policy", "warranty_policy"]
+
+def available_prompts() -> List[str]:
+    """Prompt names from the cached catalog; never waits on the server"""
+    return connections.catalog.names("prompts", "prompts")
+
+def available_policies() -> List[str]:
+    """Policy names (shipping_policy, ...) from the cached resources catalog"""
+    policies = [uri.split("://", 1)[1] for uri in connections.catalog.names("resources", "resources")
+                if uri.startswith("policy://") and uri != "policy://list_all"]
+    return policies or DEFAULT_POLICIES
 
 # ---------- Enhanced Tool Wrappers ----------
 
@@ -176,39 +229,39 @@ def extract_ids_from_response(response: str) -> None:
 class TicketInput(BaseModel):
     ticket_id: str = Field(..., description="The ticket ID to look up")
 
-def get_ticket_status_tool(ticket_id: str) -> str:
+async def get_ticket_status_tool(ticket_id: str) -> str:
     """Get ticket status and remember the ticket ID"""
     memory.add_ticket(ticket_id)
-    result = asyncio.run(_mcp_call_tool("get_ticket_status", {"ticket_id": ticket_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_ticket_status", {"ticket_id": ticket_id}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
 class OrderInput(BaseModel):
     order_id: str = Field(..., description="The order ID to look up")
 
-def get_order_info_tool(order_id: str) -> str:
+async def get_order_info_tool(order_id: str) -> str:
     """Get order information and remember the order ID"""
     memory.add_order(order_id)
-    result = asyncio.run(_mcp_call_tool("get_order_info", {"order_id": order_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_order_info", {"order_id": order_id}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
 class CustomerInput(BaseModel):
     customer_id: str = Field(..., description="The customer ID to look up")
 
-def get_customer_details_tool(customer_id: str) -> str:
+async def get_customer_details_tool(customer_id: str) -> str:
     """Get customer details and remember the customer ID"""
     memory.add_customer(customer_id)
-    result = asyncio.run(_mcp_call_tool("get_customer_details", {"customer_id": customer_id}, TOOLS_URL))
+    result = await _mcp_call_tool("get_customer_details", {"customer_id": customer_id}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
 class PolicyInput(BaseModel):
     policy_type: str = Field(..., description="Policy type: shipping_policy, return_policy, refund_policy, warranty_policy, or list_all")
 
-def get_policy_tool(policy_type: str) -> str:
+async def get_policy_tool(policy_type: str) -> str:
     """Retrieve company policy documents from database"""
-    print(f"DEBUG: get_policy_tool called with policy_type: {policy_type}")
+    logger.debug("get_policy_tool called with policy_type: %s", policy_type)
     
     # Map common variations to correct policy names
     policy_mapping = {
@@ -228,12 +281,12 @@ def get_policy_tool(policy_type: str) -> str:
     if not normalized_policy.endswith("_policy") and normalized_policy != "list_all":
         normalized_policy += "_policy"
     
-    print(f"DEBUG: Normalized policy: {normalized_policy}")
+    logger.debug("Normalized policy: %s", normalized_policy)
     
     resource_uri = f"policy://{normalized_policy}"
-    result = asyncio.run(_mcp_read_resource(resource_uri, RESOURCES_URL))
+    result = await _mcp_read_resource(resource_uri, RESOURCES_URL)
     
-    print(f"DEBUG: Policy result length: {len(result)} chars")
+    logger.debug("Policy result length: %d chars", len(result))
     
     return result
 
@@ -241,9 +294,9 @@ class ReturnInput(BaseModel):
     reference_id: str = Field(..., description="Ticket or order ID to process return for")
     reason: str = Field(default="Customer request", description="Reason for return")
 
-def initiate_return_tool(reference_id: str, reason: str = "Customer request") -> str:
+async def initiate_return_tool(reference_id: str, reason: str = "Customer request") -> str:
     """Initiate a return process"""
-    result = asyncio.run(_mcp_call_tool("initiate_return", {"reference_id": reference_id, "reason": reason}, TOOLS_URL))
+    result = await _mcp_call_tool("initiate_return", {"reference_id": reference_id, "reason": reason}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
@@ -252,13 +305,24 @@ class EscalationInput(BaseModel):
     department: str = Field(..., description="Department to escalate to")
     notes: str = Field(default="", description="Additional notes for escalation")
 
-def escalate_ticket_tool(ticket_id: str, department: str, notes: str = "") -> str:
+async def escalate_ticket_tool(ticket_id: str, department: str, notes: str = "") -> str:
     """Escalate a ticket to another department"""
     memory.add_ticket(ticket_id)
-    result = asyncio.run(_mcp_call_tool("escalate_ticket", {"ticket_id": ticket_id, "department": department, "notes": notes}, TOOLS_URL))
+    result = await _mcp_call_tool("escalate_ticket", {"ticket_id": ticket_id, "department": department, "notes": notes}, TOOLS_URL)
     extract_ids_from_response(result)
     return result
 
+class TicketStatsInput(BaseModel):
+    status: str = Field(default="", description="Only tickets with this status: pending, in_progress, resolved")
+    priority: str = Field(default="", description="Only tickets with this priority: low, medium, high, urgent")
+    department: str = Field(default="", description="Only tickets escalated to this department")
+    tier: str = Field(default="", description="Only tickets of customers in this tier: standard, premium")
+
+async def ticket_stats_tool(status: str = "", priority: str = "", department: str = "", tier: str = "") -> str:
+    """Count tickets, optionally filtered"""
+    return await _mcp_call_tool(
+        "ticket_stats", {"status": status, "priority": priority, "department": department, "tier": tier}, TOOLS_URL)
+
 class PromptInput(BaseModel):
     prompt_name: str = Field(..., description="Name of the prompt template")
     customer_name: str = Field(default="", description="Customer name")
@@ -266,16 +330,25 @@ class PromptInput(BaseModel):
     customer_tier: str = Field(default="standard", description="Customer tier")
     urgency_level: str = Field(default="medium", description="Urgency level")
 
-def get_support_prompt_tool(prompt_name: str, customer_name: str = "", issue_description: str = "", 
+async def get_support_prompt_tool(prompt_name: str, customer_name: str = "", issue_description: str = "", 
                           customer_tier: str = "standard", urgency_level: str = "medium") -> str:
     """Get a support prompt template"""
+    if not await connections.catalog.contains("prompts", "prompts", prompt_name) and available_prompts():
+        return f"Unknown prompt '{prompt_name}'. Available prompts: {', '.join(available_prompts())}"
     args = {
         "customer_name": customer_name,
         "issue_description": issue_description,
         "customer_tier": customer_tier,
         "urgency_level": urgency_level
     }
-    return asyncio.run(_mcp_get_prompt(prompt_name, args, PROMPTS_URL))
+    return await _mcp_get_prompt(prompt_name, args, PROMPTS_URL)
+
+class RecallInput(BaseModel):
+    handle: str = Field(..., description="Handle of an earlier tool result, e.g. ref-3")
+
+async def recall_result_tool(handle: str) -> str:
+    """Return a tool result from earlier in the conversation without calling the server again"""
+    return sessions.recall(handle)
 
 # ---------- Direct Policy Functions ----------
 
@@ -302,63 +375,88 @@ async def get_policy_direct(policy_type: str) -> str:
 
 # ---------- Create Structured Tools ----------
 
+@lru_cache(maxsize=None)
 def create_tools():
     """Create all the structured tools for the agent"""
     return [
         StructuredTool.from_function(
-            func=get_ticket_status_tool,
+            coroutine=get_ticket_status_tool,
             name="get_ticket_status",
             description="Get status and details of a support ticket by ID",
             args_schema=TicketInput
         ),
         StructuredTool.from_function(
-            func=get_order_info_tool,
+            coroutine=get_order_info_tool,
             name="get_order_info", 
             description="Get order information including items, status, and total",
             args_schema=OrderInput
         ),
         StructuredTool.from_function(
-            func=get_customer_details_tool,
+            coroutine=get_customer_details_tool,
             name="get_customer_details",
             description="Get customer information including name, email, tier, and order history",
             args_schema=CustomerInput
         ),
         StructuredTool.from_function(
-            func=get_policy_tool,
+            coroutine=get_policy_tool,
             name="get_policy",
             description="Get company policy documents from database. Use: shipping_policy, return_policy, refund_policy, warranty_policy, or list_all",
             args_schema=PolicyInput
         ),
         StructuredTool.from_function(
-            func=initiate_return_tool,
+            coroutine=initiate_return_tool,
             name="initiate_return",
             description="Initiate a return process for a ticket or order",
             args_schema=ReturnInput
         ),
         StructuredTool.from_function(
-            func=escalate_ticket_tool,
+            coroutine=escalate_ticket_tool,
             name="escalate_ticket",
             description="Escalate a ticket to higher priority or different department",
             args_schema=EscalationInput
         ),
         StructuredTool.from_function(
-            func=get_support_prompt_tool,
+            coroutine=ticket_stats_tool,
+            name="ticket_stats",
+            description="Count tickets by status, priority, department and customer tier, e.g. how many high-priority tickets are pending",
+            args_schema=TicketStatsInput
+        ),
+        StructuredTool.from_function(
+            coroutine=get_support_prompt_tool,
             name="get_support_prompt",
             description="Get support prompt templates for various scenarios",
             args_schema=PromptInput
+        ),
+        StructuredTool.from_function(
+            coroutine=recall_result_tool,
+            name="recall_result",
+            description="Show the full text of an earlier tool result by its ref-N handle instead of looking it up again",
+            args_schema=RecallInput
         )
     ]
 
-def create_agent():
+# The compiled graph for the configured model; built once per process
+_default_agent = None
+
+def create_agent(llm=None):
     """Create the conversational agent with memory-aware system prompt"""
-    llm = ChatGroq(
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        model="llama-3.3-70b-versatile",
-        temperature=0.1,  # Lower temperature for more consistent tool usage
-    )
+    global _default_agent
+    if llm is None and _default_agent is not None:
+        return _default_agent
+    # Deferred so importing this module (and printing the banner) stays cheap
+    from langgraph.prebuilt import create_react_agent
+    
+    use_default = llm is None
+    # Model comes from the factory (COPILOT_MODEL_PROVIDER) unless one is passed in
+    if llm is None:
+        llm = create_chat_model(temperature=0.1)  # Lower temperature for more consistent tool usage
     
     tools = create_tools()
     
+    if os.getenv("COPILOT_LLM_SUMMARY") == "1":
+        # Compact old turns with the model (in the background) instead of the extractive default
+        sessions.summarizer = llm_summarizer(llm)
+    
     def create_system_message():
         base_prompt = """You are a helpful customer support assistant with access to various tools and company information.
 
@@ -372,15 +470,17 @@ Key behaviors:
 5. Provide complete, detailed responses using the tool results
 6. Ask clarifying questions when needed
 7. Link related information (tickets to orders, customers to their data)
+8. Earlier tool results appear as ref-N handles - use recall_result instead of looking the same thing up again
 
 Available tools allow you to:
 - Look up ticket status and details
 - Get order information
 - Retrieve customer details  
-- Access company policies from SQLite database (shipping_policy, return_policy, refund_policy, warranty_policy)
+- Access company policies from SQLite database (""" + ", ".join(available_policies()) + """)
 - Initiate returns
 - Escalate tickets
-- Generate support prompts
+- Count tickets by status, priority, department and customer tier
+- Generate support prompts (""" + (", ".join(available_prompts()) or "see get_support_prompt") + """)
 
 Current conversation context: """ + memory.get_context_summary()
         
@@ -391,49 +491,75 @@ Current conversation context: """ + memory.get_context_summary()
     # Store the system message creator for dynamic updates
     agent._create_system_message = create_system_message
     
+    if use_default:
+        _default_agent = agent
     return agent
 
-async def process_query(agent, user_input: str) -> str:
+async def _direct_policy_answer(user_input: str) -> Optional[str]:
+    """Answer plain policy questions straight from the resources server, skipping the agent"""
+    policy_keywords = ["policy", "return", "shipping", "refund", "warranty"]
+    if not any(keyword in user_input.lower() for keyword in policy_keywords):
+        return None
+    logger.debug("Policy-related query detected")
+    
+    # Try to identify specific policy type
+    if "return policy" in user_input.lower():
+        policy_type, label = "return_policy", "return"
+    elif "shipping" in user_input.lower():
+        policy_type, label = "shipping_policy", "shipping"
+    elif "refund" in user_input.lower():
+        policy_type, label = "refund_policy", "refund"
+    elif "warranty" in user_input.lower():
+        policy_type, label = "warranty_policy", "warranty"
+    else:
+        return None
+    
+    policy_result = await get_policy_direct(policy_type)
+    if policy_result and not policy_result.startswith("Error") and not policy_result.startswith("No content"):
+        return f"Here's our {label} policy:\n\n{policy_result}"
+    return None
+
+def _build_messages(agent, user_input: str, session_id: str) -> List[Any]:
+    """System prompt, then this session's history window, then the new user message"""
+    return [
+        SystemMessage(content=agent._create_system_message()),
+        *sessions.get(session_id).messages(),
+        HumanMessage(content=user_input)
+    ]
+
+async def process_query(agent, user_input: str, session_id: str = "default") -> str:
     """Process a user query and return the response"""
+    with tracing.span("copilot.process_query", session=session_id), budget.turn(), sessions.active(session_id):
+        return await _process_query(agent, user_input, session_id)
+
+async def _process_query(agent, user_input: str, session_id: str) -> str:
     # Extract any IDs from user input and remember them
     extract_ids_from_response(user_input)
+    history = sessions.get(session_id)
     
     # Check if user is asking for policy directly - handle it without agent if needed
-    policy_keywords = ["policy", "return", "shipping", "refund", "warranty"]
-    if any(keyword in user_input.lower() for keyword in policy_keywords):
-        print("DEBUG: Policy-related query detected")
-        
-        # Try to identify specific policy type
-        if "return policy" in user_input.lower():
-            policy_result = await get_policy_direct("return_policy")
-            if policy_result and not policy_result.startswith("Error") and not policy_result.startswith("No content"):
-                return f"Here's our return policy:\n\n{policy_result}"
-        elif "shipping" in user_input.lower():
-            policy_result = await get_policy_direct("shipping_policy")
-            if policy_result and not policy_result.startswith("Error") and not policy_result.startswith("No content"):
-                return f"Here's our shipping policy:\n\n{policy_result}"
-        elif "refund" in user_input.lower():
-            policy_result = await get_policy_direct("refund_policy")
-            if policy_result and not policy_result.startswith("Error") and not policy_result.startswith("No content"):
-                return f"Here's our refund policy:\n\n{policy_result}"
-        elif "warranty" in user_input.lower():
-            policy_result = await get_policy_direct("warranty_policy")
-            if policy_result and not policy_result.startswith("Error") and not policy_result.startswith("No content"):
-                return f"Here's our warranty policy:\n\n{policy_result}"
-    
-    # Create dynamic system message with current context
-    system_message = agent._create_system_message()
+    direct_answer = await _direct_policy_answer(user_input)
+    if direct_answer:
+        history.add_turn([HumanMessage(content=user_input), AIMessage(content=direct_answer)])
+        return direct_answer
+    
+    messages = _build_messages(agent, user_input, session_id)
     
     try:
-        result = await agent.ainvoke({
-            "messages": [
-                SystemMessage(content=system_message),
-                HumanMessage(content=user_input)
-            ]
-        })
+        result, finished = await run_agent(agent, {"messages": messages}, config=tracing.agent_config(),
+                                           deadline=budget.deadline())
+        if not finished:
+            # Out of time: answer with whatever the tools returned so far
+            response = budget.fallback_answer("", [str(m.content) for m in result[len(messages):]
+                                                   if isinstance(m, ToolMessage)])
+            history.add_turn([HumanMessage(content=user_input), AIMessage(content=response)])
+            return response
+        
+        # Keep this turn (from the user message on) in the session history
+        history.add_turn(result[len(messages) - 1:])
         
         # Extract IDs from the response too
-        response = result["messages"][-1].content
+        response = result[-1].content
         extract_ids_from_response(response)
         
         return response
@@ -441,6 +567,38 @@ async def process_query(agent, user_input: str) -> str:
     except Exception as e:
         return f"Sorry, I encountered an error: {str(e)}"
 
+async def stream_query(agent, user_input: str, session_id: str = "default") -> AsyncIterator[StreamEvent]:
+    """Streaming variant of process_query - yields tokens and tool progress as they happen"""
+    # The turn runs in a task of its own, so its span, budget and session are set and reset
+    # there, not across our yields into the consumer's context
+    async for event in budget.within(_stream_turn(agent, user_input, session_id), None):
+        yield event
+
+async def _stream_turn(agent, user_input: str, session_id: str) -> AsyncIterator[StreamEvent]:
+    timing = TurnTiming()
+    extract_ids_from_response(user_input)
+    history = sessions.get(session_id)
+    
+    with tracing.span("copilot.stream_query", session=session_id) as span, budget.turn(), \
+            sessions.active(session_id):
+        direct_answer = await _direct_policy_answer(user_input)
+        if direct_answer:
+            messages = [HumanMessage(content=user_input)]
+            events = stream_text(direct_answer, timing)
+        else:
+            messages = _build_messages(agent, user_input, session_id)
+            events = stream_agent(agent, {"messages": messages}, timing, config=tracing.agent_config(),
+                                  deadline=budget.deadline())
+        
+        async for event in events:
+            if event.kind == "done":
+                extract_ids_from_response(event.text)
+                history.add_turn(event.messages[len(messages) - 1:] if event.messages
+                                 else [HumanMessage(content=user_input), AIMessage(content=event.text)])
+            yield event
+        span.set(ttfb_ms=timing.ttfb and round(timing.ttfb * 1000, 3))
+    turn_timings.record(timing)
+
 def print_welcome():
     """Print welcome message and instructions"""
     print("\n" + "="*60)
@@ -455,6 +613,7 @@ def print_welcome():
     print("\nJust ask me anything! I'll remember context as we chat.")
     print("Type 'quit', 'exit', or 'bye' to end the conversation.")
     print("Type 'memory' to see what I remember about our conversation.")
+    print("Type 'timing' to see response latency (time-to-first-byte).")
     print("Type 'test-policy' to test policy reading directly.")
     print("-" * 60)
 
@@ -464,8 +623,14 @@ def print_memory_status():
     print(f"  Tickets: {', '.join(memory.ticket_ids) if memory.ticket_ids else 'None'}")
     print(f"  Orders: {', '.join(memory.order_ids) if memory.order_ids else 'None'}")
     print(f"  Customers: {', '.join(memory.customer_ids) if memory.customer_ids else 'None'}")
+    print(f"  History: {sessions.describe()}")
     print()
 
+def print_timing_status():
+    """Print time-to-first-byte and total latency for recent turns"""
+    print("\n⏱️ RESPONSE TIMING:")
+    print(json.dumps(turn_timings.summary(), indent=2))
+
 async def test_policy_reading():
     """Test policy reading directly"""
     print("\n🧪 TESTING POLICY READING...")
@@ -487,9 +652,12 @@ async def test_policy_reading():
 
 async def main():
     """Main conversation loop"""
+    logging.basicConfig(level=os.getenv("COPILOT_LOG_LEVEL", "WARNING"),
+                        format="%(levelname)s %(name)s: %(message)s")
     print_welcome()
     
     agent = create_agent()
+    connections.prewarm()
     
     while True:
         try:
@@ -508,14 +676,21 @@ async def main():
             if user_input.lower() == 'test-policy':
                 await test_policy_reading()
                 continue
+            
+            if user_input.lower() == 'timing':
+                print_timing_status()
+                continue
                 
             if not user_input:
                 continue
             
             # Process the query
-            print("\n🤖 Assistant: ", end="")
-            response = await process_query(agent, user_input)
-            print(response)
+            print("\n🤖 Assistant: ", end="", flush=True)
+            if STREAMING:
+                await print_stream(stream_query(agent, user_input))
+            else:
+                response = await process_query(agent, user_input)
+                print(response)
             
         except KeyboardInterrupt:
             print("\n\n👋 Thanks for using Customer Support Copilot! Have a great day!")
@@ -523,6 +698,8 @@ async def main():
         except Exception as e:
             print(f"\n❌ Error: {str(e)}")
             print("Please try again.")
+    
+    await connections.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,100 @@
+# customer_context.py
+"""
+Structured customer context shared by the copilot and the prompts server.
+
+The copilot builds a CustomerContext once from the parsed tool results and
+sends it as a prompt argument (JSON). FastMCP validates it back into this
+model, so no free-text situation string has to be parsed on the server.
+"""
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict
+
+class OrderSummary(BaseModel):
+    """The parts of an order the prompts refer to"""
+    model_config = ConfigDict(frozen=True)
+
+    order_id: str
+    status: str = ""
+    items: Tuple[str, ...] = ()
+    total: Optional[float] = None
+    order_date: str = ""
+
+    @classmethod
+    def from_order_data(cls, order_id: str, order: Dict[str, Any]) -> "OrderSummary":
+        return cls(
+            order_id=order.get("order_id", order_id),
+            status=order.get("status", ""),
+            items=tuple(order.get("items", [])),
+            total=order.get("total"),
+            order_date=order.get("order_date", ""),
+        )
+
+class CustomerContext(BaseModel):
+    """Who the customer is and what they recently did (frozen, so it can key caches)"""
+    model_config = ConfigDict(frozen=True)
+
+    customer_id: str = ""
+    name: str = ""
+    tier: str = "standard"
+    email: str = ""
+    recent_order: Optional[OrderSummary] = None
+    recent_ticket_id: str = ""
+
+    @property
+    def has_premium(self) -> bool:
+        return self.tier.lower() == "premium"
+
+    @classmethod
+    def from_customer_data(cls, customer: Dict[str, Any], customer_id: str = "",
+                           recent_order: Optional[OrderSummary] = None) -> "CustomerContext":
+        """Build from a parsed get_customer_details result"""
+        orders = customer.get("order_details", [])
+        tickets = customer.get("ticket_details", [])
+        if recent_order is None and orders:
+            recent_order = OrderSummary.from_order_data(orders[-1].get("order_id", ""), orders[-1])
+        return cls(
+            customer_id=customer.get("customer_id", customer_id),
+            name=customer.get("name", ""),
+            tier=customer.get("tier", "standard"),
+            email=customer.get("email", ""),
+            recent_order=recent_order,
+            recent_ticket_id=tickets[-1].get("ticket_id", "") if tickets else "",
+        )
+
+    def situation(self) -> str:
+        """Human-readable one-liner for the CUSTOMER SITUATION section of a prompt"""
+        if not self.name:
+            return "General inquiry"
+        situation = f"Customer: {self.name} ({self.tier} tier)"
+        if self.recent_order:
+            situation += f" | Recent order {self.recent_order.order_id}: {', '.join(self.recent_order.items)}"
+        return situation
+
+    def recent_activity(self) -> str:
+        activity = []
+        if self.recent_order:
+            activity.append(f"recent order {self.recent_order.order_id}")
+        if self.recent_ticket_id:
+            activity.append(f"ticket {self.recent_ticket_id}")
+        return " and ".join(activity)
+
+    def customer_info(self) -> str:
+        if not self.name:
+            return ""
+        return f"{self.name} ({self.tier} tier), {self.email}".rstrip(", ")
+
+    def order_info(self) -> str:
+        order = self.recent_order
+        if order is None:
+            return ""
+        details = [f"Order {order.order_id}"]
+        if order.status:
+            details.append(f"status {order.status}")
+        if order.items:
+            details.append(f"items {', '.join(order.items)}")
+        if order.total is not None:
+            details.append(f"total ${order.total:.2f}")
+        if order.order_date:
+            details.append(f"ordered {order.order_date}")
+        return ", ".join(details)
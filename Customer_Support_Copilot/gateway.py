@@ -0,0 +1,35 @@
+# gateway.py
+"""
+MCP Gateway - serves the tools, resources and prompts servers from one
+process behind one streamable-http endpoint.
+
+Each server is mounted under its own namespace, so names become
+tools_get_ticket_status, prompts_smart_greeting and
+policy://resources/shipping_policy. Run the copilot with
+COPILOT_MCP_TRANSPORT=gateway to reach everything through one session.
+"""
+from fastmcp import FastMCP
+
+import prompts
+import resources
+import tools
+import tracing
+from middleware import install_list_changed
+
+# --- Create FastMCP server ---
+mcp = FastMCP("Customer Support Gateway")
+
+for namespace, server in (("tools", tools.mcp), ("resources", resources.mcp), ("prompts", prompts.mcp)):
+    mcp.mount(server, prefix=namespace)
+
+# Catalog changes in any mounted server are announced to the gateway's clients
+install_list_changed(mcp)
+
+# Mounted servers keep their own middleware; spans are reported under one service name
+tracing.configure(service="gateway")
+
+if __name__ == "__main__":
+    try:
+        mcp.run(transport="streamable-http", port=8000)
+    except Exception as e:
+        print(f"Failed to start gateway: {e}")
@@ -0,0 +1,219 @@
+# history.py
+"""
+Per-session conversation history for the copilot.
+
+Keeps the last few turns verbatim (sliding window), folds older turns into a
+running summary in a background task, and swaps raw tool results for short
+handles that the agent can expand again with the recall_result tool. Each
+session has its own handles, so one session can't recall another's results.
+"""
+import asyncio
+import contextvars
+import json
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# How much of a tool result stays inline next to its handle
+PREVIEW_CHARS = 160
+
+# Least recently used results / sessions beyond these are dropped
+MAX_RESULTS = 200      # per session
+MAX_SESSIONS = 1000
+
+# The session whose turn is running, for tools (recall_result) called by the shared agent
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("history_session", default=None)
+
+@dataclass
+class ToolResult:
+    """A raw tool result kept outside the transcript"""
+    handle: str
+    tool: str
+    args: Dict
+    content: str
+
+    def label(self) -> str:
+        args = ", ".join(f"{k}={v}" for k, v in self.args.items())
+        return f"{self.handle} {self.tool}({args})"
+
+class ToolResultStore:
+    """Holds raw tool results under short, referenceable handles like ref-3; keeps the max_results last used"""
+
+    def __init__(self, max_results: int = MAX_RESULTS):
+        self.max_results = max_results
+        self._results: "OrderedDict[str, ToolResult]" = OrderedDict()
+        self._counter = 0
+
+    def put(self, tool: str, args: Dict, content: str) -> ToolResult:
+        self._counter += 1
+        result = ToolResult(f"ref-{self._counter}", tool, args, content)
+        self._results[result.handle] = result
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        return result
+
+    def get(self, handle: str) -> Optional[ToolResult]:
+        result = self._results.get(handle.strip())
+        if result is not None:
+            self._results.move_to_end(result.handle)
+        return result
+
+Summarizer = Callable[[str, List[List[BaseMessage]]], Awaitable[str]]
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return " ".join(str(content).split())
+
+async def extractive_summarizer(summary: str, turns: List[List[BaseMessage]]) -> str:
+    """Cheap default: one line per turn with the question, answer and tool handles"""
+    lines = [summary] if summary else []
+    for turn in turns:
+        question = next((_text(m) for m in turn if isinstance(m, HumanMessage)), "")
+        answer = _text(turn[-1]) if isinstance(turn[-1], AIMessage) else ""
+        handles = [m.content.split("]")[0].lstrip("[") for m in turn
+                   if isinstance(m, ToolMessage) and str(m.content).startswith("[ref-")]
+        line = f"- User: {question[:120]}"
+        if handles:
+            line += f" | looked up: {', '.join(handles)}"
+        if answer:
+            line += f" | Assistant: {answer[:200]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def llm_summarizer(llm) -> Summarizer:
+    """Summarize with the chat model instead - better compression, costs an LLM call"""
+    async def summarize(summary: str, turns: List[List[BaseMessage]]) -> str:
+        transcript = "\n".join(
+            f"{type(m).__name__.replace('Message', '')}: {_text(m)[:500]}"
+            for turn in turns for m in turn
+        )
+        response = await llm.ainvoke([
+            SystemMessage(content=(
+                "Update the running summary of a customer support conversation. "
+                "Keep ticket, order and customer IDs, names, decisions and any ref-N handles. "
+                "Reply with the updated summary only, under 150 words."
+            )),
+            HumanMessage(content=f"CURRENT SUMMARY:\n{summary or '(empty)'}\n\nNEW TURNS:\n{transcript}")
+        ])
+        return _text(response)
+    return summarize
+
+@dataclass
+class SessionHistory:
+    """Sliding window of recent turns plus a running summary of older ones"""
+    store: ToolResultStore = field(default_factory=ToolResultStore)
+    window_turns: int = 4
+    summarizer: Summarizer = extractive_summarizer
+    summary: str = ""
+    turns: Deque[List[BaseMessage]] = field(default_factory=deque)
+    _pending: List[List[BaseMessage]] = field(default_factory=list)
+    _task: Optional[asyncio.Task] = None
+
+    def messages(self) -> List[BaseMessage]:
+        """Messages to send ahead of the new user input"""
+        summary = self.summary
+        if self._pending:
+            # Turns evicted while the background summary is still running
+            summary = "\n".join(filter(None, [summary, *(
+                f"- User: {_text(turn[0])[:120]}" for turn in self._pending)]))
+        history: List[BaseMessage] = []
+        if summary:
+            history.append(SystemMessage(content=(
+                "Summary of earlier conversation (use recall_result with a ref-N handle "
+                f"to see a stored tool result again):\n{summary}"
+            )))
+        for turn in self.turns:
+            history.extend(turn)
+        return history
+
+    def add_turn(self, messages: List[BaseMessage]):
+        """Record a finished turn (user message through final answer)"""
+        self.turns.append(self._compact_tool_results(messages))
+        evicted = []
+        while len(self.turns) > self.window_turns:
+            evicted.append(self.turns.popleft())
+        if evicted:
+            self._pending.extend(evicted)
+            if self._task is None or self._task.done():
+                self._task = asyncio.get_running_loop().create_task(self._summarize())
+
+    def _compact_tool_results(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        calls = {}
+        for message in messages:
+            for call in getattr(message, "tool_calls", None) or []:
+                calls[call["id"]] = call
+        compacted = []
+        for message in messages:
+            if isinstance(message, ToolMessage) and not str(message.content).startswith("[ref-"):
+                call = calls.get(message.tool_call_id, {})
+                result = self.store.put(call.get("name", message.name or "tool"),
+                                        call.get("args", {}), str(message.content))
+                preview = _text(message)[:PREVIEW_CHARS]
+                message = ToolMessage(
+                    content=f"[{result.handle}] {preview}{'...' if len(result.content) > PREVIEW_CHARS else ''}",
+                    tool_call_id=message.tool_call_id,
+                    name=message.name,
+                )
+            compacted.append(message)
+        return compacted
+
+    async def _summarize(self):
+        # Loop so turns evicted while we were summarizing are folded in too
+        while self._pending:
+            # The batch stays in _pending, and so in messages(), until the summary covering it is in
+            batch = list(self._pending)
+            try:
+                summary = await self.summarizer(self.summary, batch)
+            except Exception:
+                summary = await extractive_summarizer(self.summary, batch)
+            self.summary = summary
+            del self._pending[:len(batch)]
+
+class SessionStore:
+    """Conversation histories keyed by session ID; keeps the max_sessions last used"""
+
+    def __init__(self, window_turns: int = 4, summarizer: Summarizer = extractive_summarizer,
+                 max_sessions: int = MAX_SESSIONS):
+        self.window_turns = window_turns
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+
+    def get(self, session_id: str = "default") -> SessionHistory:
+        history = self._sessions.get(session_id)
+        if history is None:
+            history = self._sessions[session_id] = SessionHistory(
+                window_turns=self.window_turns, summarizer=self.summarizer)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return history
+
+    @contextmanager
+    def active(self, session_id: str = "default") -> Iterator[SessionHistory]:
+        """Make `session_id` the session that recall() serves inside the block (one turn)"""
+        token = _session.set(session_id)
+        try:
+            yield self.get(session_id)
+        finally:
+            _session.reset(token)
+
+    def recall(self, handle: str, session_id: Optional[str] = None) -> str:
+        """Return a stored tool result of the active session by handle (backs the recall_result tool)"""
+        result = self.get(session_id or _session.get() or "default").store.get(handle)
+        if result is None:
+            return f"No stored result for {handle}"
+        return f"{result.label()}:\n{result.content}"
+
+    def describe(self, session_id: str = "default") -> str:
+        history = self.get(session_id)
+        return json.dumps({
+            "turns_in_window": len(history.turns),
+            "summary": history.summary or None,
+        }, indent=2)
@@ -0,0 +1,152 @@
+# metrics.py
+"""
+Minimal Prometheus-style metrics registry (counters, gauges, histograms)
+rendered in the text exposition format, without extra dependencies
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds - sub-millisecond handlers up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds a server's metrics plus callbacks that report cache hit/miss counts"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._caches: Dict[Labels, Callable[[], Tuple[int, int]]] = {}
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, help_text, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def register_cache(self, name: str, stats: Callable[[], Tuple[int, int]], **labels: str):
+        """stats() returns (hits, misses); read at scrape time"""
+        self._caches[_labels({**labels, "cache": name})] = stats
+
+    def _render_caches(self) -> List[str]:
+        if not self._caches:
+            return []
+        hits, misses, ratios = [], [], []
+        for key, stats in sorted(self._caches.items()):
+            h, m = stats()
+            labels = _format_labels(key)
+            hits.append(f"mcp_cache_hits_total{labels} {h}")
+            misses.append(f"mcp_cache_misses_total{labels} {m}")
+            ratios.append(f"mcp_cache_hit_ratio{labels} {h / (h + m) if h + m else 0.0}")
+        return (["# HELP mcp_cache_hits_total Cache hits", "# TYPE mcp_cache_hits_total counter"] + hits
+                + ["# HELP mcp_cache_misses_total Cache misses", "# TYPE mcp_cache_misses_total counter"] + misses
+                + ["# HELP mcp_cache_hit_ratio Hits / (hits + misses) since start", "# TYPE mcp_cache_hit_ratio gauge"] + ratios)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        lines.extend(self._render_caches())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry: servers mounted together (gateway.py) share one scrape
+REGISTRY = MetricsRegistry()
+
+def lru_cache_stats(func) -> Callable[[], Tuple[int, int]]:
+    """Adapter for functools.lru_cache-decorated functions"""
+    def stats() -> Tuple[int, int]:
+        info = func.cache_info()
+        return info.hits, info.misses
+    return stats
@@ -0,0 +1,273 @@
+# middleware.py
+"""
+FastMCP middleware shared by the tools, resources and prompts servers
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from fastmcp.exceptions import ToolError
+from fastmcp.server.dependencies import get_http_headers
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+import tracing
+from metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger("middleware")
+
+class TracingMiddleware(Middleware):
+    """Wraps every tool call, resource read and prompt render in a span.
+
+    The span is parented to the caller's span when the request carries a
+    traceparent header, so client and server spans share one trace.
+    """
+
+    def __init__(self, service: str):
+        tracing.configure(service=service)
+
+    async def _traced(self, name: str, context: MiddlewareContext, call_next, **attributes):
+        if not tracing.enabled():
+            return await call_next(context)
+        with tracing.remote_parent(get_http_headers()):
+            with tracing.span(name, **attributes):
+                return await call_next(context)
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        return await self._traced(f"mcp.server.tool {context.message.name}", context, call_next)
+
+    async def on_read_resource(self, context: MiddlewareContext, call_next):
+        return await self._traced("mcp.server.resource", context, call_next, uri=str(context.message.uri))
+
+    async def on_get_prompt(self, context: MiddlewareContext, call_next):
+        return await self._traced(f"mcp.server.prompt {context.message.name}", context, call_next)
+
+class MetricsMiddleware(Middleware):
+    """Request counts, errors, latency histograms and in-flight gauges per tool/resource/prompt"""
+
+    def __init__(self, service: str, registry: MetricsRegistry):
+        self.service = service
+        self.registry = registry
+        self.requests = registry.counter("mcp_requests_total", "MCP requests handled")
+        self.errors = registry.counter("mcp_request_errors_total", "MCP requests that raised")
+        self.latency = registry.histogram("mcp_request_duration_seconds", "MCP request latency")
+        self.in_flight = registry.gauge("mcp_requests_in_flight", "MCP requests currently being handled")
+
+    async def _measured(self, kind: str, name: str, context: MiddlewareContext, call_next):
+        labels = {"server": self.service, "kind": kind, "name": name}
+        self.in_flight.inc(server=self.service, kind=kind)
+        start = time.perf_counter()
+        try:
+            return await call_next(context)
+        except Exception:
+            self.errors.inc(**labels)
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - start, **labels)
+            self.requests.inc(**labels)
+            self.in_flight.dec(server=self.service, kind=kind)
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        return await self._measured("tool", context.message.name, context, call_next)
+
+    async def on_read_resource(self, context: MiddlewareContext, call_next):
+        return await self._measured("resource", str(context.message.uri), context, call_next)
+
+    async def on_get_prompt(self, context: MiddlewareContext, call_next):
+        return await self._measured("prompt", context.message.name, context, call_next)
+
+def install_metrics(mcp, service: str, registry: MetricsRegistry = REGISTRY) -> MetricsRegistry:
+    """Add MetricsMiddleware to a server and expose GET /metrics next to /mcp"""
+    mcp.add_middleware(MetricsMiddleware(service, registry))
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics_endpoint(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return registry
+
+class ListChangedNotifier(Middleware):
+    """Tells every connected client when a tools/resources/prompts catalog changes.
+
+    FastMCP only notifies the session whose own request changed a catalog;
+    this remembers every session that made a request and broadcasts to all
+    of them, so clients can cache catalogs until they are told otherwise.
+    Servers in one process (e.g. mounted in the gateway) share LIST_CHANGED.
+    """
+
+    KINDS = ("tools", "resources", "prompts")
+
+    def __init__(self):
+        self._sessions: "weakref.WeakSet" = weakref.WeakSet()
+        self._watches: List[Tuple[str, Callable[[], Awaitable[bool]], float]] = []
+        self._watch_tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, List[asyncio.Task]]" = weakref.WeakKeyDictionary()
+
+    async def on_request(self, context: MiddlewareContext, call_next):
+        try:
+            self._sessions.add(context.fastmcp_context.session)
+        except (AttributeError, RuntimeError):
+            pass  # no MCP session behind this request
+        self._start_watches()
+        return await call_next(context)
+
+    async def notify(self, kind: str):
+        """Send notifications/<kind>/list_changed to every live session"""
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}")
+        for session in list(self._sessions):
+            try:
+                await getattr(session, f"send_{kind[:-1]}_list_changed")()
+            except Exception:
+                self._sessions.discard(session)  # the client went away
+
+    def watch(self, kind: str, check: Callable[[], Awaitable[bool]], interval_s: float):
+        """Poll `check` (True when the catalog changed) and notify on change.
+
+        Polling starts with the first request, on the server's event loop.
+        """
+        self._watches.append((kind, check, interval_s))
+
+    def _start_watches(self):
+        loop = asyncio.get_running_loop()
+        if not self._watches or loop in self._watch_tasks:
+            return
+        # Empty context: the pollers must not inherit this request's FastMCP context
+        self._watch_tasks[loop] = [
+            contextvars.Context().run(loop.create_task, self._poll(kind, check, interval_s))
+            for kind, check, interval_s in self._watches
+        ]
+
+    async def _poll(self, kind: str, check: Callable[[], Awaitable[bool]], interval_s: float):
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                if await check():
+                    await self.notify(kind)
+            except Exception:
+                logger.exception("catalog check for %s failed", kind)
+
+# Process-wide, so a change in a mounted server reaches the gateway's clients too
+LIST_CHANGED = ListChangedNotifier()
+
+def install_list_changed(mcp, notifier: ListChangedNotifier = LIST_CHANGED) -> ListChangedNotifier:
+    """Track a server's sessions so catalog changes can be broadcast to them"""
+    mcp.add_middleware(notifier)
+    return notifier
+
+# ---------- Admission control ----------
+
+class Overloaded(ToolError):
+    """A tool call shed by admission control; retry_after_s is the server's hint"""
+
+    def __init__(self, reason: str, retry_after_s: float):
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+        super().__init__(f"Server overloaded ({reason}); retry after {retry_after_s:.2f}s")
+
+# (tool name, arguments) -> scheduling key; lower keys are admitted first. Runs on the
+# event loop, so one that reads blocking storage hands the reads to a worker thread
+Classifier = Callable[[str, Dict[str, Any]], Awaitable[Tuple[int, ...]]]
+
+class AdmissionControl(Middleware):
+    """Bounded, priority-ordered admission of tool calls.
+
+    At most max_concurrency calls run at once; the rest wait in a queue of
+    at most max_queue, ordered by classify(tool, arguments) and FIFO within
+    a key. A call that finds the queue full evicts the worst waiter if it
+    ranks better, and is shed otherwise; a waiter is also shed after
+    max_wait_s. Shed calls fail fast with Overloaded, whose retry-after hint
+    is the expected wait for a free slot. Listing, resources and prompts
+    are not limited.
+    """
+
+    def __init__(self, service: str, classify: Classifier, max_concurrency: int, max_queue: int,
+                 max_wait_s: float, registry: MetricsRegistry = REGISTRY):
+        self.service = service
+        self.classify = classify
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._active = 0
+        self._queue: List[Tuple[Tuple[int, ...], int, asyncio.Future]] = []  # heap
+        self._seq = itertools.count()
+        self._service_s = 0.01  # moving average of call duration, for the retry-after hint
+        self.shed = registry.counter("mcp_admission_shed_total", "Tool calls rejected by admission control")
+        self.queued = registry.gauge("mcp_admission_queue_depth", "Tool calls waiting for admission")
+        self.wait = registry.histogram("mcp_admission_wait_seconds", "Time tool calls waited for admission")
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        try:
+            key = await self.classify(context.message.name, context.message.arguments or {})
+        except Exception:
+            logger.exception("could not classify call to %s", context.message.name)
+            key = (float("inf"),)
+        await self._admit(key)
+        start = time.perf_counter()
+        try:
+            return await call_next(context)
+        finally:
+            self._service_s += 0.1 * (time.perf_counter() - start - self._service_s)
+            self._release()
+
+    def retry_after(self) -> float:
+        """Seconds until a slot is likely free for a new caller"""
+        rounds = (len(self._queue) + self.max_concurrency) / self.max_concurrency
+        return round(max(0.05, rounds * self._service_s), 2)
+
+    def _overloaded(self, reason: str) -> Overloaded:
+        self.shed.inc(server=self.service, reason=reason)
+        return Overloaded(reason, self.retry_after())
+
+    async def _admit(self, key: Tuple[int, ...]):
+        if self._active < self.max_concurrency and not self._queue:
+            self._active += 1
+            return
+        if len(self._queue) >= self.max_queue:
+            if not self._queue:
+                raise self._overloaded("queue_full")  # max_queue is 0: nothing may wait
+            worst = max(self._queue)  # max_queue is small; a scan is cheaper than a second heap
+            if worst[0] <= key:
+                raise self._overloaded("queue_full")
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[2].set_exception(self._overloaded("evicted"))
+        entry = (key, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, entry)
+        self.queued.set(len(self._queue), server=self.service)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(entry[2], self.max_wait_s)
+        except asyncio.TimeoutError:
+            raise self._overloaded("queue_timeout") from None
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+                self._release()  # handed a slot just as the caller went away
+            raise
+        finally:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            self.queued.set(len(self._queue), server=self.service)
+            self.wait.observe(time.perf_counter() - start, server=self.service, priority=str(key[0]))
+
+    def _release(self):
+        """Hand the finished call's slot to the best waiter, or free it"""
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+def install_admission_control(mcp, service: str, classify: Classifier, max_concurrency: int, max_queue: int,
+                              max_wait_s: float, registry: MetricsRegistry = REGISTRY) -> AdmissionControl:
+    """Limit and prioritise a server's tool calls; add after the tracing and metrics middleware"""
+    admission = AdmissionControl(service, classify, max_concurrency, max_queue, max_wait_s, registry)
+    mcp.add_middleware(admission)
+    return admission
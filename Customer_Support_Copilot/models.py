@@ -0,0 +1,102 @@
+# models.py
+"""
+Chat model factory for the copilot.
+
+COPILOT_MODEL_PROVIDER picks the backend: "groq" (default) or "scripted",
+a deterministic fake that replays preset tool calls and answers. The fake
+lets the agent graph, tool wrappers and MCP hops be profiled offline.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+DEFAULT_GROQ_MODEL = "llama-3.3-70b-versatile"
+
+class ScriptedChatModel(BaseChatModel):
+    """Fake chat model that returns preset steps in order.
+
+    Each step is either {"tool": name, "args": {...}} (emits a tool call) or
+    {"text": "..."} (emits a final answer). `latency_s` simulates model time;
+    all time spent inside the model is accumulated in `model_seconds` so
+    callers can subtract it from end-to-end timings.
+    """
+    steps: List[Dict[str, Any]] = []
+    latency_s: float = 0.0
+    model_seconds: float = 0.0
+    calls: int = 0
+    position: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        # Tool calls come from the script, so there is nothing to bind
+        return self
+
+    def load(self, steps: List[Dict[str, Any]]):
+        """Replace the script and rewind"""
+        self.steps = list(steps)
+        self.position = 0
+
+    def _next_message(self) -> AIMessage:
+        self.calls += 1
+        if self.position >= len(self.steps):
+            return AIMessage(content="(script exhausted)")
+        step = self.steps[self.position]
+        self.position += 1
+        if "tool" in step:
+            return AIMessage(content="", tool_calls=[{
+                "name": step["tool"],
+                "args": step.get("args", {}),
+                "id": f"call_{self.position}",
+            }])
+        return AIMessage(content=step.get("text", ""))
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        message = self._next_message()
+        self.model_seconds += time.perf_counter() - start
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        message = self._next_message()
+        self.model_seconds += time.perf_counter() - start
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+def _groq_model(temperature: float) -> BaseChatModel:
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        model=os.getenv("GROQ_MODEL", DEFAULT_GROQ_MODEL),
+        temperature=temperature,
+    )
+
+def _scripted_model(temperature: float) -> BaseChatModel:
+    return ScriptedChatModel()
+
+MODEL_FACTORIES: Dict[str, Callable[[float], BaseChatModel]] = {
+    "groq": _groq_model,
+    "scripted": _scripted_model,
+}
+
+def register_model_factory(name: str, factory: Callable[[float], BaseChatModel]):
+    """Make another backend selectable through COPILOT_MODEL_PROVIDER"""
+    MODEL_FACTORIES[name] = factory
+
+def create_chat_model(temperature: float = 0.1, provider: Optional[str] = None) -> BaseChatModel:
+    """Build the chat model for the configured provider"""
+    provider = provider or os.getenv("COPILOT_MODEL_PROVIDER", "groq")
+    if provider not in MODEL_FACTORIES:
+        raise ValueError(f"Unknown model provider '{provider}'. Available: {', '.join(MODEL_FACTORIES)}")
+    return MODEL_FACTORIES[provider](temperature)
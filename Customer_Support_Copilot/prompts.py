@@ -1,81 +1,54 @@
 # enhanced_prompts_server.py
 """
 Enhanced MCP Prompts Server for user-friendly, brief policy explanations
+
+Templates are compiled once at import time and renders are memoized, so
+repeated requests with the same arguments skip string rebuilding entirely.
 """
 from fastmcp import FastMCP
+import hashlib
 import json
-from typing import Dict, Any, Optional
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, Any, Optional, Tuple
+
+from customer_context import CustomerContext
+from metrics import lru_cache_stats
+from middleware import TracingMiddleware, install_list_changed, install_metrics
+
+# Max distinct renders kept per prompt (policy text + situation + tone etc.)
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+
+ORDER_PATTERN = re.compile(r'order (\w+)', re.IGNORECASE)
 
 # Create FastMCP server
 mcp = FastMCP("Smart Customer Support Prompts")
+mcp.add_middleware(TracingMiddleware("prompts"))
+metrics = install_metrics(mcp, "prompts")
+list_changed = install_list_changed(mcp)
 
-def parse_customer_context(customer_situation: str) -> Dict[str, Any]:
-    """Parse customer situation string into structured data"""
-    context = {
-        "customer_name": None,
-        "tier": "standard",
-        "recent_orders": [],
-        "recent_issues": [],
-        "has_premium": False,
-        "order_id": None,
-        "items": []
-    }
-    
-    # Extract customer name
-    if "Customer:" in customer_situation:
-        name_part = customer_situation.split("Customer:")[1].split("(")[0].strip()
-        context["customer_name"] = name_part
-    
-    # Extract tier
-    if "premium" in customer_situation.lower():
-        context["tier"] = "premium"
-        context["has_premium"] = True
-    
-    # Extract order info
-    if "order" in customer_situation.lower():
-        import re
-        order_match = re.search(r'order (\w+)', customer_situation, re.IGNORECASE)
-        if order_match:
-            context["order_id"] = order_match.group(1)
-        
-        # Extract items if present
-        if ":" in customer_situation:
-            items_part = customer_situation.split(":")[-1].strip()
-            context["items"] = [item.strip() for item in items_part.split(",")]
-    
-    return context
+class PromptTemplate:
+    """A prompt template split into literal chunks and field names once, up front"""
+    __slots__ = ("parts",)
 
-@mcp.prompt()
-def policy_explanation(
-    policy_content: str, 
-    customer_situation: str = "General inquiry", 
-    tone: str = "friendly"
-) -> str:
-    """Generate brief, user-friendly policy explanations with customer-specific details"""
-    
-    context = parse_customer_context(customer_situation)
-    
-    # Build personalized greeting
-    greeting = ""
-    if context["customer_name"]:
-        greeting = f"Hi {context['customer_name']}, "
-        if context["has_premium"]:
-            greeting += "as a premium customer, "
-    
-    # Build context-aware instructions
-    context_instructions = ""
-    if context["order_id"]:
-        context_instructions = f"""
-CUSTOMER CONTEXT: This customer is asking about their order {context['order_id']}.
-Make the policy explanation relevant to their specific order situation.
-"""
-    
-    if context["has_premium"]:
-        context_instructions += """
-PREMIUM CUSTOMER: Highlight any premium benefits or faster processing times they get.
-"""
-    
-    return f"""You are explaining company policy in a helpful, conversational way.
+    def __init__(self, template: str):
+        parts = []
+        for literal, field_name, _spec, _conversion in Formatter().parse(template):
+            if literal:
+                parts.append((True, literal))
+            if field_name is not None:
+                parts.append((False, field_name))
+        self.parts: Tuple[Tuple[bool, str], ...] = tuple(parts)
+
+    def render(self, **values: str) -> str:
+        return "".join(text if is_literal else values[text] for is_literal, text in self.parts)
+
+# ---------- Templates (compiled at startup) ----------
+
+POLICY_EXPLANATION = PromptTemplate("""You are explaining company policy in a helpful, conversational way.
 
 {greeting}Here's what you need to know about our policy:
 
@@ -99,18 +72,18 @@ INSTRUCTIONS:
 
 TONE: {tone} and helpful
 
-Make it feel like you're talking to a friend, not reading from a manual."""
+Make it feel like you're talking to a friend, not reading from a manual.""")
 
-@mcp.prompt()
-def contextual_response(
-    query: str,
-    customer_data: str = "",
-    order_data: str = "",
-    tone: str = "friendly"
-) -> str:
-    """Generate brief contextual responses that reference specific details"""
-    
-    return f"""You are responding to a customer query in a personal, helpful way.
+ORDER_CONTEXT_INSTRUCTIONS = PromptTemplate("""
+CUSTOMER CONTEXT: This customer is asking about their order {order_id}.
+Make the policy explanation relevant to their specific order situation.
+""")
+
+PREMIUM_CONTEXT_INSTRUCTIONS = """
+PREMIUM CUSTOMER: Highlight any premium benefits or faster processing times they get.
+"""
+
+CONTEXTUAL_RESPONSE = PromptTemplate("""You are responding to a customer query in a personal, helpful way.
 
 CUSTOMER QUERY: {query}
 
@@ -128,18 +101,9 @@ INSTRUCTIONS:
 6. End with what they should do next OR offer additional help
 7. Maximum 75 words total
 
-Make it feel like you actually looked at their account and remember them."""
+Make it feel like you actually looked at their account and remember them.""")
 
-@mcp.prompt()
-def smart_greeting(
-    customer_name: str = "",
-    customer_tier: str = "standard",
-    recent_activity: str = "",
-    issue_type: str = ""
-) -> str:
-    """Generate brief, context-aware greetings"""
-    
-    return f"""Generate a warm but brief greeting for a customer.
+SMART_GREETING = PromptTemplate("""Generate a warm but brief greeting for a customer.
 
 CUSTOMER: {customer_name}
 TIER: {customer_tier}
@@ -159,19 +123,9 @@ Examples:
 - "Hello Sarah! As a premium customer, you get priority support. What can I do for you?"
 - "Hi! I noticed your recent inquiry about shipping. How can I assist today?"
 
-Make it personal but not overly familiar."""
+Make it personal but not overly familiar.""")
 
-@mcp.prompt()
-def escalation_summary(
-    issue_summary: str,
-    customer_tier: str = "standard",
-    urgency: str = "medium",
-    attempted_solutions: str = "",
-    customer_name: str = ""
-) -> str:
-    """Generate concise escalation summaries for team handoffs"""
-    
-    return f"""Create a brief escalation summary for internal review.
+ESCALATION_SUMMARY = PromptTemplate("""Create a brief escalation summary for internal review.
 
 ISSUE: {issue_summary}
 CUSTOMER: {customer_name} ({customer_tier} tier)
@@ -187,20 +141,9 @@ FORMAT YOUR SUMMARY AS:
 **NEXT**: [Recommended action]
 **TIMELINE**: [Response timeframe]
 
-Keep it under 150 words total. Make it scannable for quick executive review."""
+Keep it under 150 words total. Make it scannable for quick executive review.""")
 
-@mcp.prompt()
-def follow_up_message(
-    interaction_summary: str,
-    resolution_status: str,
-    customer_name: str = "",
-    next_steps: str = ""
-) -> str:
-    """Generate brief, personal follow-up messages"""
-    
-    name_greeting = f"Hi {customer_name}," if customer_name else "Hi there,"
-    
-    return f"""Write a brief follow-up message to a customer.
+FOLLOW_UP_MESSAGE = PromptTemplate("""Write a brief follow-up message to a customer.
 
 INTERACTION: {interaction_summary}
 STATUS: {resolution_status}
@@ -217,16 +160,9 @@ MESSAGE STRUCTURE:
 TONE: Warm, professional, and reassuring
 TOTAL LENGTH: Under 100 words
 
-Make them feel valued and kept in the loop without being wordy."""
+Make them feel valued and kept in the loop without being wordy.""")
 
-@mcp.prompt()
-def quick_policy_summary(
-    policy_type: str,
-    specific_question: str = ""
-) -> str:
-    """Generate ultra-brief policy summaries for quick reference"""
-    
-    return f"""Create a very brief policy summary.
+QUICK_POLICY_SUMMARY = PromptTemplate("""Create a very brief policy summary.
 
 POLICY TYPE: {policy_type}
 SPECIFIC QUESTION: {specific_question}
@@ -239,10 +175,224 @@ INSTRUCTIONS:
 5. Under 50 words total
 6. Make it actionable
 
-This is for quick reference during live conversations."""
+This is for quick reference during live conversations.""")
+
+# ---------- Cached helpers ----------
+
+@dataclass(frozen=True)
+class PolicyPieces:
+    """A policy text keyed by its version: render caches hash and compare the short version, not the text"""
+    version: str
+    content: str = field(compare=False)
+
+@lru_cache(maxsize=64)
+def policy_pieces(policy_content: str) -> PolicyPieces:
+    """The policy text with its version (a hash of the text)"""
+    version = hashlib.sha1(policy_content.encode("utf-8")).hexdigest()[:12]
+    return PolicyPieces(version=version, content=policy_content)
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _parse_customer_context(customer_situation: str) -> Dict[str, Any]:
+    context = {
+        "customer_name": None,
+        "tier": "standard",
+        "recent_orders": [],
+        "recent_issues": [],
+        "has_premium": False,
+        "order_id": None,
+        "items": []
+    }
+
+    # Extract customer name
+    if "Customer:" in customer_situation:
+        name_part = customer_situation.split("Customer:")[1].split("(")[0].strip()
+        context["customer_name"] = name_part
+
+    # Extract tier
+    if "premium" in customer_situation.lower():
+        context["tier"] = "premium"
+        context["has_premium"] = True
+
+    # Extract order info
+    if "order" in customer_situation.lower():
+        order_match = ORDER_PATTERN.search(customer_situation)
+        if order_match:
+            context["order_id"] = order_match.group(1)
+
+        # Extract items if present
+        if ":" in customer_situation:
+            items_part = customer_situation.split(":")[-1].strip()
+            context["items"] = [item.strip() for item in items_part.split(",")]
+
+    return context
+
+def parse_customer_context(customer_situation: str) -> Dict[str, Any]:
+    """Parse customer situation string into structured data"""
+    context = _parse_customer_context(customer_situation)
+    # The cached dict is shared between calls - hand out a copy
+    return {**context, "items": list(context["items"])}
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _render_policy_explanation(
+    policy: PolicyPieces,
+    customer_situation: str,
+    tone: str,
+    customer_name: Optional[str],
+    has_premium: bool,
+    order_id: Optional[str]
+) -> str:
+    # Build personalized greeting
+    greeting = ""
+    if customer_name:
+        greeting = f"Hi {customer_name}, "
+        if has_premium:
+            greeting += "as a premium customer, "
+
+    # Build context-aware instructions
+    context_instructions = ""
+    if order_id:
+        context_instructions = ORDER_CONTEXT_INSTRUCTIONS.render(order_id=order_id)
+
+    if has_premium:
+        context_instructions += PREMIUM_CONTEXT_INSTRUCTIONS
+
+    return POLICY_EXPLANATION.render(
+        greeting=greeting,
+        policy_content=policy.content,
+        customer_situation=customer_situation,
+        context_instructions=context_instructions,
+        tone=tone,
+    )
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _render(template: PromptTemplate, values: Tuple[Tuple[str, str], ...]) -> str:
+    return template.render(**dict(values))
+
+RENDER_CACHES = {
+    "policy_pieces": policy_pieces,
+    "customer_context": _parse_customer_context,
+    "policy_explanation": _render_policy_explanation,
+    "templates": _render,
+}
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters for the render caches"""
+    return {name: fn.cache_info()._asdict() for name, fn in RENDER_CACHES.items()}
+
+for _name, _cached in RENDER_CACHES.items():
+    metrics.register_cache(_name, lru_cache_stats(_cached), server="prompts")
+
+# ---------- Prompts ----------
+
+@mcp.prompt()
+def policy_explanation(
+    policy_content: str,
+    customer_situation: str = "General inquiry",
+    tone: str = "friendly",
+    customer_context: Optional[CustomerContext] = None
+) -> str:
+    """Generate brief, user-friendly policy explanations with customer-specific details"""
+    policy = policy_pieces(policy_content)
+
+    if customer_context is not None:
+        if customer_situation == "General inquiry":
+            customer_situation = customer_context.situation()
+        order = customer_context.recent_order
+        return _render_policy_explanation(
+            policy, customer_situation, tone,
+            customer_context.name or None,
+            customer_context.has_premium,
+            order.order_id if order else None,
+        )
+
+    # Legacy callers that only send the free-text situation
+    context = _parse_customer_context(customer_situation)
+    return _render_policy_explanation(
+        policy, customer_situation, tone,
+        context["customer_name"], context["has_premium"], context["order_id"],
+    )
+
+@mcp.prompt()
+def contextual_response(
+    query: str,
+    customer_data: str = "",
+    order_data: str = "",
+    tone: str = "friendly",
+    customer_context: Optional[CustomerContext] = None
+) -> str:
+    """Generate brief contextual responses that reference specific details"""
+    if customer_context is not None:
+        customer_data = customer_data or customer_context.customer_info()
+        order_data = order_data or customer_context.order_info()
+
+    return _render(CONTEXTUAL_RESPONSE, (
+        ("query", query), ("customer_data", customer_data),
+        ("order_data", order_data), ("tone", tone),
+    ))
+
+@mcp.prompt()
+def smart_greeting(
+    customer_name: str = "",
+    customer_tier: str = "standard",
+    recent_activity: str = "",
+    issue_type: str = "",
+    customer_context: Optional[CustomerContext] = None
+) -> str:
+    """Generate brief, context-aware greetings"""
+    if customer_context is not None:
+        customer_name = customer_name or customer_context.name
+        if customer_tier == "standard":
+            customer_tier = customer_context.tier
+        recent_activity = recent_activity or customer_context.recent_activity()
+
+    return _render(SMART_GREETING, (
+        ("customer_name", customer_name), ("customer_tier", customer_tier),
+        ("recent_activity", recent_activity), ("issue_type", issue_type),
+    ))
+
+@mcp.prompt()
+def escalation_summary(
+    issue_summary: str,
+    customer_tier: str = "standard",
+    urgency: str = "medium",
+    attempted_solutions: str = "",
+    customer_name: str = ""
+) -> str:
+    """Generate concise escalation summaries for team handoffs"""
+    return _render(ESCALATION_SUMMARY, (
+        ("issue_summary", issue_summary), ("customer_tier", customer_tier),
+        ("urgency", urgency), ("attempted_solutions", attempted_solutions),
+        ("customer_name", customer_name),
+    ))
+
+@mcp.prompt()
+def follow_up_message(
+    interaction_summary: str,
+    resolution_status: str,
+    customer_name: str = "",
+    next_steps: str = ""
+) -> str:
+    """Generate brief, personal follow-up messages"""
+    name_greeting = f"Hi {customer_name}," if customer_name else "Hi there,"
+
+    return _render(FOLLOW_UP_MESSAGE, (
+        ("interaction_summary", interaction_summary), ("resolution_status", resolution_status),
+        ("next_steps", next_steps), ("customer_name", customer_name),
+        ("name_greeting", name_greeting),
+    ))
+
+@mcp.prompt()
+def quick_policy_summary(
+    policy_type: str,
+    specific_question: str = ""
+) -> str:
+    """Generate ultra-brief policy summaries for quick reference"""
+    return _render(QUICK_POLICY_SUMMARY, (
+        ("policy_type", policy_type), ("specific_question", specific_question),
+    ))
 
 if __name__ == "__main__":
     try:
         mcp.run(transport="streamable-http", port=8003)
     except Exception as e:
-        print(f"Failed to start prompts server: {e}")
\ No newline at end of file
+        print(f"Failed to start prompts server: {e}")
@@ -0,0 +1,274 @@
+# resilience.py
+"""
+Deadlines, retries, hedged reads and circuit breaking for the copilots' MCP calls.
+
+Every call has a deadline (COPILOT_MCP_DEADLINE seconds, default 10) that
+covers all of its attempts, cut short by the turn's budget (budget.py).
+
+    retries   failed idempotent calls (transport error, timeout) are retried
+              up to COPILOT_MCP_RETRIES times after a full-jitter exponential
+              backoff. Calls shed by the server's admission control never ran,
+              so they are retried for any tool, after the server's retry-after hint.
+              Error replies (McpError: unknown resource, ...) are answers: never
+              retried, and they count as successes for the breaker
+    hedging   once a read has taken longer than the COPILOT_HEDGE_PERCENTILE
+              (default 95; 0 = off) latency of recent calls to the same
+              operation, a duplicate is sent and the first answer wins. At most
+              HEDGE_BUDGET of calls are hedged, so a slow server isn't doubly loaded
+    breaker   COPILOT_BREAKER_FAILURES consecutive failures open a server's
+              circuit: its calls fail at once for COPILOT_BREAKER_RESET seconds,
+              then a single probe decides whether it closes again
+"""
+import asyncio
+import collections
+import logging
+import math
+import os
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import budget
+
+CALL_DEADLINE_S = float(os.getenv("COPILOT_MCP_DEADLINE", "10"))
+RETRIES = int(os.getenv("COPILOT_MCP_RETRIES", "2"))
+BACKOFF_BASE_S = 0.1
+BACKOFF_CAP_S = 2.0
+HEDGE_PERCENTILE = float(os.getenv("COPILOT_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20   # no hedging until an operation's latency is known
+HEDGE_BUDGET = 0.1       # fraction of calls that may be hedged
+BREAKER_FAILURES = int(os.getenv("COPILOT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("COPILOT_BREAKER_RESET", "10"))
+
+logger = logging.getLogger("resilience")
+
+T = TypeVar("T")
+
+class CircuitOpen(Exception):
+    """A call refused without being sent because the server's circuit is open"""
+
+    def __init__(self, server: str, retry_in_s: float):
+        self.server = server
+        self.retry_in_s = retry_in_s
+        super().__init__(f"{server} is unavailable (circuit open); retry in {retry_in_s:.1f}s")
+
+class ServerOverloaded(Exception):
+    """The server shed the call before running it (see middleware.AdmissionControl)"""
+
+    def __init__(self, message: str, retry_after_s: float):
+        self.retry_after_s = retry_after_s
+        super().__init__(message)
+
+_OVERLOADED = re.compile(r"Server overloaded \(\w+\); retry after ([\d.]+)s")
+
+# JSON-RPC code of an MCP session's read timeout: a failed call, unlike the server's own error replies
+REQUEST_TIMEOUT = 408
+
+def is_error_reply(error: BaseException) -> bool:
+    """An error the server answered with (unknown resource, bad arguments, ...): not retried, not a failure"""
+    from mcp.shared.exceptions import McpError  # deferred: keeps the copilots' startup free of the MCP stack
+    return isinstance(error, McpError) and error.error.code != REQUEST_TIMEOUT
+
+def failure_reply(server: str, action: str, error: BaseException) -> Optional[str]:
+    """Tool result for a failed call the model should see, or None for one it can't work around (re-raise it).
+
+    An error reply is quoted; a server that is out of reach (circuit open,
+    shed, no answer in time) gets a reply telling the model not to call it
+    again this turn, rather than an error it would keep retrying.
+    """
+    from mcp.shared.exceptions import McpError
+    if isinstance(error, CircuitOpen):
+        reason, wait = "circuit open", error.retry_in_s
+    elif isinstance(error, ServerOverloaded):
+        reason, wait = "overloaded", error.retry_after_s
+    elif isinstance(error, asyncio.TimeoutError) or (isinstance(error, McpError) and not is_error_reply(error)):
+        reason, wait = "no answer within the deadline", None
+    elif is_error_reply(error):
+        return f"Error {action}: {error}"
+    else:
+        return None
+    retry = f"retry after {max(1, math.ceil(wait))}s" if wait is not None else "retry later"
+    return (f"{server} unavailable ({reason}), {retry}. Do not call it again this turn; "
+            f"tell the user it can't be reached right now.")
+
+def overload_retry_after(text: str) -> Optional[float]:
+    """The retry-after hint of an admission-control rejection, or None for any other text"""
+    match = _OVERLOADED.match(text)
+    return float(match.group(1)) if match else None
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures -> half-open probe after reset_s"""
+
+    def __init__(self, server: str, failures: int = BREAKER_FAILURES, reset_s: float = BREAKER_RESET_S,
+                 on_open: Optional[Callable[[str], None]] = None):
+        self.server = server
+        self.failures = failures
+        self.reset_s = reset_s
+        self.on_open = on_open
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may be sent now"""
+        if self.state == "open":
+            wait = self._opened_at + self.reset_s - time.monotonic()
+            if wait > 0:
+                raise CircuitOpen(self.server, wait)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                raise CircuitOpen(self.server, self.reset_s)
+            self._probing = True
+
+    def success(self):
+        if self.state != "closed":
+            logger.info("circuit for %s closed", self.server)
+        self.state = "closed"
+        self._consecutive = 0
+        self._probing = False
+
+    def failure(self):
+        self._consecutive += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+            logger.warning("circuit for %s opened after %d failure(s)", self.server, self._consecutive)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            if self.on_open:
+                self.on_open(self.server)
+
+    def abandon(self):
+        """A call ended without an answer either way (cancelled): let another probe through"""
+        self._probing = False
+
+class LatencyTracker:
+    """Recent latencies of one operation, for the hedging threshold"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = collections.deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+class ResilientCaller:
+    """Runs MCP requests under a deadline, with retries, hedging and a breaker per server"""
+
+    def __init__(self, on_open: Optional[Callable[[str], None]] = None):
+        self.on_open = on_open
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latency: Dict[Tuple[str, str], LatencyTracker] = {}
+        self.retries = 0
+
+    def breaker(self, server: str) -> CircuitBreaker:
+        if server not in self.breakers:
+            self.breakers[server] = CircuitBreaker(server, on_open=self.on_open)
+        return self.breakers[server]
+
+    async def call(self, server: str, operation: str, request: Callable[[], Awaitable[T]],
+                   idempotent: bool = False, deadline: Optional[float] = None) -> T:
+        """request() once or more until it answers; `deadline` is an absolute time.monotonic()"""
+        timeout_at = deadline if deadline is not None else time.monotonic() + CALL_DEADLINE_S
+        turn_deadline = budget.deadline()
+        deadline = timeout_at if turn_deadline is None else min(timeout_at, turn_deadline)
+        breaker = self.breaker(server)
+        tracker = self.latency.setdefault((server, operation), LatencyTracker())
+        for attempt in range(RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            tracker.calls += 1
+            attempt_call = self._hedged if idempotent else self._attempt
+            try:
+                return await asyncio.wait_for(attempt_call(breaker, tracker, request), remaining)
+            except ServerOverloaded as e:
+                error, delay = e, e.retry_after_s
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                if is_error_reply(e):
+                    raise
+                if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline:
+                    if time.monotonic() >= timeout_at:
+                        breaker.failure()  # too slow, not just out of turn time; wait_for hid it from _attempt
+                    break
+                if not idempotent:
+                    raise
+                error, delay = e, self._backoff(attempt)
+            if attempt == RETRIES or time.monotonic() + delay >= deadline:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(delay)
+        raise asyncio.TimeoutError(f"{operation} on {server}: no answer within the deadline")
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2 ** attempt))
+
+    async def _attempt(self, breaker: CircuitBreaker, tracker: LatencyTracker,
+                       request: Callable[[], Awaitable[T]]) -> T:
+        breaker.allow()
+        start = time.perf_counter()
+        try:
+            result = await request()
+        except ServerOverloaded:
+            breaker.success()  # it answered; shedding is not a failure
+            raise
+        except Exception as e:
+            if is_error_reply(e):
+                breaker.success()
+            else:
+                breaker.failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        breaker.success()
+        tracker.observe(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, breaker: CircuitBreaker, tracker: LatencyTracker,
+                      request: Callable[[], Awaitable[T]]) -> T:
+        """One attempt, plus a duplicate if it is slower than the hedging percentile"""
+        delay = tracker.percentile(HEDGE_PERCENTILE) if HEDGE_PERCENTILE > 0 else None
+        if delay is None or tracker.hedges >= HEDGE_BUDGET * tracker.calls:
+            return await self._attempt(breaker, tracker, request)
+        pending = {asyncio.ensure_future(self._attempt(breaker, tracker, request))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return done.pop().result()
+            tracker.hedges += 1
+            pending.add(asyncio.ensure_future(self._attempt(breaker, tracker, request)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if error is None or isinstance(error, CircuitOpen):
+                        error = task.exception()  # prefer the real failure over "hedge refused"
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker states and hedge counts, for status output"""
+        return {
+            "breakers": {server: b.state for server, b in self.breakers.items()},
+            "retries": self.retries,
+            "hedges": {f"{server} {op}": t.hedges for (server, op), t in self.latency.items() if t.hedges},
+        }
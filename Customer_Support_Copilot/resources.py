@@ -2,16 +2,32 @@
 """
 MCP Resources Server - Provides company policies from SQLite database
 Using FastMCP for simplified server creation
+
+Every row of the policies table is exposed as policy://<policy_type>.
+The table is polled every POLICY_CATALOG_POLL seconds; when policies are
+added or removed, connected clients get notifications/resources/list_changed.
 """
+import asyncio
+import os
 import sqlite3
+from functools import partial
 from pathlib import Path
+from typing import Dict, Set
 from fastmcp import FastMCP
+from fastmcp.resources import Resource
+
+import tracing
+from middleware import TracingMiddleware, install_list_changed, install_metrics
 
 # --- Database Path ---
 DB_PATH = str(Path(__file__).parent / "policies.db")
+POLICY_CATALOG_POLL_S = float(os.getenv("POLICY_CATALOG_POLL", "5"))
 
 # --- Create FastMCP server ---
 mcp = FastMCP("Customer Support Resources")
+mcp.add_middleware(TracingMiddleware("resources"))
+metrics = install_metrics(mcp, "resources")
+list_changed = install_list_changed(mcp)
 
 
 def get_policy_from_db(policy_type: str) -> str:
@@ -20,11 +36,12 @@ def get_policy_from_db(policy_type: str) -> str:
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            SELECT title, content FROM policies 
-            WHERE policy_type = ?
-        """, (policy_type,))
-        result = cursor.fetchone()
+        with tracing.span("sqlite.query", table="policies", policy_type=policy_type):
+            cursor.execute("""
+                SELECT title, content FROM policies 
+                WHERE policy_type = ?
+            """, (policy_type,))
+            result = cursor.fetchone()
         if result:
             title, content = result
             return f"{title}\n{'-' * len(title)}\n\n{content}"
@@ -42,10 +59,11 @@ def list_all_policies() -> str:
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            SELECT policy_type, title FROM policies ORDER BY policy_type
-        """)
-        results = cursor.fetchall()
+        with tracing.span("sqlite.query", table="policies"):
+            cursor.execute("""
+                SELECT policy_type, title FROM policies ORDER BY policy_type
+            """)
+            results = cursor.fetchall()
         if results:
             return "Available Policies:\n" + "\n".join(
                 f"- {ptype}: {title}" for ptype, title in results
@@ -80,6 +98,51 @@ def list_policies() -> str:
     return list_all_policies()
 
 
+# --- Policies added to the table after these were written ---
+STATIC_POLICIES = {"shipping_policy", "return_policy", "refund_policy", "warranty_policy"}
+_dynamic_policies: Dict[str, Resource] = {}
+
+def policy_types() -> Set[str]:
+    """policy_type of every row in the policies table"""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return {row[0] for row in conn.execute("SELECT policy_type FROM policies")}
+    finally:
+        conn.close()
+
+def sync_policy_resources(types: Set[str]) -> bool:
+    """Expose/hide policy://<type> resources to match `types`; True if the list changed"""
+    changed = False
+    for policy_type in types - STATIC_POLICIES:
+        resource = _dynamic_policies.get(policy_type)
+        if resource is None:
+            resource = Resource.from_function(partial(get_policy_from_db, policy_type),
+                                              uri=f"policy://{policy_type}", name=policy_type)
+            _dynamic_policies[policy_type] = mcp.add_resource(resource)
+            changed = True
+        elif not resource.enabled:
+            resource.enable()
+            changed = True
+    for policy_type, resource in _dynamic_policies.items():
+        if policy_type not in types and resource.enabled:
+            resource.disable()
+            changed = True
+    return changed
+
+async def refresh_policy_resources() -> bool:
+    try:
+        types = await asyncio.to_thread(policy_types)
+    except sqlite3.Error:
+        return False
+    return sync_policy_resources(types)
+
+try:
+    sync_policy_resources(policy_types())
+except sqlite3.Error:
+    pass  # reads report the database error, as before
+list_changed.watch("resources", refresh_policy_resources, POLICY_CATALOG_POLL_S)
+
+
 if __name__ == "__main__":
     # Run server with streamable-http transport
     mcp.run(transport="streamable-http", port=8002)
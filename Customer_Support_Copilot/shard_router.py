@@ -0,0 +1,237 @@
+# shard_router.py
+"""
+Tools router - serves the tools.py API on port 8001 in front of N tools shards.
+
+Customer lookups go straight to shard_for(customer_id). Tickets and orders
+are located through an index of which shard holds which id, collected
+from every shard's shard_index tool on first use and re-collected when an
+id is missing. search_by_customer matches on names, so it is sent to all
+shards concurrently and the answers are merged; ticket_stats counts are
+summed over all shards the same way.
+
+    python shard_router.py                      # starts TOOLS_SHARDS (default 3) local shards too
+    TOOLS_SHARD_URLS=http://a:8101/mcp,http://b:8101/mcp python shard_router.py --no-spawn
+
+The copilot needs no changes: it talks to port 8001 as before.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastmcp import FastMCP
+from fastmcp.exceptions import ToolError
+
+import sharding
+from connections import REQUEST_TIMEOUT_S, SharedSession, open_http_session
+from middleware import TracingMiddleware, install_list_changed, install_metrics
+
+HERE = Path(__file__).parent
+SHARDS = int(os.getenv("TOOLS_SHARDS", "3"))
+# A miss re-reads the index at most this often, so lookups of unknown ids can't flood the shards
+INDEX_REFRESH_S = float(os.getenv("TOOLS_INDEX_REFRESH", "1"))
+
+# --- Create FastMCP server ---
+mcp = FastMCP("Customer Support Tools Router")
+mcp.add_middleware(TracingMiddleware("tools-router"))
+metrics = install_metrics(mcp, "tools-router")
+list_changed = install_list_changed(mcp)
+
+# ---------- Shards ----------
+
+class Shard:
+    """Long-lived session to one tools shard"""
+
+    def __init__(self, number: int, url: str):
+        self.number = number
+        self.url = url
+        self.session = SharedSession(lambda: open_http_session(url, timeout_s=REQUEST_TIMEOUT_S))
+
+    async def call(self, tool: str, arguments: Dict[str, Any]) -> str:
+        session = await self.session.get()
+        try:
+            result = await session.call_tool(tool, arguments)
+        except Exception:
+            self.session.discard()
+            raise
+        text = "\n".join(c.text for c in result.content if getattr(c, "text", None))
+        if result.isError:
+            raise ToolError(text)
+        return text
+
+class ShardIndex:
+    """ticket/order id -> shard number, built from the shards' shard_index tool"""
+
+    def __init__(self, shards: List[Shard]):
+        self.shards = shards
+        self.tickets: Dict[str, int] = {}
+        self.orders: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._loads = 0  # completed refreshes, so callers that waited for one can tell it happened
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, seen: Optional[int] = None):
+        """Re-collect the index, unless another refresh finished since the caller saw `seen` loads"""
+        async with self._lock:
+            if seen is not None and self._loads != seen:
+                return  # a burst of misses waits for one scatter, not one each
+            answers = await asyncio.gather(*(s.call("shard_index", {}) for s in self.shards),
+                                           return_exceptions=True)
+            for shard, answer in zip(self.shards, answers):
+                if isinstance(answer, BaseException):
+                    continue  # keep what we knew about an unreachable shard
+                data = json.loads(answer)
+                for ticket_id in data["tickets"]:
+                    self.tickets[ticket_id] = shard.number
+                for order_id in data["orders"]:
+                    self.orders[order_id] = shard.number
+            self._loaded_at = time.monotonic()
+            self._loads += 1
+
+    async def locate(self, table: Dict[str, int], key: str) -> Optional[int]:
+        if key not in table and (self._loaded_at is None
+                                 or time.monotonic() - self._loaded_at >= INDEX_REFRESH_S):
+            await self.refresh(seen=self._loads)
+        return table.get(key)
+
+    async def ticket(self, ticket_id: str) -> Optional[Shard]:
+        number = await self.locate(self.tickets, ticket_id)
+        return None if number is None else self.shards[number]
+
+    async def order(self, order_id: str) -> Optional[Shard]:
+        number = await self.locate(self.orders, order_id)
+        return None if number is None else self.shards[number]
+
+SHARD_LIST = [Shard(i, url) for i, url in enumerate(sharding.shard_urls(SHARDS))]
+index = ShardIndex(SHARD_LIST)
+
+def customer_shard(customer_id: str) -> Shard:
+    return SHARD_LIST[sharding.shard_for(customer_id, len(SHARD_LIST))]
+
+# ---------- Tools (same names and arguments as tools.py) ----------
+
+@mcp.tool()
+async def get_ticket_status(ticket_id: str) -> str:
+    """Get the status and details of a support ticket, including linked order info"""
+    shard = await index.ticket(ticket_id)
+    if shard is None:
+        return f"Ticket {ticket_id} not found"
+    return await shard.call("get_ticket_status", {"ticket_id": ticket_id})
+
+@mcp.tool()
+async def get_order_info(order_id: str) -> str:
+    """Get order information including items, status, and related tickets"""
+    shard = await index.order(order_id)
+    if shard is None:
+        return f"Order {order_id} not found"
+    return await shard.call("get_order_info", {"order_id": order_id})
+
+@mcp.tool()
+async def get_customer_details(customer_id: str) -> str:
+    """Get customer information including name, email, tier, and complete history"""
+    return await customer_shard(customer_id).call("get_customer_details", {"customer_id": customer_id})
+
+@mcp.tool()
+async def initiate_return(reference_id: str, reason: str = "No reason provided") -> str:
+    """Initiate a return process for an order or ticket"""
+    shard = await index.ticket(reference_id) or await index.order(reference_id)
+    if shard is None:
+        return json.dumps({"error": f"Reference {reference_id} not found"}, indent=2)
+    return await shard.call("initiate_return", {"reference_id": reference_id, "reason": reason})
+
+@mcp.tool()
+async def escalate_ticket(ticket_id: str, department: str, notes: str = "") -> str:
+    """Escalate a ticket to higher priority or different department"""
+    shard = await index.ticket(ticket_id)
+    if shard is None:
+        return json.dumps({"error": f"Ticket {ticket_id} not found"})
+    return await shard.call("escalate_ticket", {"ticket_id": ticket_id, "department": department, "notes": notes})
+
+@mcp.tool()
+async def search_by_customer(customer_name: str) -> str:
+    """Find customer by name and return their details"""
+    answers = await asyncio.gather(
+        *(s.call("search_by_customer", {"customer_name": customer_name}) for s in SHARD_LIST),
+        return_exceptions=True,
+    )
+    failed = [s.number for s, a in zip(SHARD_LIST, answers) if isinstance(a, BaseException)]
+
+    partial_matches = []
+    for answer in answers:
+        if isinstance(answer, BaseException) or answer.startswith("No customer found"):
+            continue
+        data = json.loads(answer)
+        if "partial_matches" not in data:
+            return answer  # exact match: full customer details
+        partial_matches.extend(data["partial_matches"])
+
+    if partial_matches:
+        result: Dict[str, Any] = {"partial_matches": partial_matches}
+        if failed:
+            result["unavailable_shards"] = failed  # matches on those shards are missing
+        return json.dumps(result, indent=2)
+    if failed:
+        raise ToolError(f"Search incomplete: shard(s) {failed} unavailable")
+    return f"No customer found matching '{customer_name}'"
+
+@mcp.tool()
+async def ticket_stats(status: str = "", priority: str = "", department: str = "", tier: str = "") -> str:
+    """Count tickets by status, priority, department and customer tier; give any of them to count only those"""
+    arguments = {"status": status, "priority": priority, "department": department, "tier": tier}
+    answers = await asyncio.gather(*(s.call("ticket_stats", arguments) for s in SHARD_LIST), return_exceptions=True)
+    failed = [s.number for s, a in zip(SHARD_LIST, answers) if isinstance(a, BaseException)]
+    if failed:
+        raise ToolError(f"Counts incomplete: shard(s) {failed} unavailable")
+
+    result: Dict[str, Any] = {}
+    for answer in answers:
+        for name, value in json.loads(answer).items():
+            if name == "total":
+                result["total"] = result.get("total", 0) + value
+            elif name.startswith("by_"):
+                counts = result.setdefault(name, {})
+                for bucket, count in value.items():
+                    counts[bucket] = counts.get(bucket, 0) + count
+            else:
+                result[name] = value
+    for name, counts in result.items():
+        if name.startswith("by_"):
+            result[name] = dict(sorted(counts.items(), key=lambda item: -item[1]))
+    return json.dumps(result, indent=2)
+
+# ---------- Local shard processes ----------
+
+def spawn_shards(shards: int) -> List[subprocess.Popen]:
+    """Start tools.py once per shard on this machine and wait until they listen"""
+    procs = []
+    for shard in range(shards):
+        env = {**os.environ, "TOOLS_SHARDS": str(shards), "TOOLS_SHARD": str(shard)}
+        procs.append(subprocess.Popen([sys.executable, str(HERE / "tools.py")], cwd=HERE, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for shard in range(shards):
+        sharding.wait_for_port(sharding.shard_port(shard))
+    return procs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--no-spawn", action="store_true",
+                        help="Use shards that are already running (TOOLS_SHARD_URLS or the default ports)")
+    args = parser.parse_args()
+
+    procs = [] if args.no_spawn or os.getenv("TOOLS_SHARD_URLS") else spawn_shards(SHARDS)
+    # uvicorn re-raises SIGTERM after shutting down; exit through `finally` so the shards stop too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        mcp.run(transport="streamable-http", port=8001)
+    except Exception as e:
+        print(f"Failed to start tools router: {e}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
@@ -0,0 +1,57 @@
+# sharding.py
+"""
+Placement of tools data across shards.
+
+Customers are assigned to a shard by a stable hash of customer_id; their
+tickets and orders live on the same shard, so every single-record lookup
+(and the ticket/order/customer joins in tools.py) stays on one process.
+
+    TOOLS_SHARDS       number of shards (default 1 = unsharded)
+    TOOLS_SHARD        this process's shard, 0..TOOLS_SHARDS-1 (tools.py)
+    TOOLS_SHARD_PORT   port of shard 0; shard i listens on TOOLS_SHARD_PORT + i (default 8101)
+    TOOLS_SHARD_URLS   comma-separated shard endpoints, in shard order, for
+                       shards that run elsewhere (shard_router.py)
+"""
+import os
+import socket
+import time
+import zlib
+from typing import Any, Dict, List, Tuple
+
+SHARDS = int(os.getenv("TOOLS_SHARDS", "1"))
+SHARD_BASE_PORT = int(os.getenv("TOOLS_SHARD_PORT", "8101"))
+
+Records = Dict[str, Dict[str, Any]]
+
+def shard_for(customer_id: str, shards: int = SHARDS) -> int:
+    """Shard owning a customer; crc32 because hash() differs between processes"""
+    return zlib.crc32(customer_id.encode("utf-8")) % shards
+
+def shard_port(shard: int) -> int:
+    return SHARD_BASE_PORT + shard
+
+def shard_urls(shards: int = SHARDS) -> List[str]:
+    configured = os.getenv("TOOLS_SHARD_URLS")
+    if configured:
+        return [url.strip() for url in configured.split(",") if url.strip()]
+    return [f"http://127.0.0.1:{shard_port(i)}/mcp" for i in range(shards)]
+
+def partition(tickets: Records, orders: Records, customers: Records,
+              shard: int, shards: int = SHARDS) -> Tuple[Records, Records, Records]:
+    """The tickets, orders and customers that live on `shard`"""
+    mine = lambda customer_id: shard_for(customer_id, shards) == shard
+    return (
+        {k: v for k, v in tickets.items() if mine(v["customer"])},
+        {k: v for k, v in orders.items() if mine(v["customer"])},
+        {k: v for k, v in customers.items() if mine(k)},
+    )
+
+def wait_for_port(port: int, timeout: float = 20.0):
+    """Block until a local server listens on `port` (shard_router.py's shards, the benchmarks' servers)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"Server on port {port} did not start within {timeout}s")
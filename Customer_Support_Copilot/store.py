@@ -0,0 +1,528 @@
+# store.py
+"""
+Storage for the tools server's tickets, orders and customers.
+
+    memory   plain dicts in the process (default; one worker)
+    compact  columnar arrays in the process, for millions of records (CompactTable)
+    sqlite   one SQLite file shared by every worker process (TOOLS_WORKERS > 1)
+
+All are dict-like tables with a `patch(key, **fields)` write, and
+`watch(callback)` to be told the key of every changed record (None: any
+may have changed) - for state derived from the records, like counts; SQLite
+tables deliver other workers' changes only on `refresh()`. The SQLite
+tables keep a worker-local read cache. Every write also appends the changed
+key to a change log; before a read, a worker compares `PRAGMA data_version`
+(which moves only when another connection commits) and, if it moved, evicts
+just the keys logged since it last looked. Reads that hit the cache cost
+one PRAGMA and no table query.
+"""
+import datetime
+import json
+import re
+import sqlite3
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+Record = Dict[str, Any]
+
+# Change-log rows kept for workers that fall behind; older ones are pruned
+CHANGE_LOG_SIZE = 10_000
+
+Watcher = Callable[[Optional[str]], None]
+
+class MemoryTable(dict):
+    """In-process table: a dict of records"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._watchers: List[Watcher] = []
+
+    def patch(self, key: str, **fields: Any) -> Record:
+        self[key].update(fields)
+        for callback in self._watchers:
+            callback(key)
+        return self[key]
+
+    def watch(self, callback: Watcher):
+        self._watchers.append(callback)
+
+    def refresh(self):
+        """Deliver changes made elsewhere to the watchers; an in-process table has none"""
+
+# ---------- Compact in-memory table ----------
+
+# Column kind of each field; a value that doesn't fit its kind turns the column into a plain one
+ENUM_FIELDS = {"status", "priority", "tier", "escalated_to"}       # few distinct strings: 1-2 byte codes
+DATE_FIELDS = {"created_date", "last_updated", "resolved_date", "order_date", "delivery_date"}  # day ordinals
+FLOAT_FIELDS = {"total"}                                           # 8-byte doubles
+ID_FIELDS = {"customer", "order_id", "items", "orders", "tickets", "related_tickets"}  # interned ids
+
+_DAY_TEXT: Dict[int, str] = {}  # day ordinal -> YYYY-MM-DD; a data set spans few distinct days
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}", re.ASCII)
+
+class _ObjectColumn:
+    """Any JSON value; lists are kept as tuples of interned strings where they can be"""
+    __slots__ = ("data", "intern")
+
+    def __init__(self, data: Optional[List[Any]] = None, intern: bool = False):
+        self.data = data if data is not None else []
+        self.intern = intern
+
+    def encode(self, value: Any) -> Any:
+        if type(value) is list:
+            return tuple(sys.intern(v) if self.intern and type(v) is str else v for v in value)
+        return sys.intern(value) if self.intern and type(value) is str else value
+
+    def put(self, row: int, value: Any) -> bool:
+        _put(self.data, row, self.encode(value), None)
+        return True
+
+    def get(self, row: int) -> Any:
+        value = self.data[row]
+        return list(value) if type(value) is tuple else value
+
+class _EnumColumn:
+    """Strings as codes into a table of the distinct values"""
+    __slots__ = ("data", "values", "codes")
+
+    def __init__(self):
+        self.data = array("B")
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def put(self, row: int, value: Any) -> bool:
+        if type(value) is not str:
+            return False
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > 0xFFFF:
+                return False
+            if code > 0xFF and self.data.typecode == "B":
+                self.data = array("H", self.data)
+            self.values.append(sys.intern(value))
+            self.codes[value] = code
+        _put(self.data, row, code, 0)
+        return True
+
+    def get(self, row: int) -> Any:
+        return self.values[self.data[row]]
+
+class _DateColumn:
+    """YYYY-MM-DD strings as day ordinals (0 for rows without a date)"""
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = array("i")
+
+    def put(self, row: int, value: Any) -> bool:
+        if type(value) is not str or not _ISO_DATE.fullmatch(value):
+            return False
+        try:
+            day = datetime.date.fromisoformat(value).toordinal()
+        except ValueError:
+            return False
+        _put(self.data, row, day, 0)
+        return True
+
+    def get(self, row: int) -> Any:
+        day = self.data[row]
+        text = _DAY_TEXT.get(day)
+        if text is None and day:
+            text = _DAY_TEXT[day] = datetime.date.fromordinal(day).isoformat()
+        return text
+
+class _FloatColumn:
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = array("d")
+
+    def put(self, row: int, value: Any) -> bool:
+        if type(value) is not float:  # ints stay ints in the plain column, so JSON shows 42, not 42.0
+            return False
+        _put(self.data, row, value, 0.0)
+        return True
+
+    def get(self, row: int) -> Any:
+        return self.data[row]
+
+def _put(data, row: int, value: Any, blank: Any):
+    if row < len(data):
+        data[row] = value
+    else:
+        data.extend([blank] * (row - len(data)))
+        data.append(value)
+
+def _column(name: str):
+    if name in ENUM_FIELDS:
+        return _EnumColumn()
+    if name in DATE_FIELDS:
+        return _DateColumn()
+    if name in FLOAT_FIELDS:
+        return _FloatColumn()
+    return _ObjectColumn(intern=name in ID_FIELDS)
+
+class CompactTable:
+    """Dict-like table stored column by column instead of one dict per record.
+
+    Each row keeps a code for its shape (its field names, in order), so a
+    record is rebuilt with the same keys in the same order and serializes
+    to the same JSON as the dict it was made from. Records are built on
+    access: change them with patch(), not in place.
+    """
+
+    def __init__(self, records: Optional[Dict[str, Record]] = None):
+        self._lock = threading.Lock()  # sync tools may run on worker threads
+        self._rows: Dict[str, int] = {}
+        self._shape_of_row = array("H")
+        self._shapes: List[Tuple[str, ...]] = []
+        self._shape_codes: Dict[Tuple[str, ...], int] = {}
+        self._columns: Dict[str, Any] = {}
+        self._readers: Dict[int, List[Tuple[str, Callable[[int], Any]]]] = {}  # shape -> its columns' getters
+        self._watchers: List[Watcher] = []
+        for key, record in (records or {}).items():
+            self[key] = record
+
+    def _shape(self, names: Tuple[str, ...]) -> int:
+        code = self._shape_codes.get(names)
+        if code is None:
+            code = self._shape_codes[names] = len(self._shapes)
+            self._shapes.append(tuple(sys.intern(name) for name in names))
+        return code
+
+    def _write(self, row: int, record: Record):
+        """Store a record in `row` (caller holds the lock)"""
+        columns = self._columns
+        for name, value in record.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = _column(name)
+            if not column.put(row, value):
+                # Doesn't fit the column's kind (a date that isn't YYYY-MM-DD, ...): keep it as is
+                plain = _ObjectColumn([column.get(r) for r in range(len(column.data))])
+                plain.put(row, value)
+                columns[name] = plain
+                self._readers.clear()
+        # The shape goes last, once every column it names has a value for the row
+        shape = self._shape(tuple(record))
+        if shape > 0xFFFF and self._shape_of_row.typecode == "H":
+            self._shape_of_row = array("I", self._shape_of_row)
+        _put(self._shape_of_row, row, shape, 0)
+
+    def _read(self, row: int) -> Record:
+        """The record in `row` (caller holds the lock)"""
+        shape = self._shape_of_row[row]
+        readers = self._readers.get(shape)
+        if readers is None:
+            readers = self._readers[shape] = [(name, self._columns[name].get) for name in self._shapes[shape]]
+        return {name: get(row) for name, get in readers}
+
+    def __setitem__(self, key: str, record: Record):
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._shape_of_row)
+                self._write(row, record)
+                self._rows[sys.intern(key)] = row
+            else:
+                self._write(row, record)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._rows.get(key)
+            return default if row is None else self._read(row)
+
+    def __getitem__(self, key: str) -> Record:
+        with self._lock:
+            return self._read(self._rows[key])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def keys(self) -> List[str]:
+        return list(self._rows)
+
+    def items(self) -> Iterator[Tuple[str, Record]]:
+        for key, row in self._rows.items():
+            with self._lock:
+                record = self._read(row)
+            yield key, record
+
+    def patch(self, key: str, **fields: Any) -> Record:
+        with self._lock:
+            row = self._rows[key]
+            record = {**self._read(row), **fields}
+            self._write(row, record)
+        for callback in self._watchers:
+            callback(key)
+        return record
+
+    def watch(self, callback: Watcher):
+        self._watchers.append(callback)
+
+    def refresh(self):
+        """Deliver changes made elsewhere to the watchers; an in-process table has none"""
+
+class SqliteStore:
+    """One connection per process, shared by its tables, with change-log cache invalidation"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()  # sync tools may run on worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (tbl TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+            "UNIQUE (tbl, key))")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, key TEXT NOT NULL)")
+        self._cache: Dict[Tuple[str, str], Optional[Record]] = {}
+        self._keys: Dict[str, List[str]] = {}  # table -> all keys, for iteration
+        self._data_version: Optional[int] = None
+        self._seen_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        self._writes = 0
+        self._watchers: Dict[str, List[Watcher]] = {}
+        self._changed: List[Tuple[str, Optional[str]]] = []  # for the watchers, delivered outside the lock
+        self._delivering = threading.local()  # set while this thread runs watchers; their reads and writes don't deliver
+
+    def table(self, name: str, seed: Optional[Dict[str, Record]] = None) -> "SqliteTable":
+        """The table `name`; `seed` fills it only if it is empty (safe when workers start together)"""
+        if seed:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._conn.execute("SELECT 1 FROM records WHERE tbl = ? LIMIT 1", (name,)).fetchone() is None:
+                        self._conn.executemany("INSERT INTO records (tbl, key, data) VALUES (?, ?, ?)",
+                                               [(name, key, json.dumps(record)) for key, record in seed.items()])
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        return SqliteTable(self, name)
+
+    def _sync(self):
+        """Evict whatever other processes changed since the last call (caller holds the lock)"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        oldest = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if oldest is not None and oldest > self._seen_seq + 1:
+            # The log was pruned past what we have seen; we can't tell what changed
+            self._cache.clear()
+            self._keys.clear()
+            self._changed.extend((tbl, None) for tbl in self._watchers)
+        for seq, tbl, key in self._conn.execute(
+                "SELECT seq, tbl, key FROM changes WHERE seq > ? ORDER BY seq", (self._seen_seq,)):
+            self._cache.pop((tbl, key), None)
+            self._keys.pop(tbl, None)
+            self._seen_seq = seq
+            if tbl in self._watchers:
+                self._changed.append((tbl, key))
+        if len(self._changed) > CHANGE_LOG_SIZE:
+            # Reads note changes without delivering them; until a refresh, keep one "anything" per table
+            self._changed = [(tbl, None) for tbl in self._watchers]
+
+    def _notify(self):
+        """Tell the watchers about the changes noted so far (caller must not hold the lock).
+
+        Only the outermost call on a thread delivers: a watcher that reads
+        or writes the store queues its changes for the loop below rather
+        than being re-entered.
+        """
+        if getattr(self._delivering, "active", False):
+            return
+        self._delivering.active = True
+        try:
+            while True:
+                with self._lock:
+                    changed, self._changed = self._changed, []
+                if not changed:
+                    return
+                everything = {tbl for tbl, key in changed if key is None}
+                told: Set[Tuple[str, Optional[str]]] = set()
+                for tbl, key in changed:
+                    if (key is not None and tbl in everything) or (tbl, key) in told:
+                        continue
+                    told.add((tbl, key))
+                    for callback in self._watchers[tbl]:
+                        callback(key)
+        finally:
+            self._delivering.active = False
+
+    def watch(self, tbl: str, callback: Watcher):
+        with self._lock:
+            self._watchers.setdefault(tbl, []).append(callback)
+
+    def refresh(self):
+        """Pick up other processes' changes now and deliver them to the watchers"""
+        with self._lock:
+            self._sync()
+        self._notify()
+
+    def get(self, tbl: str, key: str) -> Optional[Record]:
+        with self._lock:
+            self._sync()
+            if (tbl, key) not in self._cache:
+                row = self._conn.execute("SELECT data FROM records WHERE tbl = ? AND key = ?", (tbl, key)).fetchone()
+                self._cache[(tbl, key)] = json.loads(row[0]) if row else None
+            return self._cache[(tbl, key)]
+
+    def keys(self, tbl: str) -> List[str]:
+        with self._lock:
+            self._sync()
+            if tbl not in self._keys:
+                # rowid order is insertion order, like the dicts of the memory store
+                self._keys[tbl] = [row[0] for row in self._conn.execute(
+                    "SELECT key FROM records WHERE tbl = ? ORDER BY rowid", (tbl,))]
+            return self._keys[tbl]
+
+    def patch(self, tbl: str, key: str, fields: Record) -> Record:
+        """Read-modify-write of one record in a single transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # take the write lock before reading
+            try:
+                row = self._conn.execute("SELECT data FROM records WHERE tbl = ? AND key = ?", (tbl, key)).fetchone()
+                if row is None:
+                    raise KeyError(key)
+                record = {**json.loads(row[0]), **fields}
+                self._conn.execute("UPDATE records SET data = ? WHERE tbl = ? AND key = ?",
+                                   (json.dumps(record), tbl, key))
+                self._conn.execute("INSERT INTO changes (tbl, key) VALUES (?, ?)", (tbl, key))
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self.prune_changes()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            # data_version does not move for our own commits, so update our cache directly
+            self._cache[(tbl, key)] = record
+            if tbl in self._watchers:
+                self._changed.append((tbl, key))
+        self._notify()
+        return record
+
+    # ---------- Bulk access (bulk.py) ----------
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """One write transaction around several put_many calls; rolled back if the block raises"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._cache.clear()  # may hold records from the rolled-back writes
+                self._keys.clear()
+                self._changed.extend((tbl, None) for tbl in self._watchers)
+                raise
+        self._notify()
+
+    def put_many(self, tbl: str, items: List[Tuple[str, str]], log: bool = True):
+        """Insert or replace (key, JSON text) records; the caller holds a transaction().
+
+        With log=False the keys are not written to the change log, and the
+        caller must end with invalidate_all() instead.
+        """
+        self._conn.executemany(
+            "INSERT INTO records (tbl, key, data) VALUES (?, ?, ?) "
+            "ON CONFLICT (tbl, key) DO UPDATE SET data = excluded.data",
+            [(tbl, key, data) for key, data in items])
+        if log:
+            self._conn.executemany("INSERT INTO changes (tbl, key) VALUES (?, ?)", [(tbl, key) for key, _ in items])
+        for key, _ in items:
+            self._cache.pop((tbl, key), None)
+        self._keys.pop(tbl, None)
+        if tbl in self._watchers:
+            self._changed.extend((tbl, key) for key, _ in items)
+
+    def prune_changes(self):
+        """Keep the last CHANGE_LOG_SIZE change-log rows; workers further behind reload everything"""
+        self._conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_SIZE,))
+
+    def invalidate_all(self):
+        """Make every worker reload everything: empty the change log, leaving a gap no worker can read past"""
+        top = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        seq = (top[0] if top else 0) + 2
+        self._conn.execute("DELETE FROM changes")
+        self._conn.execute("INSERT INTO changes (seq, tbl, key) VALUES (?, '', '')", (seq,))
+        self._cache.clear()
+        self._keys.clear()
+        self._seen_seq = seq
+        self._changed.extend((tbl, None) for tbl in self._watchers)
+
+    def existing_keys(self, tbl: str, keys: Iterable[str]) -> Set[str]:
+        """Which of `keys` are stored in `tbl` (reads uncommitted writes of a running transaction())"""
+        keys = list(keys)
+        found: Set[str] = set()
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            found.update(row[0] for row in self._conn.execute(
+                f"SELECT key FROM records WHERE tbl = ? AND key IN ({','.join('?' * len(chunk))})", (tbl, *chunk)))
+        return found
+
+    def scan(self, tbl: str) -> Iterator[Tuple[str, str]]:
+        """(key, JSON text) of every record in insertion order, streamed from a separate connection"""
+        conn = sqlite3.connect(self.path)
+        try:
+            yield from conn.execute("SELECT key, data FROM records WHERE tbl = ? ORDER BY rowid", (tbl,))
+        finally:
+            conn.close()
+
+class SqliteTable:
+    """Dict-like view of one table in a SqliteStore; records are returned as cached dicts, copy before changing"""
+
+    def __init__(self, store: SqliteStore, name: str):
+        self.store = store
+        self.name = name
+
+    def get(self, key: str, default: Any = None) -> Any:
+        record = self.store.get(self.name, key)
+        return default if record is None else record
+
+    def __getitem__(self, key: str) -> Record:
+        record = self.store.get(self.name, key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.store.get(self.name, key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.keys(self.name))
+
+    def __len__(self) -> int:
+        return len(self.store.keys(self.name))
+
+    def keys(self) -> List[str]:
+        return list(self.store.keys(self.name))
+
+    def items(self) -> Iterator[Tuple[str, Record]]:
+        for key in self.store.keys(self.name):
+            record = self.store.get(self.name, key)
+            if record is not None:
+                yield key, record
+
+    def patch(self, key: str, **fields: Any) -> Record:
+        return self.store.patch(self.name, key, fields)
+
+    def watch(self, callback: Watcher):
+        self.store.watch(self.name, callback)
+
+    def refresh(self):
+        self.store.refresh()
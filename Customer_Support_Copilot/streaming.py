@@ -0,0 +1,205 @@
+# streaming.py
+"""
+Streaming support for the copilot - turns the agent's event stream into
+token and tool-progress events and tracks time-to-first-byte per turn
+"""
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import budget
+
+@dataclass
+class StreamEvent:
+    """A single event emitted while a turn is being generated"""
+    kind: str                      # token | tool_start | tool_end | done | error
+    text: str = ""
+    tool: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+    # Full message list of the finished graph run (done events only, not serialized)
+    messages: List[Any] = field(default_factory=list, repr=False)
+
+    def to_json(self) -> str:
+        return json.dumps({"kind": self.kind, "text": self.text, "tool": self.tool, "data": self.data})
+
+    def to_sse(self) -> str:
+        """Server-Sent Events frame, for forwarding the stream to a network client"""
+        return f"event: {self.kind}\ndata: {self.to_json()}\n\n"
+
+@dataclass
+class TurnTiming:
+    """Wall-clock timings for one copilot turn"""
+    started: float = field(default_factory=time.perf_counter)
+    first_byte: Optional[float] = None
+    finished: Optional[float] = None
+    tool_calls: int = 0
+
+    def mark_first_byte(self):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        return None if self.first_byte is None else self.first_byte - self.started
+
+    @property
+    def total(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"ttfb_s": self.ttfb, "total_s": self.total, "tool_calls": self.tool_calls}
+
+class TimingLog:
+    """Keeps recent turn timings so TTFB can be reported alongside total latency"""
+
+    def __init__(self, max_turns: int = 200):
+        self.max_turns = max_turns
+        self.turns: List[TurnTiming] = []
+
+    def record(self, timing: TurnTiming):
+        self.turns.append(timing)
+        if len(self.turns) > self.max_turns:
+            del self.turns[0]
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[index]
+
+    def summary(self) -> Dict[str, Any]:
+        ttfbs = [t.ttfb for t in self.turns if t.ttfb is not None]
+        totals = [t.total for t in self.turns if t.total is not None]
+        return {
+            "turns": len(self.turns),
+            "last": self.turns[-1].as_dict() if self.turns else None,
+            "ttfb_p50_s": self._percentile(ttfbs, 50),
+            "ttfb_p95_s": self._percentile(ttfbs, 95),
+            "total_p50_s": self._percentile(totals, 50),
+            "total_p95_s": self._percentile(totals, 95),
+        }
+
+def _chunk_text(chunk: Any) -> str:
+    """Pull plain text out of a streamed message chunk (tool-call chunks have none)"""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return ""
+
+async def stream_agent(agent, inputs: Dict[str, Any], timing: TurnTiming,
+                       config: Optional[Dict[str, Any]] = None,
+                       deadline: Optional[float] = None) -> AsyncIterator[StreamEvent]:
+    """Run the agent with astream_events and yield token / tool progress events.
+
+    The final `done` event carries the text of the last model call, which is
+    the assistant's answer once all tool calls have finished. If `deadline`
+    (time.monotonic()) passes first, the run is cancelled and `done` carries
+    the answer so far or a fallback instead, with data["timed_out"] set.
+    """
+    answer_parts: List[str] = []
+    answering = False  # answer_parts belong to a model call no tool has run after
+    tool_results: List[str] = []
+    final_messages: List[Any] = []
+    try:
+        async for event in budget.within(agent.astream_events(inputs, config=config, version="v2"), deadline):
+            kind = event["event"]
+            if kind == "on_chat_model_start":
+                # A new model call starts - only the last one is the final answer
+                answer_parts = []
+                answering = True
+            elif kind == "on_chat_model_stream":
+                text = _chunk_text(event["data"].get("chunk"))
+                if text:
+                    timing.mark_first_byte()
+                    answer_parts.append(text)
+                    yield StreamEvent("token", text=text)
+            elif kind == "on_chat_model_end" and not answer_parts:
+                # Models without native streaming only report the finished message
+                text = _chunk_text(event["data"].get("output"))
+                if text:
+                    timing.mark_first_byte()
+                    answer_parts.append(text)
+                    yield StreamEvent("token", text=text)
+            elif kind == "on_tool_start":
+                answering = False
+                timing.tool_calls += 1
+                timing.mark_first_byte()
+                yield StreamEvent("tool_start", tool=event["name"],
+                                  data={"input": event["data"].get("input")})
+            elif kind == "on_tool_end":
+                output = str(getattr(event["data"].get("output"), "content", event["data"].get("output")) or "")
+                tool_results.append(output)
+                yield StreamEvent("tool_end", tool=event["name"], data={"chars": len(output)})
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"].get("output")
+                if isinstance(output, dict):
+                    final_messages = output.get("messages", [])
+    except budget.BudgetExceeded:
+        partial = "".join(answer_parts) if answering else ""
+        answer = budget.fallback_answer(partial, tool_results)
+        timing.mark_first_byte()
+        yield StreamEvent("token", text=answer[len(partial):])
+        timing.finish()
+        yield StreamEvent("done", text=answer, data={**timing.as_dict(), "timed_out": True})
+        return
+    except Exception as e:
+        timing.finish()
+        yield StreamEvent("error", text=f"Sorry, I encountered an error: {str(e)}",
+                          data=timing.as_dict())
+        return
+
+    timing.finish()
+    yield StreamEvent("done", text="".join(answer_parts), data=timing.as_dict(),
+                      messages=final_messages)
+
+async def run_agent(agent, inputs: Dict[str, Any], config: Optional[Dict[str, Any]] = None,
+                    deadline: Optional[float] = None) -> Tuple[List[Any], bool]:
+    """agent.ainvoke that stops at `deadline`: (final messages, True) or (messages so far, False)"""
+    messages = inputs["messages"]
+    try:
+        async for state in budget.within(agent.astream(inputs, config=config, stream_mode="values"), deadline):
+            messages = state["messages"]
+    except budget.BudgetExceeded:
+        return messages, False
+    return messages, True
+
+async def stream_text(text: str, timing: TurnTiming) -> AsyncIterator[StreamEvent]:
+    """Wrap an already-complete answer (e.g. a direct policy lookup) as a stream"""
+    timing.mark_first_byte()
+    yield StreamEvent("token", text=text)
+    timing.finish()
+    yield StreamEvent("done", text=text, data=timing.as_dict())
+
+async def print_stream(events: AsyncIterator[StreamEvent]) -> str:
+    """Print a stream to the terminal as it arrives and return the final answer"""
+    final = ""
+    at_line_start = False
+    async for event in events:
+        if event.kind == "token":
+            print(event.text, end="", flush=True)
+            at_line_start = event.text.endswith("\n")
+        elif event.kind == "tool_start":
+            prefix = "" if at_line_start else "\n"
+            print(f"{prefix}  ... {event.tool} running", flush=True)
+            at_line_start = True
+        elif event.kind == "tool_end":
+            print(f"  ... {event.tool} done", flush=True)
+            at_line_start = True
+        elif event.kind == "error":
+            print(event.text, flush=True)
+            final = event.text
+        elif event.kind == "done":
+            print()
+            final = event.text
+    return final
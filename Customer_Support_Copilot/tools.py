@@ -2,9 +2,33 @@
 """
 Enhanced MCP Tools Server with linked ticket/order relationships
 Using FastMCP for simplified server creation
+
+With TOOLS_SHARDS > 1 the process serves one shard (TOOLS_SHARD) of the
+data, on port TOOLS_SHARD_PORT + TOOLS_SHARD; shard_router.py routes the
+copilot's calls to the right shard (see sharding.py).
+
+With TOOLS_WORKERS > 1, that many worker processes serve one port over
+stateless HTTP and share the data through a SQLite file (TOOLS_DB), so
+any worker can answer any request (see store.py).
+
+Tool calls pass admission control (TOOLS_MAX_CONCURRENCY running, up to
+TOOLS_MAX_QUEUE waiting for at most TOOLS_MAX_QUEUE_WAIT seconds); waiting
+calls are admitted premium customers and urgent tickets first, and excess
+calls are shed with a retry-after hint (see middleware.AdmissionControl).
 """
 from fastmcp import FastMCP
+import functools
 import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import anyio
+
+import sharding
+from analytics import TicketStats
+from middleware import TracingMiddleware, install_admission_control, install_list_changed, install_metrics
+from store import CompactTable, MemoryTable, SqliteStore
 
 # Enhanced mock database with linked relationships
 TICKETS = {
@@ -99,10 +123,89 @@ CUSTOMERS = {
     }
 }
 
+# Where the (mutable) records live: in this process (as dicts, or compact columns), or shared by all workers
+WORKERS = int(os.getenv("TOOLS_WORKERS", "1"))
+STORE = os.getenv("TOOLS_STORE", "sqlite" if WORKERS > 1 else "memory")
+
+# Data files (NDJSON/CSV, e.g. a CRM export) replace the sample records above; see bulk.py
+if os.getenv("TOOLS_DATA"):
+    import bulk
+    TICKETS, ORDERS, CUSTOMERS = bulk.load_tables(
+        os.getenv("TOOLS_DATA").split(","),
+        factory=CompactTable if STORE == "compact" and sharding.SHARDS == 1 else dict)
+
+# Keep only this shard's customers and their tickets and orders
+SHARD = int(os.getenv("TOOLS_SHARD", "0"))
+if sharding.SHARDS > 1:
+    TICKETS, ORDERS, CUSTOMERS = sharding.partition(TICKETS, ORDERS, CUSTOMERS, SHARD)
+
+DB_PATH = os.getenv("TOOLS_DB", str(Path(__file__).parent / (
+    f"tools-shard{SHARD}.db" if sharding.SHARDS > 1 else "tools.db")))
+
+if STORE == "sqlite":
+    # The records above only seed a new database; after that it is the source of truth
+    _store = SqliteStore(DB_PATH)
+    TICKETS = _store.table("tickets", seed=TICKETS)
+    ORDERS = _store.table("orders", seed=ORDERS)
+    CUSTOMERS = _store.table("customers", seed=CUSTOMERS)
+elif STORE == "compact":
+    TICKETS, ORDERS, CUSTOMERS = (
+        table if isinstance(table, CompactTable) else CompactTable(table) for table in (TICKETS, ORDERS, CUSTOMERS))
+else:
+    TICKETS, ORDERS, CUSTOMERS = MemoryTable(TICKETS), MemoryTable(ORDERS), MemoryTable(CUSTOMERS)
+
+# Ticket counts for ticket_stats, kept current by every write to the tickets or customers
+STATS = TicketStats(TICKETS, CUSTOMERS)
+
 # Create FastMCP server
 mcp = FastMCP("Enhanced Customer Support Tools")
+mcp.add_middleware(TracingMiddleware("tools"))
+metrics = install_metrics(mcp, "tools")
+list_changed = install_list_changed(mcp)
+
+# ---------- Admission control ----------
+
+MAX_CONCURRENCY = int(os.getenv("TOOLS_MAX_CONCURRENCY", "8"))  # 0 turns admission control off
+MAX_QUEUE = int(os.getenv("TOOLS_MAX_QUEUE", "64"))
+MAX_QUEUE_WAIT_S = float(os.getenv("TOOLS_MAX_QUEUE_WAIT", "1"))
+
+TIER_RANK = {"premium": 0, "standard": 2}
+PRIORITY_RANK = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
 
-@mcp.tool()
+def _record(table, key: Any):
+    return table.get(key) if isinstance(key, str) else None
+
+def _call_priority(tool: str, arguments: Dict[str, Any]) -> Tuple[int, int]:
+    ticket = _record(TICKETS, arguments.get("ticket_id") or arguments.get("reference_id"))
+    order = _record(ORDERS, arguments.get("order_id") or arguments.get("reference_id"))
+    customer = _record(CUSTOMERS, arguments.get("customer_id") or (ticket or order or {}).get("customer"))
+    tier = TIER_RANK.get((customer or {}).get("tier"), TIER_RANK["standard"])
+    priority = PRIORITY_RANK.get((ticket or {}).get("priority"), PRIORITY_RANK["medium"])
+    return min(tier, priority), tier + priority
+
+async def call_priority(tool: str, arguments: Dict[str, Any]) -> Tuple[int, int]:
+    """Admission order of a call, lower first: premium customers and urgent tickets lead, then high, ..."""
+    if STORE != "sqlite":
+        return _call_priority(tool, arguments)  # in-process tables don't block
+    # SQLite reads block, like the tool bodies: keep them off the event loop
+    return await anyio.to_thread.run_sync(_call_priority, tool, arguments)
+
+if MAX_CONCURRENCY > 0:
+    admission = install_admission_control(mcp, "tools", call_priority, MAX_CONCURRENCY, MAX_QUEUE, MAX_QUEUE_WAIT_S)
+
+def tool(fn):
+    """mcp.tool(), but with admission control on the body runs on a worker thread,
+    so calls queue in the admission order instead of blocking the event loop one by one"""
+    if MAX_CONCURRENCY <= 0:
+        return mcp.tool(fn)
+
+    @functools.wraps(fn)
+    async def threaded(**arguments):
+        return await anyio.to_thread.run_sync(functools.partial(fn, **arguments))
+
+    return mcp.tool(threaded)
+
+@tool
 def get_ticket_status(ticket_id: str) -> str:
     """Get the status and details of a support ticket, including linked order info"""
     if ticket_id in TICKETS:
@@ -125,7 +228,7 @@ def get_ticket_status(ticket_id: str) -> str:
     else:
         return f"Ticket {ticket_id} not found"
 
-@mcp.tool()
+@tool
 def get_order_info(order_id: str) -> str:
     """Get order information including items, status, and related tickets"""
     if order_id in ORDERS:
@@ -157,9 +260,13 @@ def get_order_info(order_id: str) -> str:
     else:
         return f"Order {order_id} not found"
 
-@mcp.tool()
+@tool
 def get_customer_details(customer_id: str) -> str:
     """Get customer information including name, email, tier, and complete history"""
+    return _customer_details(customer_id)
+
+def _customer_details(customer_id: str) -> str:
+    # Plain function so search_by_customer can reuse it (@mcp.tool() returns a Tool object, not a callable)
     if customer_id in CUSTOMERS:
         customer = CUSTOMERS[customer_id].copy()
         
@@ -195,7 +302,7 @@ def get_customer_details(customer_id: str) -> str:
     else:
         return f"Customer {customer_id} not found"
 
-@mcp.tool()
+@tool
 def initiate_return(reference_id: str, reason: str = "No reason provided") -> str:
     """Initiate a return process for an order or ticket"""
     # Check if it's a ticket or order
@@ -229,7 +336,7 @@ def initiate_return(reference_id: str, reason: str = "No reason provided") -> st
     
     return json.dumps(result, indent=2)
 
-@mcp.tool()
+@tool
 def escalate_ticket(ticket_id: str, department: str, notes: str = "") -> str:
     """Escalate a ticket to higher priority or different department"""
     if ticket_id in TICKETS:
@@ -246,18 +353,17 @@ def escalate_ticket(ticket_id: str, department: str, notes: str = "") -> str:
             "linked_order": ticket.get("order_id", "N/A")
         }
         # Update ticket priority
-        TICKETS[ticket_id]["priority"] = "urgent"
-        TICKETS[ticket_id]["escalated_to"] = department
+        TICKETS.patch(ticket_id, priority="urgent", escalated_to=department)
         return json.dumps(result, indent=2)
     else:
         return json.dumps({"error": f"Ticket {ticket_id} not found"})
 
-@mcp.tool()
+@tool
 def search_by_customer(customer_name: str) -> str:
     """Find customer by name and return their details"""
     for customer_id, customer_data in CUSTOMERS.items():
         if customer_data["name"].lower() == customer_name.lower():
-            return get_customer_details(customer_id)
+            return _customer_details(customer_id)
     
     # Partial name matching
     matches = []
@@ -275,6 +381,33 @@ def search_by_customer(customer_name: str) -> str:
     else:
         return f"No customer found matching '{customer_name}'"
 
+@tool
+def ticket_stats(status: str = "", priority: str = "", department: str = "", tier: str = "") -> str:
+    """Count tickets by status, priority, department and customer tier; give any of them to count only those"""
+    TICKETS.refresh()  # other workers' writes
+    return json.dumps(STATS.query(status=status, priority=priority, department=department, tier=tier), indent=2)
+
+def shard_index() -> str:
+    """Which tickets, orders and customers this shard holds (read by shard_router.py)"""
+    return json.dumps({
+        "shard": SHARD,
+        "tickets": {ticket_id: ticket["customer"] for ticket_id, ticket in TICKETS.items()},
+        "orders": {order_id: order["customer"] for order_id, order in ORDERS.items()},
+        "customers": list(CUSTOMERS),
+    })
+
+if sharding.SHARDS > 1:
+    tool(shard_index)
+
+# ASGI app each worker serves; stateless, so requests of one MCP session may land on any worker
+app = mcp.http_app(transport="streamable-http", stateless_http=True) if WORKERS > 1 else None
+
 if __name__ == "__main__":
     # Run server with streamable-http transport
-    mcp.run(transport="streamable-http", port=8001)
\ No newline at end of file
+    port = sharding.shard_port(SHARD) if sharding.SHARDS > 1 else 8001
+    if WORKERS > 1:
+        import uvicorn
+        uvicorn.run("tools:app", host="127.0.0.1", port=port, workers=WORKERS,
+                    app_dir=str(Path(__file__).parent), log_level="warning")
+    else:
+        mcp.run(transport="streamable-http", port=port)
\ No newline at end of file
@@ -0,0 +1,260 @@
+# tracing.py
+"""
+Lightweight latency tracing for the copilot and the MCP servers.
+
+Spans nest through contextvars and are exported as JSON lines to a file or
+as one-line summaries to the console:
+
+    TRACE_EXPORTER=console python copilot.py
+    TRACE_EXPORTER=file TRACE_FILE=traces.jsonl python tools.py
+
+Trace context crosses the HTTP hop in a W3C `traceparent` header
+(inject_headers() on the client, remote_parent() on the server). With
+TRACE_EXPORTER unset, span() hands back a shared no-op object, so
+instrumented code pays next to nothing.
+"""
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:  # servers don't need langchain
+    BaseCallbackHandler = object
+
+# (trace_id, span_id) of the active span
+_current: ContextVar[Optional[Tuple[str, str]]] = ContextVar("trace_context", default=None)
+
+@dataclass
+class Span:
+    """One timed operation"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    service: str
+    start_time: float = field(default_factory=time.time)
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+    duration_ms: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "service": self.service,
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "start_time": self.start_time, "duration_ms": self.duration_ms,
+            "status": self.status, "error": self.error, "attributes": self.attributes,
+        }
+
+class _NoopSpan:
+    """Returned when tracing is disabled"""
+    def set(self, **attributes: Any):
+        pass
+
+    def fail(self, error: BaseException):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+# ---------- Exporters ----------
+
+class ConsoleExporter:
+    """One line per finished span on stderr"""
+    def export(self, span: Span):
+        parent = span.parent_id or "-"
+        print(f"[trace] {span.service} {span.name} {span.duration_ms}ms "
+              f"{span.status} trace={span.trace_id[:8]} span={span.span_id} parent={parent} "
+              f"{json.dumps(span.attributes, default=str) if span.attributes else ''}",
+              file=sys.stderr, flush=True)
+
+class FileExporter:
+    """Appends finished spans to a JSON-lines file"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+_exporter = None
+_service = os.getenv("TRACE_SERVICE", "copilot")
+
+def configure(exporter: Optional[str] = None, service: Optional[str] = None, path: Optional[str] = None):
+    """Pick an exporter ("console", "file" or "none"); defaults come from TRACE_EXPORTER/TRACE_FILE"""
+    global _exporter, _service
+    if service:
+        _service = os.getenv("TRACE_SERVICE", service)
+    exporter = exporter or os.getenv("TRACE_EXPORTER", "none")
+    if exporter == "console":
+        _exporter = ConsoleExporter()
+    elif exporter == "file":
+        _exporter = FileExporter(path or os.getenv("TRACE_FILE", "traces.jsonl"))
+    else:
+        _exporter = None
+
+def enabled() -> bool:
+    return _exporter is not None
+
+def service_name() -> str:
+    return _service
+
+# ---------- Spans ----------
+
+def start_span(name: str, parent: Optional[Tuple[str, str]] = None, **attributes: Any) -> Span:
+    """Create a span without making it current (for callback-driven spans)"""
+    parent = parent or _current.get()
+    trace_id = parent[0] if parent else secrets.token_hex(16)
+    return Span(name=name, trace_id=trace_id, span_id=secrets.token_hex(8),
+                parent_id=parent[1] if parent else None, service=_service,
+                attributes=dict(attributes))
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Time the enclosed block as a child of the current span"""
+    if _exporter is None:
+        yield NOOP_SPAN
+        return
+    current = start_span(name, **attributes)
+    token = _current.set((current.trace_id, current.span_id))
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.finish()
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ---------- Propagation ----------
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add a W3C traceparent header for the current span (no-op when disabled)"""
+    headers = dict(headers or {})
+    current = _current.get()
+    if _exporter is not None and current:
+        headers["traceparent"] = f"00-{current[0]}-{current[1]}-01"
+    return headers
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+@contextmanager
+def remote_parent(headers: Mapping[str, str]) -> Iterator[None]:
+    """Make the caller's span (from a traceparent header) the parent of spans opened inside"""
+    parent = parse_traceparent(headers.get("traceparent")) if _exporter is not None else None
+    if parent is None:
+        yield
+        return
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+# ---------- Agent steps ----------
+
+class AgentStepTracer(BaseCallbackHandler):
+    """LangChain callback that records a span per graph node, model call and tool run.
+
+    Spans are parented to whichever span was current when the tracer was
+    created (normally the process_query turn span).
+    """
+
+    def __init__(self):
+        self.parent = _current.get()
+        self._spans: Dict[Any, Span] = {}
+
+    def _start(self, run_id, name: str, **attributes: Any):
+        self._spans[run_id] = start_span(name, parent=self.parent, **attributes)
+
+    def _end(self, run_id, error: Optional[BaseException] = None):
+        current = self._spans.pop(run_id, None)
+        if current is not None:
+            if error is not None:
+                current.fail(error)
+            current.finish()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._start(run_id, f"agent.step {node}", step=(metadata or {}).get("langgraph_step"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "agent.llm", messages=sum(len(batch) for batch in messages))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, f"agent.tool {(serialized or {}).get('name', 'tool')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+def agent_config() -> Optional[Dict[str, Any]]:
+    """Run config for agent.ainvoke/astream_events - adds the step tracer when tracing is on"""
+    if _exporter is None:
+        return None
+    return {"callbacks": [AgentStepTracer()]}
+
+configure()
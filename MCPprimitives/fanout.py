@@ -0,0 +1,168 @@
+# fanout.py
+"""
+Concurrent fan-out for reading many resources or prompts over one session.
+
+Requests run on a fixed pool of workers (at most `concurrency` in flight),
+so a snapshot of N resources costs about N / concurrency round trips
+instead of N. Results are yielded as they complete, each with its own
+timing; failures are reported per item instead of aborting the batch.
+
+    async for item in read_resources(session, uris, concurrency=16):
+        print(item.key, item.elapsed_ms, item.error or item.value)
+"""
+import asyncio
+import itertools
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from mcp import ClientSession
+from mcp.types import Resource, ResourceTemplate
+
+DEFAULT_CONCURRENCY = int(os.getenv("MCP_FANOUT_CONCURRENCY", "8"))
+
+@dataclass
+class FetchResult:
+    """Outcome of one request in a fan-out"""
+    key: str
+    value: Any = None
+    error: Optional[BaseException] = None
+    wait_ms: float = 0.0     # queued behind the concurrency limit
+    elapsed_ms: float = 0.0  # the request itself
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+async def fan_out(
+    jobs: Iterable[Tuple[str, Callable[[], Awaitable[Any]]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> AsyncIterator[FetchResult]:
+    """Run (key, call) jobs with bounded concurrency, yielding results in completion order"""
+    jobs = iter(jobs)
+    results: asyncio.Queue = asyncio.Queue()
+    start = time.perf_counter()
+
+    async def worker():
+        for key, call in jobs:  # workers share the iterator, so each job runs once
+            begin = time.perf_counter()
+            item = FetchResult(key, wait_ms=(begin - start) * 1000)
+            try:
+                item.value = await call()
+            except Exception as e:
+                item.error = e
+            item.elapsed_ms = (time.perf_counter() - begin) * 1000
+            await results.put(item)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    pending = len(workers)
+    done = object()
+    for task in workers:
+        task.add_done_callback(lambda _: results.put_nowait(done))
+    try:
+        while pending:
+            item = await results.get()
+            if item is done:
+                pending -= 1
+            else:
+                yield item
+    finally:
+        # The consumer stopped early (break/cancel): don't leave requests running
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+# ---------- Listing ----------
+
+async def list_all_resources(session: ClientSession) -> List[Resource]:
+    resources, cursor = [], None
+    while True:
+        page = await session.list_resources(cursor=cursor)
+        resources.extend(page.resources)
+        cursor = page.nextCursor
+        if not cursor:
+            return resources
+
+async def list_all_resource_templates(session: ClientSession) -> List[ResourceTemplate]:
+    templates, cursor = [], None
+    while True:
+        page = await session.list_resource_templates(cursor=cursor)
+        templates.extend(page.resourceTemplates)
+        cursor = page.nextCursor
+        if not cursor:
+            return templates
+
+_TEMPLATE_VAR = re.compile(r"{(\w+)}")
+
+def expand_template(uri_template: str, values: Dict[str, List[str]]) -> List[str]:
+    """Every URI a template yields for the given candidate values; [] if a variable has none.
+    Values are percent-encoded (RFC 6570 simple expansion), so "New York" stays a valid URI."""
+    names = list(dict.fromkeys(_TEMPLATE_VAR.findall(uri_template)))
+    if any(not values.get(name) for name in names):
+        return []
+    uris = []
+    for combo in itertools.product(*(values[name] for name in names)):
+        bound = dict(zip(names, combo))
+        uris.append(_TEMPLATE_VAR.sub(lambda m: quote(str(bound[m.group(1)]), safe=""), uri_template))
+    return uris
+
+async def discover_uris(session: ClientSession, template_values: Optional[Dict[str, List[str]]] = None) -> List[str]:
+    """Static resource URIs plus every template expanded over template_values"""
+    resources, templates = await asyncio.gather(
+        list_all_resources(session), list_all_resource_templates(session)
+    )
+    uris = [str(r.uri) for r in resources]
+    for t in templates:
+        uris.extend(expand_template(t.uriTemplate, template_values or {}))
+    return list(dict.fromkeys(uris))
+
+# ---------- Reading ----------
+
+def read_resources(
+    session: ClientSession, uris: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY
+) -> AsyncIterator[FetchResult]:
+    """read_resource for each URI; value is the ReadResourceResult"""
+    return fan_out(((uri, lambda uri=uri: session.read_resource(uri)) for uri in uris), concurrency)
+
+def get_prompts(
+    session: ClientSession,
+    requests: Iterable[Tuple[str, Optional[Dict[str, str]]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> AsyncIterator[FetchResult]:
+    """get_prompt for each (name, arguments); value is the GetPromptResult"""
+    return fan_out(
+        ((f"{name}{arguments or ''}", lambda name=name, arguments=arguments: session.get_prompt(name, arguments))
+         for name, arguments in requests),
+        concurrency,
+    )
+
+async def snapshot_resources(
+    session: ClientSession,
+    template_values: Optional[Dict[str, List[str]]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_result: Optional[Callable[[FetchResult], None]] = None,
+) -> Dict[str, Any]:
+    """Discover and read everything; returns {uri: text}, per-URI errors and timing"""
+    start = time.perf_counter()
+    contents: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    timings: Dict[str, float] = {}
+    async for item in read_resources(session, await discover_uris(session, template_values), concurrency):
+        timings[item.key] = round(item.elapsed_ms, 3)
+        if item.ok:
+            contents[item.key] = "\n".join(
+                c.text if hasattr(c, "text") else f"<{len(c.blob)} bytes base64>" for c in item.value.contents
+            )
+        else:
+            errors[item.key] = str(item.error)
+        if on_result:
+            on_result(item)
+    return {
+        "contents": contents,
+        "errors": errors,
+        "timings_ms": timings,
+        "wall_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
@@ -1,17 +1,144 @@
 # math_server.py
+"""
+Math MCP server: scalar add/multiply, a safe `evaluate` for whole
+expressions (one tool call instead of one per operator), and NumPy-backed
+batch tools for arrays. Inputs may be integers or floats.
+"""
+import ast
+import math
+import operator
+import re
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
 from mcp.server.fastmcp import FastMCP
 
 mcp = FastMCP("Math")
 
+Number = Union[int, float]
+
 @mcp.tool()
-def add(a: int, b: int) -> int:
+def add(a: Number, b: Number) -> Number:
     """Add two numbers"""
     return a + b
 
 @mcp.tool()
-def multiply(a: int, b: int) -> int:
+def multiply(a: Number, b: Number) -> Number:
     """Multiply two numbers"""
     return a * b
 
+# ---------- Expression evaluation ----------
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_EXPONENT = 1000
+MAX_INT_BITS = 4096  # keeps huge integer intermediates from eating CPU/memory
+MAX_ROUND_DIGITS = 100
+
+BINARY_OPS: Dict[type, Callable] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPS: Dict[type, Callable] = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+def _round(value: Number, ndigits: Optional[int] = None) -> Number:
+    if ndigits is not None and abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ValueError(f"round() takes at most {MAX_ROUND_DIGITS} digits")
+    return round(value, ndigits)
+
+FUNCTIONS: Dict[str, Callable] = {
+    "abs": abs, "round": _round, "min": min, "max": max,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "floor": math.floor, "ceil": math.ceil,
+}
+CONSTANTS: Dict[str, float] = {"pi": math.pi, "e": math.e}
+
+# "(3 + 5) x 12", "3 × 4" and "2 ^ 8" as people write them; the x of a hex literal (0x10) stays
+_TIMES = re.compile(r"(?<=[\d.)\s])(?:×|(?<!(?<![\w.])0)x)(?=[\s\d.(])")
+
+def _checked(value: Number) -> Number:
+    if isinstance(value, complex):
+        raise ValueError("Result is not a real number")
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ValueError("Result is too large")
+    return value
+
+def _eval_node(node: ast.AST) -> Number:
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+        left, right = _eval_node(node.left), _eval_node(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > MAX_EXPONENT:
+            raise ValueError(f"Exponent larger than {MAX_EXPONENT}")
+        return _checked(BINARY_OPS[type(node.op)](left, right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+        return UNARY_OPS[type(node.op)](_eval_node(node.operand))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS and not node.keywords):
+        return _checked(FUNCTIONS[node.func.id](*(_eval_node(arg) for arg in node.args)))
+    raise ValueError(f"Unsupported syntax: {ast.dump(node)[:60]}")
+
+def evaluate_expression(expression: str) -> Number:
+    """Evaluate arithmetic without eval(): only numbers, + - * / // % **, and FUNCTIONS/CONSTANTS"""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    normalized = _TIMES.sub("*", expression).replace("^", "**")
+    return _eval_node(ast.parse(normalized, mode="eval"))
+
+@mcp.tool()
+def evaluate(expression: str) -> Number:
+    """Evaluate an arithmetic expression such as '(3 + 5) * 12' or 'sqrt(2) ** 2' in one step.
+    Supports + - * / // % ** (or ^), parentheses, pi, e and abs, round, min, max, sqrt, exp, log, log10, sin, cos, tan, floor, ceil."""
+    return evaluate_expression(expression)
+
+# ---------- Batch tools (NumPy) ----------
+
+MAX_ARRAY_LENGTH = 1_000_000
+
+REDUCTIONS: Dict[str, Callable] = {
+    "sum": np.sum, "mean": np.mean, "min": np.min, "max": np.max,
+    "prod": np.prod, "std": np.std, "median": np.median,
+}
+
+def _array(values: List[Number]) -> np.ndarray:
+    if len(values) > MAX_ARRAY_LENGTH:
+        raise ValueError(f"Arrays are limited to {MAX_ARRAY_LENGTH} elements")
+    return np.asarray(values)
+
+def _pair(a: List[Number], b: List[Number]):
+    x, y = _array(a), _array(b)
+    if len(x) != len(y) and len(y) != 1:
+        raise ValueError(f"Arrays must have the same length (got {len(x)} and {len(y)}), or b a single value")
+    return x, y
+
+@mcp.tool()
+def add_arrays(a: List[Number], b: List[Number]) -> List[Number]:
+    """Elementwise a + b for two equal-length arrays (b may be a single value)"""
+    x, y = _pair(a, b)
+    return np.add(x, y).tolist()
+
+@mcp.tool()
+def multiply_arrays(a: List[Number], b: List[Number]) -> List[Number]:
+    """Elementwise a * b for two equal-length arrays (b may be a single value)"""
+    x, y = _pair(a, b)
+    return np.multiply(x, y).tolist()
+
+@mcp.tool()
+def reduce_array(values: List[Number], operation: str = "sum") -> Number:
+    """Reduce an array to one number: sum, mean, min, max, prod, std or median"""
+    if operation not in REDUCTIONS:
+        raise ValueError(f"Unknown operation '{operation}'. Available: {', '.join(REDUCTIONS)}")
+    if not values:
+        raise ValueError("values must not be empty")
+    return REDUCTIONS[operation](_array(values)).item()
+
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
\ No newline at end of file
+    mcp.run(transport="stdio")
@@ -0,0 +1,153 @@
+# mcp_runtime.py
+"""
+Reusable client runtime for MultiServerMCPClient.
+
+- Server processes are started once, on first use, and stay warm across
+  agent invocations until the runtime is closed.
+- Tool discovery runs for all servers in parallel.
+- Tool schemas are cached on disk, keyed by a fingerprint of the server's
+  launch config, its script file(s) and the mcp version. When nothing has
+  changed, get_tools() neither spawns a process nor lists tools; the process
+  starts on the first actual tool call.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.types import Tool
+
+DEFAULT_CACHE_PATH = Path(os.getenv("MCP_TOOL_CACHE", Path(__file__).parent / ".mcp_tool_cache.json"))
+
+def server_fingerprint(connection: Dict[str, Any]) -> str:
+    """Hash of everything that can change a server's tool list"""
+    digest = hashlib.sha256(json.dumps(connection, sort_keys=True, default=str).encode())
+    for arg in connection.get("args", []):
+        path = Path(arg)
+        if path.is_file():
+            digest.update(path.read_bytes())
+    try:
+        digest.update(version("mcp").encode())
+    except PackageNotFoundError:
+        pass
+    return digest.hexdigest()[:16]
+
+class WarmSession:
+    """Lazily started, long-lived session to one server.
+
+    A background task owns the stdio process and session (they must be
+    closed by the task that opened them); callers share the session.
+    Tools built on it call `call_tool` like on a ClientSession.
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server_name: str):
+        self.client = client
+        self.server_name = server_name
+        self._session: Optional[ClientSession] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ClientSession:
+        async with self._lock:
+            if self._session is None:
+                ready = asyncio.get_running_loop().create_future()
+                self._closing = asyncio.Event()
+                self._task = asyncio.create_task(self._hold(ready))
+                self._session = await ready
+        return self._session
+
+    async def _hold(self, ready: asyncio.Future):
+        try:
+            async with self.client.session(self.server_name) as session:
+                ready.set_result(session)
+                await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self._session = None
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs):
+        session = await self.get()
+        return await session.call_tool(name, arguments, **kwargs)
+
+    async def close(self):
+        if self._closing is not None:
+            self._closing.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+class MCPRuntime:
+    """MultiServerMCPClient with warm server processes and an on-disk tool catalog"""
+
+    def __init__(self, connections: Dict[str, Dict[str, Any]], cache_path: Path = DEFAULT_CACHE_PATH):
+        self.connections = connections
+        self.cache_path = Path(cache_path)
+        self.client = MultiServerMCPClient(connections)
+        self.sessions = {name: WarmSession(self.client, name) for name in connections}
+        self.cache_hits: List[str] = []
+
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict[str, Any]):
+        tmp = self.cache_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+        os.replace(tmp, self.cache_path)
+
+    async def _server_tools(self, name: str, cached: Optional[Dict[str, Any]], refresh: bool) -> Dict[str, Any]:
+        fingerprint = server_fingerprint(self.connections[name])
+        if not refresh and cached and cached.get("fingerprint") == fingerprint:
+            self.cache_hits.append(name)
+            return cached
+
+        session = await self.sessions[name].get()
+        tools, cursor = [], None
+        while True:
+            page = await session.list_tools(cursor=cursor)
+            tools.extend(tool.model_dump(mode="json", exclude_none=True) for tool in page.tools)
+            cursor = page.nextCursor
+            if not cursor:
+                break
+        return {"fingerprint": fingerprint, "tools": tools}
+
+    async def get_tools(self, refresh: bool = False) -> List[BaseTool]:
+        """LangChain tools for every server, discovered in parallel (or from the cache)"""
+        cache = self._load_cache()
+        self.cache_hits = []
+        names = list(self.connections)
+        catalogs = await asyncio.gather(*(
+            self._server_tools(name, cache.get(name), refresh) for name in names
+        ))
+
+        fresh = dict(zip(names, catalogs))
+        if fresh != {name: cache.get(name) for name in names}:
+            self._save_cache({**cache, **fresh})
+
+        return [
+            convert_mcp_tool_to_langchain_tool(self.sessions[name], Tool.model_validate(tool), server_name=name)
+            for name in names
+            for tool in fresh[name]["tools"]
+        ]
+
+    async def aclose(self):
+        """Stop the server processes"""
+        await asyncio.gather(*(session.close() for session in self.sessions.values()))
+
+    async def __aenter__(self) -> "MCPRuntime":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -1,13 +1,32 @@
 #mcpclient.py
 import os
+import sys
 import asyncio
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from pathlib import Path
 from langgraph.prebuilt import create_react_agent
 from langchain_groq import ChatGroq
 from langchain_core.callbacks import AsyncCallbackHandler
 
+from mcp_runtime import MCPRuntime
+
 from dotenv import load_dotenv
 load_dotenv()
+
+HERE = Path(__file__).parent
+
+# Servers live next to this file and run with the current interpreter
+SERVERS = {
+    "math": {
+        "command": sys.executable,
+        "args": [str(HERE / "math_server.py")],
+        "transport": "stdio",
+    },
+    "weather": {
+        "command": sys.executable,
+        "args": [str(HERE / "weather_server.py")],
+        "transport": "stdio",
+    },
+}
  
 
 # Callback to log tool calls for debugging
@@ -19,30 +38,19 @@ class ToolCallLogger(AsyncCallbackHandler):
  
 
 async def main():
+    # Server processes stay up for both agent runs below
+    async with MCPRuntime(SERVERS) as runtime:
+        await run_agent(runtime)
 
-    # Create MCP client
-    client = MultiServerMCPClient(
-        {
-            "math": {
-                "command": "python",
-                "args": ["C:/Users/sonal.binji/Documents/mcp/try1/math_server.py"],
-                "transport": "stdio",
-            },
-            "weather": {
-                "command": "python",
-                "args": ["C:/Users/sonal.binji/Documents/mcp/try1/weather_server.py"],
-                "transport": "stdio", 
-            }
-        }
-    )
- 
-    # Get available tools from MCP server
-    tools = await client.get_tools()
+async def run_agent(runtime: MCPRuntime):
+    # Get available tools from MCP server (from the on-disk cache when the servers haven't changed)
+    tools = await runtime.get_tools()
  
     # Groq LLM setup with system prompt
     system_prompt = (
-        "You are a math assistant. For expressions like (a + b) x c, first compute the addition (a + b) using the 'add' tool, "
-        "then use the result with the 'multiply' tool to multiply by c. Ensure all tool inputs are integers."
+        "You are a math assistant. For a whole expression like (a + b) x c, call the 'evaluate' tool once with the full "
+        "expression instead of chaining 'add' and 'multiply'. For lists of numbers use 'add_arrays', 'multiply_arrays' "
+        "or 'reduce_array'. Tool inputs may be integers or decimals."
     )
     groq_llm = ChatGroq(
         groq_api_key=os.getenv("GROQ_API_KEY"),
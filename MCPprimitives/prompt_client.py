@@ -2,11 +2,20 @@ import asyncio
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from fanout import get_prompts
+
 server_params = StdioServerParameters(
     command="python",
     args=["prompt_server.py"]
 )
 
+PROMPT_REQUESTS = [
+    ("greet-user", {"name": "Alice", "style": "formal"}),
+    ("greet-user", {"name": "Bob", "style": "friendly"}),
+    ("ask-weather", {"city": "Chennai"}),
+    ("ask-weather", {"city": "Paris"}),
+]
+
 async def run():
     async with stdio_client(server_params) as (read, write):
         async with ClientSession(read, write) as session:
@@ -18,16 +27,14 @@ async def run():
             for p in prompts.prompts:
                 print("-", p.name)
 
-            # Fetch a greeting prompt
-            print("\nFetching greet-user prompt:")
-            result = await session.get_prompt("greet-user", {"name": "Alice", "style": "formal"})
-            for message in result.messages:
-                print(f"[{message.role}] {message.content.text}")
-
-            # Fetch a weather prompt
-            print("\nFetching ask-weather prompt:")
-            result = await session.get_prompt("ask-weather", {"city": "Chennai"})
-            for message in result.messages:
-                print(f"[{message.role}] {message.content.text}")
+            # Fetch all prompts concurrently; results print as they arrive
+            print()
+            async for item in get_prompts(session, PROMPT_REQUESTS, concurrency=4):
+                print(f"Fetched {item.key} in {item.elapsed_ms:.1f} ms:")
+                if not item.ok:
+                    print("  failed:", item.error)
+                    continue
+                for message in item.value.messages:
+                    print(f"[{message.role}] {message.content.text}")
 
 asyncio.run(run())
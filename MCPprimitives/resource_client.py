@@ -2,40 +2,37 @@ import asyncio
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from fanout import discover_uris, read_resources
+
 server_params = StdioServerParameters(
     command="python",
     args=["resource_server.py"]
 )
 
+# Values to expand dynamic templates with (example: weather://{city})
+TEMPLATE_VALUES = {"city": ["Paris", "London", "Tokyo", "Chennai", "New York"]}
+
 async def run():
     async with stdio_client(server_params) as (read, write):
         async with ClientSession(read, write) as session:
             await session.initialize()
 
-            # --- Static Resources ---
-            resources = await session.list_resources()
-            print("Static Resources:")
-            for r in resources.resources:
-                print("-", r.uri)
-
-            # Fetch static resource(s)
-            for r in resources.resources:
-                result = await session.read_resource(r.uri)
-                for content in result.contents:
-                    print(f"[{content.uri}] =>", content.text)
-
-            # --- Dynamic Resource Templates ---
-            templates = await session.list_resource_templates()
-            print("\nDynamic Templates:")
-            for t in templates.resourceTemplates:
-                print("-", t.uriTemplate)
+            # --- Static resources and expanded templates ---
+            uris = await discover_uris(session, TEMPLATE_VALUES)
+            print("Resources:")
+            for uri in uris:
+                print("-", uri)
 
-            # Fetch dynamic resource (example: weather://Paris)
-            for t in templates.resourceTemplates:
-                if "{city}" in t.uriTemplate:
-                    uri = t.uriTemplate.replace("{city}", "Paris")
-                    result = await session.read_resource(uri)
-                    for content in result.contents:
-                        print(f"[{content.uri}] =>", content.text)
+            # Read them all concurrently; results print as they arrive
+            print()
+            total_ms = 0.0
+            async for item in read_resources(session, uris, concurrency=8):
+                total_ms += item.elapsed_ms
+                if not item.ok:
+                    print(f"[{item.key}] ({item.elapsed_ms:.1f} ms) failed: {item.error}")
+                    continue
+                for content in item.value.contents:
+                    print(f"[{content.uri}] ({item.elapsed_ms:.1f} ms) =>", content.text)
+            print(f"\nRead {len(uris)} resources; {total_ms:.1f} ms of requests in total")
 
 asyncio.run(run())
@@ -1,6 +1,19 @@
 # weather_server.py
+"""
+Weather MCP server backed by weatherapi.com.
+
+Upstream calls share one pooled async HTTP client, successful answers are
+cached per location for WEATHER_CACHE_TTL seconds, and concurrent requests
+for the same location are coalesced into a single upstream call.
+WEATHER_API_URL can point the server at a local stub API for testing.
+"""
+import asyncio
+import logging
 import os
-import requests
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 
@@ -9,44 +22,154 @@ load_dotenv()  # Load your WEATHER_API_KEY from .env
 mcp = FastMCP("Weather")
 
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1/current.json")
+CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL", "300"))
+HTTP_TIMEOUT_S = float(os.getenv("WEATHER_HTTP_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("WEATHER_MAX_CONNECTIONS", "20"))
+BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "5"))
+MAX_BATCH_SIZE = 50
+
+# ---------- HTTP client, cache and request coalescing ----------
+
+# httpx logs every request URL at INFO, and ours carry the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+_client: Optional[httpx.AsyncClient] = None
+_cache: Dict[str, Tuple[float, str]] = {}  # location key -> (expires_at, report)
+_in_flight: Dict[str, asyncio.Future] = {}  # location key -> pending upstream call
+MAX_CACHE_ENTRIES = 1024
+
+class WeatherLookupError(Exception):
+    """The API answered but could not resolve the location"""
+
+def http_client() -> httpx.AsyncClient:
+    """Shared client, so connections (and TLS sessions) are reused across calls"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT_S),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+def _cache_key(location: str) -> str:
+    return " ".join(location.lower().split())
+
+def _remember(key: str, report: str):
+    now = time.monotonic()
+    if len(_cache) >= MAX_CACHE_ENTRIES:
+        for stale in [k for k, (expires, _) in _cache.items() if expires <= now]:
+            del _cache[stale]
+        if len(_cache) >= MAX_CACHE_ENTRIES:
+            del _cache[next(iter(_cache))]  # oldest insertion
+    _cache[key] = (now + CACHE_TTL_S, report)
+
+def format_weather(data: dict) -> str:
+    location_name = data["location"]["name"]
+    temperature = data["current"]["temp_c"]
+    condition = data["current"]["condition"]["text"]
+    humidity = data["current"]["humidity"]
+    wind_speed = data["current"]["wind_kph"]
+
+    return (
+        f"Weather in {location_name}:\n"
+        f" - Temperature: {temperature}°C\n"
+        f" - Condition: {condition}\n"
+        f" - Humidity: {humidity}%\n"
+        f" - Wind Speed: {wind_speed} km/h"
+    )
+
+async def _fetch_weather(location: str, key: str) -> str:
+    """One upstream request; only successful reports are cached"""
+    params = {
+        "key": WEATHER_API_KEY,
+        "q": location,
+        "aqi": "no"
+        }
+    response = await http_client().get(WEATHER_API_URL, params=params)
+    if response.is_client_error:
+        # weatherapi answers unknown locations with a 400 and an error body
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if isinstance(data, dict) and "error" in data:
+            raise WeatherLookupError(data["error"].get("message", "Unknown error"))
+    response.raise_for_status()  # Raise an error for bad responses
+    data = response.json()
+
+    if "error" in data:
+        raise WeatherLookupError(data["error"].get("message", "Unknown error"))
+
+    report = format_weather(data)
+    _remember(key, report)
+    return report
+
+async def weather_report(location: str) -> str:
+    """Cached report for a location; raises httpx.HTTPError or WeatherLookupError"""
+    key = _cache_key(location)
+    cached = _cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_weather(location, key))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    # A caller that gives up must not cancel the request others are waiting on
+    return await asyncio.shield(future)
+
+def _http_failure(error: httpx.HTTPError) -> str:
+    """What went wrong, for the model; never str(error), whose request URL carries the API key"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"Failed to fetch weather data: HTTP {error.response.status_code} {error.response.reason_phrase}"
+    message = str(error).replace(WEATHER_API_KEY, "***") if WEATHER_API_KEY else str(error)
+    return f"Failed to fetch weather data: {type(error).__name__}{': ' + message if message else ''}"
 
 @mcp.tool()
 async def get_weather(location: str) -> str:
     """Get real-time weather for a given location."""
     if not WEATHER_API_KEY:
         raise ValueError("WEATHER_API_KEY is not set in the environment variables.")
-    
+
     try:
-        url = f"http://api.weatherapi.com/v1/current.json"
-        params = {
-            "key": WEATHER_API_KEY, 
-            "q": location, 
-            "aqi": "no"
-            }
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Raise an error for bad responses
-        data = response.json()
-
-        if "error" in data:
-            message = data["error"].get("message", "Unknown error")
-            return f"Could not fetch weather for '{location}': {message}"
-        
-        location_name = data["location"]["name"]
-        temperature = data["current"]["temp_c"]
-        condition = data["current"]["condition"]["text"]
-        humidity = data["current"]["humidity"]
-        wind_speed = data["current"]["wind_kph"]
-
-        return (
-            f"Weather in {location_name}:\n"
-            f" - Temperature: {temperature}°C\n"
-            f" - Condition: {condition}\n"
-            f" - Humidity: {humidity}%\n"
-            f" - Wind Speed: {wind_speed} km/h"
-        )
+        return await weather_report(location)
+    except WeatherLookupError as e:
+        return f"Could not fetch weather for '{location}': {e}"
+    except httpx.HTTPError as e:
+        return _http_failure(e)
+
+@mcp.tool()
+async def get_weather_batch(locations: List[str]) -> Dict[str, Dict[str, str]]:
+    """Get real-time weather for several locations at once. Returns reports and errors keyed by location."""
+    if not WEATHER_API_KEY:
+        raise ValueError("WEATHER_API_KEY is not set in the environment variables.")
+    if len(locations) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} locations per batch.")
+
+    # Cap upstream concurrency; cached and duplicate locations cost nothing extra
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(location: str) -> str:
+        async with semaphore:
+            return await weather_report(location)
+
+    unique = list(dict.fromkeys(locations))
+    outcomes = await asyncio.gather(*(one(location) for location in unique), return_exceptions=True)
 
-    except requests.RequestException as e:
-        return f"Failed to fetch weather data: {str(e)}"
+    results: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    for location, outcome in zip(unique, outcomes):
+        if isinstance(outcome, WeatherLookupError):
+            errors[location] = f"Could not fetch weather for '{location}': {outcome}"
+        elif isinstance(outcome, httpx.HTTPError):
+            errors[location] = _http_failure(outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results[location] = outcome
+    return {"results": results, "errors": errors}
 
 
 if __name__ == "__main__":